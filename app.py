@@ -1,81 +1,29 @@
 import streamlit as st
-import sqlite3
 import os
 from datetime import datetime
 from openai import OpenAI
 from dotenv import load_dotenv
 import json
 import time # Added for loading UI
-
-# Load environment variables
-load_dotenv()
-
-# Prefer Streamlit Secrets (TOML) when available
-try:
-    # Support both flat keys and nested [openai] table in secrets.toml
-    if hasattr(st, "secrets"):
-        # Flat keys
-        if "OPENAI_API_KEY" in st.secrets:
-            os.environ["OPENAI_API_KEY"] = str(st.secrets["OPENAI_API_KEY"])
-        if "OPENAI_MODEL" in st.secrets:
-            os.environ["OPENAI_MODEL"] = str(st.secrets["OPENAI_MODEL"])
-        if "DATABASE_URL" in st.secrets:
-            os.environ["DATABASE_URL"] = str(st.secrets["DATABASE_URL"])
-        if "APP_TITLE" in st.secrets:
-            os.environ["APP_TITLE"] = str(st.secrets["APP_TITLE"])
-        if "APP_VERSION" in st.secrets:
-            os.environ["APP_VERSION"] = str(st.secrets["APP_VERSION"])
-
-        # Nested table: [openai]
-        if "openai" in st.secrets:
-            openai_section = st.secrets["openai"]
-            if "api_key" in openai_section and not os.getenv("OPENAI_API_KEY"):
-                os.environ["OPENAI_API_KEY"] = str(openai_section["api_key"])
-            if "model" in openai_section and not os.getenv("OPENAI_MODEL"):
-                os.environ["OPENAI_MODEL"] = str(openai_section["model"])
-        # Nested table: [database]
-        if "database" in st.secrets:
-            database_section = st.secrets["database"]
-            if "url" in database_section and not os.getenv("DATABASE_URL"):
-                os.environ["DATABASE_URL"] = str(database_section["url"])
-        # Nested table: [app]
-        if "app" in st.secrets:
-            app_section = st.secrets["app"]
-            if "title" in app_section and not os.getenv("APP_TITLE"):
-                os.environ["APP_TITLE"] = str(app_section["title"])
-            if "version" in app_section and not os.getenv("APP_VERSION"):
-                os.environ["APP_VERSION"] = str(app_section["version"])
-except Exception:
-    # Fall back silently to .env if secrets are not configured
-    pass
-
-# App config from env (with defaults)
-APP_TITLE = os.getenv("APP_TITLE", "Asisten Medis Stunting Indonesia")
-APP_VERSION = os.getenv("APP_VERSION", "")
-
-# Database URL handling (supports sqlite URLs)
-def get_database_path_from_env():
-    """Resolve SQLite database file path from DATABASE_URL env.
-
-    Supported forms:
-    - sqlite:///relative/path.db
-    - sqlite:////absolute/path.db
-    - stunting_assistant.db (fallback when scheme unsupported)
-    """
-    database_url = os.getenv("DATABASE_URL", "sqlite:///stunting_assistant.db")
-
-    if database_url.startswith("sqlite:////"):
-        path = database_url[len("sqlite:////"):]
-        return "/" + path if not path.startswith("/") else path
-    if database_url.startswith("sqlite:///"):
-        path = database_url[len("sqlite:///"):]
-        return path if path else "stunting_assistant.db"
-    # Fallback: if user supplied a plain filename, respect it; otherwise default
-    if database_url.endswith(".db") and "://" not in database_url:
-        return database_url
-    return "stunting_assistant.db"
-
-DB_PATH = get_database_path_from_env()
+from db import get_database, resolve_database_target
+from env_config import env_flag
+from chat_writer import get_chat_writer
+from chat_archive import archive_old_chats, fetch_archived_page, get_archive_stats, start_archive_scheduler
+from chat_responses import get_response_store_stats, response_sql
+from chat_schema import format_timestamp, new_conversation_id
+from chat_search import search_chat_history
+from migrations import apply_migrations, ensure_schema, forget_schema
+from auth_utils import register_user, submit_authentication
+from password_hashing import get_password_hasher
+from response_cache import ResponseCache, make_cache_key, RESPONSE_CACHE_ENABLED
+from singleflight import SingleFlight
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from query_router import ROUTER_ENABLED, route_question, format_knowledge_answer, get_router_stats
+from knowledge_retrieval import RETRIEVAL_ENABLED, clear_passage_indexes, get_context_for_question, get_passage_index
+from knowledge_pack import get_knowledge_base, get_knowledge_version, reload_packs
+from knowledge_fts import clear_knowledge_fts
+import openai
+import textwrap
 
 # Clean up potentially problematic environment variables
 def clean_environment():
@@ -94,14 +42,77 @@ def clean_environment():
     if cleaned_vars:
         print(f"🧹 Cleaned up proxy environment variables: {cleaned_vars}")
 
-# Clean environment before creating client
-clean_environment()
+@st.cache_resource(show_spinner=False)
+def configure_environment():
+    """Load .env and Streamlit secrets into os.environ and drop proxy variables (once per process)"""
+    # Load environment variables
+    load_dotenv()
+    
+    # Prefer Streamlit Secrets (TOML) when available
+    try:
+        # Support both flat keys and nested [openai] table in secrets.toml
+        # (load_if_toml_exists avoids the st.error a missing file would draw before set_page_config)
+        if hasattr(st, "secrets") and st.secrets.load_if_toml_exists():
+            # Flat keys
+            if "OPENAI_API_KEY" in st.secrets:
+                os.environ["OPENAI_API_KEY"] = str(st.secrets["OPENAI_API_KEY"])
+            if "OPENAI_MODEL" in st.secrets:
+                os.environ["OPENAI_MODEL"] = str(st.secrets["OPENAI_MODEL"])
+            if "OPENAI_BASE_URL" in st.secrets:
+                os.environ["OPENAI_BASE_URL"] = str(st.secrets["OPENAI_BASE_URL"])
+            if "DATABASE_URL" in st.secrets:
+                os.environ["DATABASE_URL"] = str(st.secrets["DATABASE_URL"])
+            if "APP_TITLE" in st.secrets:
+                os.environ["APP_TITLE"] = str(st.secrets["APP_TITLE"])
+            if "APP_VERSION" in st.secrets:
+                os.environ["APP_VERSION"] = str(st.secrets["APP_VERSION"])
+
+            # Nested table: [openai]
+            if "openai" in st.secrets:
+                openai_section = st.secrets["openai"]
+                if "api_key" in openai_section and not os.getenv("OPENAI_API_KEY"):
+                    os.environ["OPENAI_API_KEY"] = str(openai_section["api_key"])
+                if "model" in openai_section and not os.getenv("OPENAI_MODEL"):
+                    os.environ["OPENAI_MODEL"] = str(openai_section["model"])
+                if "base_url" in openai_section and not os.getenv("OPENAI_BASE_URL"):
+                    os.environ["OPENAI_BASE_URL"] = str(openai_section["base_url"])
+            # Nested table: [database]
+            if "database" in st.secrets:
+                database_section = st.secrets["database"]
+                if "url" in database_section and not os.getenv("DATABASE_URL"):
+                    os.environ["DATABASE_URL"] = str(database_section["url"])
+            # Nested table: [app]
+            if "app" in st.secrets:
+                app_section = st.secrets["app"]
+                if "title" in app_section and not os.getenv("APP_TITLE"):
+                    os.environ["APP_TITLE"] = str(app_section["title"])
+                if "version" in app_section and not os.getenv("APP_VERSION"):
+                    os.environ["APP_VERSION"] = str(app_section["version"])
+    except Exception:
+        # Fall back silently to .env if secrets are not configured
+        pass
+    
+    # Clean environment before creating client
+    clean_environment()
+    
+    # Check for remaining proxy-related environment variables
+    proxy_vars = [var for var in os.environ if 'proxy' in var.lower() or 'PROXY' in var]
+    if proxy_vars:
+        print(f"⚠️  Remaining proxy-related environment variables: {proxy_vars}")
+        print("These might cause OpenAI client initialization issues")
+    return True
 
-# Check for remaining proxy-related environment variables
-proxy_vars = [var for var in os.environ if 'proxy' in var.lower() or 'PROXY' in var]
-if proxy_vars:
-    print(f"⚠️  Remaining proxy-related environment variables: {proxy_vars}")
-    print("These might cause OpenAI client initialization issues")
+configure_environment()
+
+# App config from env (with defaults)
+APP_TITLE = os.getenv("APP_TITLE", "Asisten Medis Stunting Indonesia")
+APP_VERSION = os.getenv("APP_VERSION", "")
+
+# Database from DATABASE_URL: a SQLite file path, or a postgresql:// URL for multi-node deployments
+DB_PATH = resolve_database_target()
+
+# Rows per "load older messages" page
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "10"))
 
 # Configure OpenAI with multiple fallback methods
 def create_openai_client():
@@ -112,11 +123,16 @@ def create_openai_client():
         print("No valid OpenAI API key found")
         return None, 'gpt-4o'
     
+    # Optional OpenAI-compatible endpoint (e.g. openai_stub_server.py for offline benchmarks)
+    base_url = os.getenv('OPENAI_BASE_URL') or None
+    
     print(f"Attempting to create OpenAI client with API key: {api_key[:10]}...")
+    if base_url:
+        print(f"Using OpenAI base URL: {base_url}")
     
     # Method 1: Standard initialization
     try:
-        client = OpenAI(api_key=api_key)
+        client = OpenAI(api_key=api_key, base_url=base_url)
         print("✅ OpenAI client created successfully")
         return client, os.getenv('OPENAI_MODEL', 'gpt-4o')
     except Exception as e:
@@ -144,7 +160,7 @@ def create_openai_client():
     
     # Method 4: Try with explicit None for problematic parameters
     try:
-        client = OpenAI(api_key=api_key, base_url=None, http_client=None)
+        client = OpenAI(api_key=api_key, base_url=base_url, http_client=None)
         print("✅ OpenAI client created with explicit None parameters")
         return client, os.getenv('OPENAI_MODEL', 'gpt-4o')
     except Exception as e:
@@ -159,7 +175,7 @@ def create_openai_client():
             verify=True,
             timeout=30.0
         )
-        client = OpenAI(api_key=api_key, http_client=http_client)
+        client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
         print("✅ OpenAI client created with explicit HTTP client")
         return client, os.getenv('OPENAI_MODEL', 'gpt-4o')
     except Exception as e:
@@ -170,7 +186,7 @@ def create_openai_client():
     try:
         import httpx
         http_client = httpx.Client()
-        client = OpenAI(api_key=api_key, http_client=http_client)
+        client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
         print("✅ OpenAI client created with minimal httpx client")
         return client, os.getenv('OPENAI_MODEL', 'gpt-4o')
     except Exception as e:
@@ -180,8 +196,71 @@ def create_openai_client():
     print("❌ All OpenAI client creation methods failed")
     return None, 'gpt-4o'
 
-# Initialize OpenAI client
-client, OPENAI_MODEL = create_openai_client()
+# Per-attempt timeout in seconds; retries are handled by the circuit breaker, so
+# the client itself must not retry (otherwise a hung upstream costs 3x the timeout)
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "20"))
+
+# Process-wide resources. Streamlit re-executes this script on every interaction,
+# so anything built here must come from st.cache_resource to survive the rerun.
+@st.cache_resource(show_spinner=False)
+def get_openai_client():
+    """Create the OpenAI client once per process; returns (client, model)"""
+    client, model = create_openai_client()
+    if client:
+        client = client.with_options(max_retries=0, timeout=OPENAI_TIMEOUT)
+    return client, model
+
+@st.cache_resource(show_spinner=False)
+def get_app_database():
+    """Connection manager for the app database"""
+    return get_database(DB_PATH)
+
+@st.cache_resource(show_spinner=False)
+def get_app_chat_writer():
+    """Write-behind queue for chat history (group commits off the script thread)"""
+    return get_chat_writer(DB_PATH)
+
+@st.cache_resource(show_spinner=False)
+def get_archive_scheduler():
+    """Background job moving old chat history into the compressed archive (None when disabled)
+
+    Started by main() once the schema is in place, never at import: tools
+    and tests import this module without migrating or archiving anything.
+    """
+    return start_archive_scheduler(DB_PATH)
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache():
+    """Two-tier (in-process LRU + SQLite) cache for repeated questions"""
+    return ResponseCache(DB_PATH)
+
+@st.cache_resource(show_spinner=False)
+def get_llm_flight():
+    """Coalesces identical in-flight OpenAI calls across sessions"""
+    return SingleFlight()
+
+@st.cache_resource(show_spinner=False)
+def get_openai_breaker():
+    """Trips when OpenAI is degraded so users get local knowledge answers immediately"""
+    return CircuitBreaker("openai")
+
+@st.cache_resource(show_spinner=False)
+def load_knowledge():
+    """Load the knowledge packs and build the retrieval indexes; returns a summary"""
+    summary = {"version": get_knowledge_version(), "loaded_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    for language in ("indonesian", "english"):
+        summary[language] = {"topics": len(get_knowledge_base(language))}
+        if RETRIEVAL_ENABLED:
+            summary[language]["passages"] = len(get_passage_index(language)["passages"])
+    return summary
+
+client, OPENAI_MODEL = get_openai_client()
+database = get_app_database()
+chat_writer = get_app_chat_writer()
+response_cache = get_response_cache()
+llm_flight = get_llm_flight()
+openai_breaker = get_openai_breaker()
+load_knowledge()
 
 # Page configuration
 st.set_page_config(
@@ -206,207 +285,92 @@ if 'show_register' not in st.session_state:
 # Database functions
 def init_db():
     """Initialize the database with tables for users and chat history"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Create users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            email TEXT,
-            name TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create chat_history table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL,
-            message TEXT NOT NULL,
-            response TEXT NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (username) REFERENCES users (username)
-        )
-    ''')
-    
-    # Check if we need to migrate existing data
-    migrate_database(cursor)
-    ensure_demo_user() # Ensure demo user is created
-    
-    conn.commit()
-    conn.close()
-
-def migrate_database(cursor):
-    """Migrate existing database to new schema if needed"""
-    try:
-        # Check if users table exists and has the right columns
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        # Add missing columns if they don't exist
-        if 'name' not in columns:
-            cursor.execute("ALTER TABLE users ADD COLUMN name TEXT")
-            print("Added 'name' column to users table")
-        
-        if 'email' not in columns:
-            cursor.execute("ALTER TABLE users ADD COLUMN email TEXT")
-            print("Added 'email' column to users table")
-        
-        if 'created_at' not in columns:
-            cursor.execute("ALTER TABLE users ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-            print("Added 'created_at' column to users table")
-        
-        # Check if chat_history table exists and has the right columns
-        cursor.execute("PRAGMA table_info(chat_history)")
-        chat_columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'timestamp' not in chat_columns:
-            cursor.execute("ALTER TABLE chat_history ADD COLUMN timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-            print("Added 'timestamp' column to chat_history table")
-            
-    except Exception as e:
-        print(f"Migration warning: {e}")
-        # If migration fails, we'll continue with the existing structure
-
-def ensure_demo_user():
-    """Ensure demo user exists with all required fields"""
-    try:
-        from auth_utils import create_demo_user
-        success, message = create_demo_user()
-        if success:
-            print("Demo user created successfully")
-        else:
-            print(f"Demo user status: {message}")
-    except Exception as e:
-        print(f"Demo user creation warning: {e}")
+    # Applies only the migrations this database's user_version has not seen yet
+    apply_migrations(database)
 
 def reset_database():
     """Reset the database completely - use with caution!"""
     try:
         import os
-        if os.path.exists(DB_PATH):
-            os.remove(DB_PATH)
-            print("Database reset successfully")
+        # Queued chats and pooled connections must be settled before the file goes away
+        chat_writer.flush()
+        if database.backend == "postgres":
+            with database.transaction() as conn:
+                conn.execute("DROP TABLE IF EXISTS chat_messages, chat_messages_archive, chat_responses, users, response_cache, schema_version CASCADE")
+        else:
+            database.close_all()
+            for path in (DB_PATH, DB_PATH + "-wal", DB_PATH + "-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+        print("Database reset successfully")
+        forget_schema(database)
         init_db()
+        # The in-process tier still holds answers from before the reset
+        response_cache.clear()
+        # The shared FTS index would skip re-syncing into the new, empty tables
+        clear_knowledge_fts()
         return True
     except Exception as e:
         print(f"Database reset failed: {e}")
         return False
 
-def save_chat(username, message, response):
-    """Save chat message and response to database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO chat_history (username, message, response)
-        VALUES (?, ?, ?)
-    ''', (username, message, response))
-    conn.commit()
-    conn.close()
+def save_chat(username, message, response, conversation_id=None):
+    """Save chat message and response to database (queued for the background writer)"""
+    chat_writer.save(username, message, response, conversation_id)
 
 def get_chat_history(username):
     """Retrieve chat history for a user"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT message, response, timestamp FROM chat_history 
-        WHERE username = ? ORDER BY timestamp DESC LIMIT 50
-    ''', (username,))
-    history = cursor.fetchall()
-    conn.close()
-    return history
-
-# Stunting knowledge base
-STUNTING_KNOWLEDGE = {
-    "what_is_stunting": """
-    Stunting is a condition where a child's height is significantly below the average for their age. 
-    It's a form of malnutrition that affects physical and cognitive development.
-    
-    Key points:
-    - Height-for-age below -2 standard deviations from WHO growth standards
-    - Usually occurs in the first 1000 days of life (conception to age 2)
-    - Can have long-term effects on health, education, and economic productivity
-    """,
-    
-    "causes": """
-    Stunting can be caused by several factors:
-    
-    1. **Nutritional factors:**
-       - Inadequate protein and micronutrient intake
-       - Poor breastfeeding practices
-       - Insufficient complementary feeding
-    
-    2. **Environmental factors:**
-       - Poor sanitation and hygiene
-       - Frequent infections and diseases
-       - Limited access to clean water
-    
-    3. **Maternal factors:**
-       - Poor maternal nutrition during pregnancy
-       - Teenage pregnancy
-       - Short birth intervals
-    """,
-    
-    "prevention": """
-    Preventing stunting requires a comprehensive approach:
-    
-    **During pregnancy:**
-    - Adequate maternal nutrition
-    - Regular prenatal care
-    - Iron and folic acid supplementation
-    
-    **After birth:**
-    - Exclusive breastfeeding for first 6 months
-    - Timely introduction of complementary foods
-    - Adequate protein and micronutrient intake
-    - Regular growth monitoring
-    - Good hygiene practices
-    
-    **Community level:**
-    - Access to clean water and sanitation
-    - Health education programs
-    - Poverty reduction initiatives
-    """,
-    
-    "treatment": """
-    Treatment for stunting involves:
-    
-    1. **Nutritional rehabilitation:**
-       - High-protein, high-calorie diet
-       - Micronutrient supplementation
-       - Therapeutic feeding programs
-    
-    2. **Medical care:**
-       - Treatment of underlying infections
-       - Management of complications
-       - Regular health monitoring
-    
-    3. **Long-term support:**
-       - Continued nutritional support
-       - Developmental monitoring
-       - Family education and counseling
-    
-    Note: Early intervention is crucial for better outcomes.
+    rows, _ = get_chat_history_page(username, page_size=50)
+    return rows
+
+def get_chat_history_page(username, cursor=None, page_size=CHAT_HISTORY_PAGE_SIZE, direction="older"):
+    """Retrieve one page of a user's chat history with keyset pagination
+
+    cursor is the (created_at, id) of the last row already seen (None starts
+    from the newest row). direction "older" returns rows newest first,
+    "newer" oldest first. Returns (rows, next_cursor); next_cursor is None on
+    the last page. Each page is an index range scan on
+    idx_chat_messages_user_time, so its cost does not grow with the table.
+    Rows moved to the archive are read from its matching index and merged in.
     """
-}
+    # Read-your-writes: commit anything still queued first
+    chat_writer.flush()
+    if direction == "older":
+        comparison, order = "<", "DESC"
+    else:
+        comparison, order = ">", "ASC"
+    sql = f'''
+        SELECT id, message, {response_sql("chat_messages")}, created_at FROM chat_messages
+        WHERE user_id = (SELECT id FROM users WHERE username = ?)
+        {f"AND (created_at, id) {comparison} (?, ?)" if cursor else ""}
+        ORDER BY created_at {order}, id {order} LIMIT ?
+    '''
+    params = (username, *cursor) if cursor else (username,)
+    # One extra row tells us whether another page exists
+    rows = database.fetchall(sql, params + (page_size + 1,))
+    rows += fetch_archived_page(database, username, cursor, page_size + 1, direction)
+    rows.sort(key=lambda row: (row[3], row[0]), reverse=direction == "older")
+    page = rows[:page_size]
+    next_cursor = (page[-1][3], page[-1][0]) if len(rows) > page_size else None
+    return [(message, response, format_timestamp(created_at)) for _, message, response, created_at in page], next_cursor
 
-def get_stunting_response(user_message):
-    """Get response from GPT-5 for stunting-related questions"""
-    
-    # Use GPT-5 as the primary and only knowledge source for dynamic responses
-    try:
-        if client and os.getenv('OPENAI_API_KEY') and os.getenv('OPENAI_API_KEY') != 'your_openai_api_key_here':
-            # Detect language for better AI response
-            try:
-                from stunting_knowledge_id import detect_indonesian
-                is_indonesian = detect_indonesian(user_message)
-                
-                if is_indonesian:
-                    system_prompt = """Anda adalah Asisten Medis Stunting Indonesia yang sangat ramah dan menarik. Fokuskan pengetahuan Anda khusus pada stunting di Indonesia.
+def get_history_anchor(username):
+    """Cursor just above the user's newest row, so "load older" skips rows saved later in the session"""
+    chat_writer.flush()
+    rows = [database.fetchone(f'''
+        SELECT created_at, id FROM {table} WHERE user_id = (SELECT id FROM users WHERE username = ?)
+        ORDER BY created_at DESC, id DESC LIMIT 1
+    ''', (username,)) for table in ("chat_messages", "chat_messages_archive")]
+    row = max((row for row in rows if row), default=None)
+    return (row[0], row[1] + 1) if row else None
+
+def search_history(username, query, page=0):
+    """Full-text search over the user's own chat history; returns (results, has_more)"""
+    # Read-your-writes: the FTS triggers index rows as the writer commits them
+    chat_writer.flush()
+    return search_chat_history(username, query, page, database=database)
+
+SYSTEM_PROMPT_ID = """Anda adalah Asisten Medis Stunting Indonesia yang sangat ramah dan menarik. Fokuskan pengetahuan Anda khusus pada stunting di Indonesia.
 
 Fitur Utama:
 - Berikan informasi yang akurat dan terkini tentang stunting di Indonesia
@@ -424,8 +388,8 @@ Topik Utama (Fokus Indonesia):
 4. **DAMPAK**: Efek stunting pada anak, keluarga, dan masyarakat Indonesia
 
 Buat respons yang engaging, conversational, dan penuh dengan informasi spesifik Indonesia!"""
-                else:
-                    system_prompt = """You are a Stunting Medical Assistant specializing in Indonesia that is extremely friendly and engaging. Focus your knowledge specifically on stunting in Indonesia.
+
+SYSTEM_PROMPT_EN = """You are a Stunting Medical Assistant specializing in Indonesia that is extremely friendly and engaging. Focus your knowledge specifically on stunting in Indonesia.
 
 Main Features:
 - Provide accurate and up-to-date information about stunting in Indonesia
@@ -443,114 +407,230 @@ Main Topics (Indonesia Focus):
 4. **IMPACT**: Effects of stunting on children, families, and Indonesian society
 
 Make your responses engaging, conversational, and full of Indonesia-specific information!"""
-                
-                # Show loading UI for OpenAI API call
-                with st.spinner("🤖 Sedang memproses dengan GPT-5..." if is_indonesian else "🤖 Processing with GPT-5..."):
-                    # Add progress bar
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    # Simulate progress steps
-                    steps = [
-                        "🔍 Menganalisis pertanyaan..." if is_indonesian else "🔍 Analyzing question...",
-                        "🧠 Mengakses pengetahuan GPT-5..." if is_indonesian else "🧠 Accessing GPT-5 knowledge...",
-                        "🇮🇩 Mencari informasi Indonesia..." if is_indonesian else "🇮🇩 Searching Indonesia information...",
-                        "✍️ Menyusun respons..." if is_indonesian else "✍️ Composing response...",
-                        "✨ Menyempurnakan jawaban..." if is_indonesian else "✨ Finalizing answer..."
-                    ]
-                    
-                    for i, step in enumerate(steps):
-                        progress_bar.progress((i + 1) / len(steps))
-                        status_text.text(step)
-                        time.sleep(0.3)  # Small delay for visual effect
-                    
-                    # Use GPT-5 for dynamic, Indonesia-focused responses
-                    response = client.chat.completions.create(
-                        model=OPENAI_MODEL,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_message}
-                        ],
-                        max_tokens=1000,  # Increased for more detailed Indonesia-specific responses
-                        temperature=0.9,  # Higher for more creative and varied responses
-                        presence_penalty=0.1,  # Encourage more varied responses
-                        frequency_penalty=0.1   # Reduce repetition
-                    )
-                    
-                    # Complete progress bar
-                    progress_bar.progress(1.0)
-                    status_text.text("✅ Selesai!" if is_indonesian else "✅ Complete!")
-                    time.sleep(0.5)  # Show completion briefly
-                    
-                    return response.choices[0].message.content
-                    
-            except ImportError:
-                # Fallback to English if Indonesian detection not available
-                system_prompt = """You are a Stunting Medical Assistant specializing in Indonesia that is extremely friendly and engaging. Focus your knowledge specifically on stunting in Indonesia.
 
-Main Features:
-- Provide accurate and up-to-date information about stunting in Indonesia
-- Include current data and statistics about stunting in Indonesia
-- Give examples and cases relevant to Indonesian context
-- Focus on 4 main topics: STUNTING, PREVENTION, SOLUTIONS, and IMPACT in Indonesia
-- Use engaging and conversational English
-- Provide practical tips that can be implemented in Indonesia
-- Include information about Indonesian government programs related to stunting
+# Distinct questions whose grounded system prompt is kept in st.cache_data
+SYSTEM_PROMPT_CACHE_SIZE = int(os.getenv("SYSTEM_PROMPT_CACHE_SIZE", "512"))
 
-Main Topics (Indonesia Focus):
-1. **STUNTING**: Definition, characteristics, and prevalence in Indonesia
-2. **PREVENTION**: Effective prevention strategies in Indonesia
-3. **SOLUTIONS**: Available treatment and interventions in Indonesia
-4. **IMPACT**: Effects of stunting on children, families, and Indonesian society
+@st.cache_data(show_spinner=False, max_entries=SYSTEM_PROMPT_CACHE_SIZE)
+def build_system_prompt(user_message, language):
+    """System prompt for a language, grounded in the passages most relevant to the question"""
+    system_prompt = SYSTEM_PROMPT_ID if language == 'indonesian' else SYSTEM_PROMPT_EN
+    
+    # Ground the answer in the most relevant curated passages
+    if RETRIEVAL_ENABLED:
+        try:
+            context = get_context_for_question(user_message, language)
+            if context:
+                system_prompt = f"{system_prompt}\n\n{context}"
+        except Exception as e:
+            print(f"Retrieval warning: {e}")
+    return system_prompt
 
-Make your responses engaging, conversational, and full of Indonesia-specific information!"""
-                
-                # Show loading UI for OpenAI API call
-                with st.spinner("🤖 Processing with GPT-5..."):
-                    # Add progress bar
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    # Simulate progress steps
-                    steps = [
-                        "🔍 Analyzing question...",
-                        "🧠 Accessing GPT-5 knowledge...",
-                        "🇮🇩 Searching Indonesia information...",
-                        "✍️ Composing response...",
-                        "✨ Finalizing answer..."
-                    ]
-                    
-                    for i, step in enumerate(steps):
-                        progress_bar.progress((i + 1) / len(steps))
-                        status_text.text(step)
-                        time.sleep(0.3)  # Small delay for visual effect
-                    
-                    response = client.chat.completions.create(
-                        model=OPENAI_MODEL,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_message}
-                        ],
-                        max_tokens=1000,
-                        temperature=0.9,
-                        presence_penalty=0.1,
-                        frequency_penalty=0.1
-                    )
-                    
-                    # Complete progress bar
-                    progress_bar.progress(1.0)
-                    status_text.text("✅ Complete!")
-                    time.sleep(0.5)  # Show completion briefly
-                    
-                    return response.choices[0].message.content
+def clear_knowledge_caches():
+    """Reload the knowledge packs, rebuild the retrieval and FTS indexes and drop prompts grounded in the old ones"""
+    reload_packs()
+    clear_passage_indexes()
+    clear_knowledge_fts()
+    load_knowledge.clear()
+    build_system_prompt.clear()
+
+def clear_database_resources():
+    """Flush queued chats and reopen every pooled connection on next use"""
+    chat_writer.flush()
+    database.close_all()
+
+# Invalidation hooks for the admin panel: name -> (what is cached, clear function)
+CACHED_RESOURCES = {
+    "openai_client": ("OpenAI client (re-reads OPENAI_* settings)", get_openai_client.clear),
+    "database": ("SQLite connection pool", clear_database_resources),
+    "response_cache": ("Response cache, both tiers", lambda: response_cache.clear()),
+    "llm_flight": ("In-flight OpenAI call coalescing", get_llm_flight.clear),
+    "openai_breaker": ("OpenAI circuit breaker state", get_openai_breaker.clear),
+    "knowledge": ("Knowledge packs, retrieval indexes, system prompts", clear_knowledge_caches),
+}
+
+def clear_cached_resource(name):
+    """Run the invalidation hook for one entry of CACHED_RESOURCES (or "all")"""
+    names = list(CACHED_RESOURCES) if name == "all" else [name]
+    for resource in names:
+        CACHED_RESOURCES[resource][1]()
+    print(f"🧹 Cleared cached resources: {names}")
+
+def get_cached_resource_summary():
+    """What each process-wide resource currently holds, for the admin panel"""
+    return {
+        "openai_client": {"configured": client is not None, "model": OPENAI_MODEL},
+        "database": database.get_stats(),
+        "response_cache": response_cache.get_stats(),
+        "llm_flight": llm_flight.get_stats(),
+        "openai_breaker": openai_breaker.get_stats(),
+        "knowledge": load_knowledge(),
+        "system_prompts": {"max_entries": SYSTEM_PROMPT_CACHE_SIZE},
+    }
+
+# Streaming config: write tokens into the chat bubble as they arrive
+OPENAI_STREAM = env_flag("OPENAI_STREAM")
+# Minimum seconds between placeholder redraws while streaming (keeps websocket traffic low on slow links)
+STREAM_RENDER_INTERVAL = float(os.getenv("STREAM_RENDER_INTERVAL", "0.05"))
+# Answer length cap; grounded answers quote the retrieved passages instead of inventing detail
+OPENAI_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "700"))
+
+def create_chat_completion(messages, stream=False):
+    """Call the OpenAI chat completions endpoint with the app's generation settings"""
+    return client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=messages,
+        max_tokens=OPENAI_MAX_TOKENS,
+        temperature=0.9,  # Higher for more creative and varied responses
+        presence_penalty=0.1,  # Encourage more varied responses
+        frequency_penalty=0.1,  # Reduce repetition
+        stream=stream
+    )
+
+def is_retryable_openai_error(error):
+    """Timeouts, connection errors, rate limits and 5xx responses are worth retrying"""
+    return isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
+
+def open_chat_stream(messages):
+    """Start a streaming completion and wait for its first content token"""
+    stream = iter(create_chat_completion(messages, stream=True))
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            return chunk.choices[0].delta.content, stream
+    return "", stream
+
+def stream_chat_completion(messages, response_placeholder, on_partial=None):
+    """Stream completion tokens into the placeholder and return the complete text
+
+    on_partial, when given, receives the accumulated text on every redraw so
+    coalesced followers can render the same stream.
+    """
+    start = time.monotonic()
+    # Opening the stream goes through the breaker: retrying is safe until
+    # something is on screen. The call's one outcome is recorded when the
+    # stream ends, with TTFT as its latency since that is what users feel
+    first_token, stream = openai_breaker.call(lambda: open_chat_stream(messages), is_retryable=is_retryable_openai_error,
+                                              defer_success=True)
+    first_token_latency = time.monotonic() - start
+    failed = False
+    
+    try:
+        chunks = [first_token]
+        response_placeholder.markdown(first_token + "▌")
+        if on_partial is not None:
+            on_partial(first_token)
+        last_render = time.monotonic()
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            chunks.append(delta)
+            now = time.monotonic()
+            if now - last_render >= STREAM_RENDER_INTERVAL:
+                partial_response = "".join(chunks)
+                response_placeholder.markdown(partial_response + "▌")
+                if on_partial is not None:
+                    on_partial(partial_response)
+                last_render = now
+    except Exception:
+        # A stream that dies midway counts against the upstream
+        failed = True
+        raise
+    finally:
+        # Also on a rerun interrupting the script, so a half-open probe is never left claimed
+        if failed:
+            openai_breaker.record_failure(time.monotonic() - start)
+        else:
+            openai_breaker.record_success(first_token_latency)
+
+    full_response = "".join(chunks)
+    response_placeholder.markdown(full_response)
+    return full_response
+
+def get_knowledge_fallback(user_message):
+    """Answer from the local stunting knowledge base when OpenAI is unavailable"""
+    try:
+        from stunting_knowledge import get_knowledge_response
+        return textwrap.dedent(get_knowledge_response(user_message)).strip()
+    except ImportError:
+        return get_indonesia_focused_guidance()
+
+def get_stunting_response(user_message, response_placeholder=None):
+    """Get response from GPT-5 for stunting-related questions
+
+    When a placeholder is given and streaming is enabled, tokens are written
+    into it as they arrive. The complete text is always returned.
+    """
+    
+    # Answer clear-cut topic questions straight from the curated knowledge base
+    if ROUTER_ENABLED:
+        try:
+            decision = route_question(user_message)
+            if decision["route"] == "knowledge":
+                return format_knowledge_answer(decision["category"], decision["language"])
+        except Exception as e:
+            print(f"Router warning: {e}")
+    
+    # Use GPT-5 for ambiguous and open-ended questions
+    try:
+        if client and os.getenv('OPENAI_API_KEY') and os.getenv('OPENAI_API_KEY') != 'your_openai_api_key_here':
+            # Detect language for better AI response
+            try:
+                from stunting_knowledge_id import detect_indonesian
+                is_indonesian = detect_indonesian(user_message)
+            except ImportError:
+                # Fallback to English if Indonesian detection not available
+                is_indonesian = False
+            
+            language = 'indonesian' if is_indonesian else 'english'
+            system_prompt = build_system_prompt(user_message, language)
+            
+            # Serve repeated questions from the response cache
+            cache_key = make_cache_key(user_message, language, OPENAI_MODEL, system_prompt, get_knowledge_version())
+            if RESPONSE_CACHE_ENABLED:
+                cached_response = response_cache.get(cache_key)
+                if cached_response is not None:
+                    return cached_response
+            
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message}
+            ]
+            streaming = OPENAI_STREAM and response_placeholder is not None
+            
+            def call_openai(publish):
+                # Runs once per distinct question; concurrent askers wait on this call
+                if streaming:
+                    answer = stream_chat_completion(messages, response_placeholder, on_partial=publish)
+                else:
+                    # Non-streaming mode: show loading UI for the blocking OpenAI API call
+                    with st.spinner("🤖 Sedang memproses dengan GPT-5..." if is_indonesian else "🤖 Processing with GPT-5..."):
+                        response = openai_breaker.call(lambda: create_chat_completion(messages),
+                                                       is_retryable=is_retryable_openai_error)
+                        answer = response.choices[0].message.content
+                if RESPONSE_CACHE_ENABLED:
+                    response_cache.set(cache_key, answer, question=user_message, language=language, model=OPENAI_MODEL)
+                return answer
+            
+            def show_progress(partial_response):
+                # Followers render the leader's stream in their own chat bubble
+                response_placeholder.markdown(partial_response + "▌")
+            
+            answer, _ = llm_flight.do(cache_key, call_openai, on_progress=show_progress if streaming else None)
+            return answer
         else:
             # If no API key or client, provide enhanced guidance for Indonesia-focused experience
             return get_indonesia_focused_guidance()
             
+    except CircuitOpenError:
+        # OpenAI is degraded: answer immediately from local knowledge
+        return get_knowledge_fallback(user_message)
     except Exception as e:
         print("error: ", e)
-        # If GPT-5 fails, provide guidance for Indonesia-focused experience
-        return get_indonesia_focused_guidance()
+        # If GPT-5 fails after retries, answer from local knowledge
+        return get_knowledge_fallback(user_message)
 
 def get_indonesia_focused_guidance():
     """Provide guidance for Indonesia-focused stunting information when GPT-5 is unavailable"""
@@ -675,9 +755,11 @@ def main():
     # Initialize database
     if 'db_initialized' not in st.session_state:
         with st.spinner("🔧 Initializing system..."):
-            init_db()
+            # Migrated once per process; later sessions only hit the cached check
+            ensure_schema(database)
             st.session_state.db_initialized = True
             time.sleep(0.5)  # Brief delay for visual feedback
+    archive_scheduler = get_archive_scheduler()
     
     # Sidebar for authentication
     with st.sidebar:
@@ -697,10 +779,12 @@ def main():
                     if submit_button:
                         if username and password:
                             with st.spinner("🔐 Verifying credentials..."):
-                                from auth_utils import authenticate_user
-                                if authenticate_user(username, password):
+                                # bcrypt runs in the hashing pool; this thread only waits for the result
+                                success, user_name = submit_authentication(username, password).result()
+                                if success:
                                     st.session_state.authenticated = True
                                     st.session_state.username = username
+                                    st.session_state.user_name = user_name
                                     st.success("✅ Login berhasil!")
                                     time.sleep(1)  # Show success message briefly
                                     st.rerun()
@@ -730,6 +814,10 @@ def main():
                 with st.spinner("🚪 Logging out..."):
                     st.session_state.authenticated = False
                     st.session_state.username = None
+                    # The next login starts a fresh chat with its own history cursor
+                    st.session_state.pop("messages", None)
+                    st.session_state.pop("history_cursor", None)
+                    st.session_state.pop("conversation_id", None)
                     st.success("✅ Logout berhasil!")
                     time.sleep(1)  # Show success message briefly
                     st.rerun()
@@ -740,11 +828,62 @@ def main():
                 st.session_state.chat_history = []
                 st.success("Riwayat chat berhasil dihapus!")
             
+            # Search past questions and answers ("MPASI", "ASI eksklusif", ...)
+            history_query = st.text_input("🔎 Cari Riwayat Chat")
+            if history_query:
+                if st.session_state.get("history_search_query") != history_query:
+                    st.session_state.history_search_query = history_query
+                    st.session_state.history_search_page = 0
+                page = st.session_state.history_search_page
+                results, has_more = search_history(st.session_state.username, history_query, page)
+                if not results:
+                    st.info("Tidak ada percakapan yang cocok.")
+                for _, timestamp, message_snippet, response_snippet, _ in results:
+                    with st.expander(f"🕘 {timestamp}"):
+                        st.markdown(f"**Anda:** {message_snippet}")
+                        st.markdown(f"**Asisten:** {response_snippet}")
+                col_prev, col_next = st.columns(2)
+                if page > 0 and col_prev.button("⬅️ Sebelumnya"):
+                    st.session_state.history_search_page -= 1
+                    st.rerun()
+                if has_more and col_next.button("Berikutnya ➡️"):
+                    st.session_state.history_search_page += 1
+                    st.rerun()
+            
             # Admin functions (for demo user)
             if st.session_state.username == "demo":
                 st.markdown("---")
                 st.markdown("**🔧 Admin Functions**")
                 
+                with st.expander("📊 Cache & OpenAI Stats"):
+                    st.json(response_cache.get_stats())
+                    st.json(llm_flight.get_stats())
+                    st.json(openai_breaker.get_stats())
+                    st.json(get_router_stats())
+                    st.json(chat_writer.get_stats())
+                    st.json(get_password_hasher().get_stats())
+                    if st.button("🧹 Clear Response Cache"):
+                        response_cache.clear()
+                        st.success("✅ Cache berhasil dihapus!")
+                
+                with st.expander("🗃️ Chat Storage"):
+                    st.json(get_archive_stats(database))
+                    st.json(get_response_store_stats(database))
+                    if archive_scheduler:
+                        st.json(archive_scheduler.get_stats())
+                    if st.button("🗃️ Archive Old Chats Now"):
+                        summary = archive_old_chats(database)
+                        st.success(f"✅ {summary['rows']} chat diarsipkan, {summary['reclaimed_bytes']} byte dihemat")
+                
+                with st.expander("🧰 Cached Resources"):
+                    st.json(get_cached_resource_summary())
+                    resource = st.selectbox("Resource", ["all"] + list(CACHED_RESOURCES),
+                                            format_func=lambda name: "Semua" if name == "all" else CACHED_RESOURCES[name][0])
+                    if st.button("♻️ Clear Cached Resource"):
+                        clear_cached_resource(resource)
+                        st.success("✅ Cache berhasil dihapus!")
+                        st.rerun()
+                
                 if st.button("🗄️ Reset Database"):
                     with st.spinner("🗄️ Resetting database..."):
                         reset_database()
@@ -764,6 +903,21 @@ def main():
         # Initialize chat history
         if "messages" not in st.session_state:
             st.session_state.messages = []
+            # Older conversations are loaded on demand, one page at a time
+            st.session_state.history_cursor = get_history_anchor(st.session_state.username)
+            st.session_state.conversation_id = new_conversation_id()
+        
+        if st.session_state.get("history_cursor"):
+            if st.button("⬆️ Muat pesan sebelumnya"):
+                rows, next_cursor = get_chat_history_page(st.session_state.username, st.session_state.history_cursor)
+                older = []
+                # Pages come newest first; the chat shows oldest first
+                for message, response, _ in reversed(rows):
+                    older.append({"role": "user", "content": message})
+                    older.append({"role": "assistant", "content": response})
+                st.session_state.messages = older + st.session_state.messages
+                st.session_state.history_cursor = next_cursor
+                st.rerun()
 
         # Display chat messages
         for message in st.session_state.messages:
@@ -779,22 +933,22 @@ def main():
 
             # Show assistant is typing
             with st.chat_message("assistant"):
-                # Create a placeholder for the response
+                # Create a placeholder for the response; the typing indicator is
+                # replaced by the first streamed token
                 response_placeholder = st.empty()
+                response_placeholder.markdown("🤖 Asisten sedang mengetik...")
                 
-                # Show typing indicator
-                with st.spinner("🤖 Asisten sedang mengetik..."):
-                    # Get response from GPT-5
-                    response = get_stunting_response(prompt)
-                    
-                    # Display the response
-                    response_placeholder.markdown(response)
-                    
-                    # Save chat to database
-                    save_chat(st.session_state.username, prompt, response)
-                    
-                    # Add assistant response to chat history
-                    st.session_state.messages.append({"role": "assistant", "content": response})
+                # Get response from GPT-5 (streamed into the placeholder when enabled)
+                response = get_stunting_response(prompt, response_placeholder)
+                
+                # Display the complete response
+                response_placeholder.markdown(response)
+                
+                # Save chat to database
+                save_chat(st.session_state.username, prompt, response, st.session_state.get("conversation_id"))
+                
+                # Add assistant response to chat history
+                st.session_state.messages.append({"role": "assistant", "content": response})
     
     elif st.session_state.get('show_register', False):
         # Registration form
@@ -814,7 +968,6 @@ def main():
                     if new_password == confirm_password:
                         with st.spinner("📝 Creating account..."):
                             try:
-                                from auth_utils import register_user
                                 success, message = register_user(new_username, new_password, email, full_name)
                                 
                                 if success:
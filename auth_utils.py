@@ -2,127 +2,140 @@ import streamlit as st
 import streamlit_authenticator as stauth
 import yaml
 from yaml.loader import SafeLoader
-import sqlite3
 import os
-import hashlib
+import queue
 import secrets
+import threading
+from concurrent.futures import Future
+import password_hashing
+from chat_responses import collect_orphan_responses
+from db import get_database
+from password_hashing import get_password_hasher, needs_rehash
 
 def init_auth_db():
     """Initialize the authentication database"""
-    db_path = os.getenv('DATABASE_URL', 'sqlite:///stunting_assistant.db')
-    # Resolve to file path similar to app.py
-    if db_path.startswith('sqlite:////'):
-        resolved = '/' + db_path[len('sqlite:////'):] if not db_path[len('sqlite:////'):].startswith('/') else db_path[len('sqlite:////'):]
-    elif db_path.startswith('sqlite:///'):
-        resolved = db_path[len('sqlite:///'):]
-    elif db_path.endswith('.db') and '://' not in db_path:
-        resolved = db_path
-    else:
-        resolved = 'stunting_assistant.db'
-
-    conn = sqlite3.connect(resolved)
-    cursor = conn.cursor()
-    
-    # Create users table if it doesn't exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            email TEXT,
-            name TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    database = get_database()
+    if database.backend == "postgres":
+        # PostgreSQL tables use their own types; the migrations create them
+        from migrations import apply_migrations
+        apply_migrations(database)
+        return
+    with database.transaction() as conn:
+        # Create users table if it doesn't exist
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                email TEXT,
+                name TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
 
 def hash_password(password):
-    """Hash a password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash a password with bcrypt (computed in the password hashing pool)"""
+    return get_password_hasher().hash(password).result()
 
 def verify_password(password, hashed_password):
-    """Verify a password against its hash"""
-    return hash_password(password) == hashed_password
+    """Verify a password against its bcrypt or legacy SHA-256 hash"""
+    return password_hashing.verify_password(password, hashed_password)
 
 def register_user(username, password, email, name):
     """Register a new user"""
     try:
-        db_path = os.getenv('DATABASE_URL', 'sqlite:///stunting_assistant.db')
-        if db_path.startswith('sqlite:////'):
-            resolved = '/' + db_path[len('sqlite:////'):] if not db_path[len('sqlite:////'):].startsWith('/') else db_path[len('sqlite:////'):]
-        elif db_path.startswith('sqlite:///'):
-            resolved = db_path[len('sqlite:///'):]
-        elif db_path.endswith('.db') and '://' not in db_path:
-            resolved = db_path
-        else:
-            resolved = 'stunting_assistant.db'
-        conn = sqlite3.connect(resolved)
-        cursor = conn.cursor()
-        
+        database = get_database()
         # Check if username already exists
-        cursor.execute('SELECT username FROM users WHERE username = ?', (username,))
-        if cursor.fetchone():
+        if database.fetchone('SELECT username FROM users WHERE username = ?', (username,)):
             return False, "Username already exists"
         
-        # Hash password and insert user
+        # Hash before the write transaction, so other writers do not wait out the bcrypt work
         hashed_password = hash_password(password)
-        cursor.execute('''
-            INSERT INTO users (username, password, email, name)
-            VALUES (?, ?, ?, ?)
-        ''', (username, hashed_password, email, name))
+        with database.transaction() as conn:
+            # Taken while we were hashing
+            if conn.execute('SELECT username FROM users WHERE username = ?', (username,)).fetchone():
+                return False, "Username already exists"
+            conn.execute('''
+                INSERT INTO users (username, password, email, name)
+                VALUES (?, ?, ?, ?)
+            ''', (username, hashed_password, email, name))
         
-        conn.commit()
-        conn.close()
         return True, "User registered successfully"
     
     except Exception as e:
         return False, f"Registration failed: {str(e)}"
 
-def authenticate_user(username, password):
-    """Authenticate a user"""
+def submit_authentication(username, password):
+    """Start authenticating a user; returns a Future of (success, name or error message)
+
+    The bcrypt check runs in the password hashing pool, so the script thread
+    only waits on the future. After a successful login, a legacy SHA-256
+    hash (or one with an outdated cost) is replaced in the background.
+    """
+    outcome = Future()
     try:
-        db_path = os.getenv('DATABASE_URL', 'sqlite:///stunting_assistant.db')
-        if db_path.startswith('sqlite:////'):
-            resolved = '/' + db_path[len('sqlite:////'):] if not db_path[len('sqlite:////'):].startswith('/') else db_path[len('sqlite:////'):]
-        elif db_path.startswith('sqlite:///'):
-            resolved = db_path[len('sqlite:///'):]
-        elif db_path.endswith('.db') and '://' not in db_path:
-            resolved = db_path
-        else:
-            resolved = 'stunting_assistant.db'
-        conn = sqlite3.connect(resolved)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT password, name FROM users WHERE username = ?', (username,))
-        result = cursor.fetchone()
-        
-        if result and verify_password(password, result[0]):
-            return True, result[1]  # Return success and name
-        else:
-            return False, "Invalid username or password"
-    
+        result = get_database().fetchone('SELECT password, name FROM users WHERE username = ?', (username,))
     except Exception as e:
-        return False, f"Authentication failed: {str(e)}"
+        outcome.set_result((False, f"Authentication failed: {str(e)}"))
+        return outcome
+    
+    hasher = get_password_hasher()
+    # Unknown usernames still cost one bcrypt check, so response time does not reveal which accounts exist
+    stored, name = result if result else (hasher.dummy_hash(), None)
+    
+    def finish(check):
+        try:
+            valid = check.result() and result is not None
+        except Exception as e:
+            outcome.set_result((False, f"Authentication failed: {str(e)}"))
+            return
+        if not valid:
+            outcome.set_result((False, "Invalid username or password"))
+            return
+        outcome.set_result((True, name))  # Return success and name
+        if needs_rehash(stored, hasher.rounds):
+            upgrade_password_hash(username, password, stored)
+    
+    hasher.verify(password, stored).add_done_callback(finish)
+    return outcome
+
+# Rehashes queued by logins, written by one background thread. Login callbacks run on the hashing
+# pool's manager thread, which must never wait on a database write
+_rehash_queue = queue.Queue()
+_rehash_thread = None
+_rehash_lock = threading.Lock()
+
+def _rehash_worker():
+    while True:
+        username, password, old_hash = _rehash_queue.get()
+        try:
+            new_hash = get_password_hasher().hash(password).result()
+            # Only if the password was not changed meanwhile
+            get_database().execute('UPDATE users SET password = ? WHERE username = ? AND password = ?',
+                                   (new_hash, username, old_hash))
+        except Exception as e:
+            print(f"Password rehash warning: {e}")
+        finally:
+            _rehash_queue.task_done()
+
+def upgrade_password_hash(username, password, old_hash):
+    """Rehash a verified password with the current bcrypt cost, off the caller's thread"""
+    global _rehash_thread
+    with _rehash_lock:
+        if _rehash_thread is None:
+            _rehash_thread = threading.Thread(target=_rehash_worker, name="password-rehash", daemon=True)
+            _rehash_thread.start()
+    _rehash_queue.put((username, password, old_hash))
+
+def authenticate_user(username, password):
+    """Authenticate a user"""
+    return submit_authentication(username, password).result()
 
 def get_user_info(username):
     """Get user information"""
     try:
-        db_path = os.getenv('DATABASE_URL', 'sqlite:///stunting_assistant.db')
-        if db_path.startswith('sqlite:////'):
-            resolved = '/' + db_path[len('sqlite:////'):] if not db_path[len('sqlite:////'):].startswith('/') else db_path[len('sqlite:////'):]
-        elif db_path.startswith('sqlite:///'):
-            resolved = db_path[len('sqlite:///'):]
-        elif db_path.endswith('.db') and '://' not in db_path:
-            resolved = db_path
-        else:
-            resolved = 'stunting_assistant.db'
-        conn = sqlite3.connect(resolved)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT username, email, name, created_at FROM users WHERE username = ?', (username,))
-        result = cursor.fetchone()
+        result = get_database().fetchone(
+            'SELECT username, email, name, created_at FROM users WHERE username = ?', (username,))
         
         if result:
             return {
@@ -139,29 +152,16 @@ def get_user_info(username):
 def update_user_profile(username, email=None, name=None):
     """Update user profile information"""
     try:
-        db_path = os.getenv('DATABASE_URL', 'sqlite:///stunting_assistant.db')
-        if db_path.startswith('sqlite:////'):
-            resolved = '/' + db_path[len('sqlite:////'):] if not db_path[len('sqlite:////'):].startswith('/') else db_path[len('sqlite:////'):]
-        elif db_path.startswith('sqlite:///'):
-            resolved = db_path[len('sqlite:///'):]
-        elif db_path.endswith('.db') and '://' not in db_path:
-            resolved = db_path
-        else:
-            resolved = 'stunting_assistant.db'
-        conn = sqlite3.connect(resolved)
-        cursor = conn.cursor()
+        with get_database().transaction() as conn:
+            if email and name:
+                conn.execute('''
+                    UPDATE users SET email = ?, name = ? WHERE username = ?
+                ''', (email, name, username))
+            elif email:
+                conn.execute('UPDATE users SET email = ? WHERE username = ?', (email, username))
+            elif name:
+                conn.execute('UPDATE users SET name = ? WHERE username = ?', (name, username))
         
-        if email and name:
-            cursor.execute('''
-                UPDATE users SET email = ?, name = ? WHERE username = ?
-            ''', (email, name, username))
-        elif email:
-            cursor.execute('UPDATE users SET email = ? WHERE username = ?', (email, username))
-        elif name:
-            cursor.execute('UPDATE users SET name = ? WHERE username = ?', (name, username))
-        
-        conn.commit()
-        conn.close()
         return True, "Profile updated successfully"
     
     except Exception as e:
@@ -176,23 +176,10 @@ def change_password(username, old_password, new_password):
             return False, "Current password is incorrect"
         
         # Update to new password
-        db_path = os.getenv('DATABASE_URL', 'sqlite:///stunting_assistant.db')
-        if db_path.startswith('sqlite:////'):
-            resolved = '/' + db_path[len('sqlite:////'):] if not db_path[len('sqlite:////'):].startswith('/') else db_path[len('sqlite:////'):]
-        elif db_path.startswith('sqlite:///'):
-            resolved = db_path[len('sqlite:///'):]
-        elif db_path.endswith('.db') and '://' not in db_path:
-            resolved = db_path
-        else:
-            resolved = 'stunting_assistant.db'
-        conn = sqlite3.connect(resolved)
-        cursor = conn.cursor()
-        
         new_hashed_password = hash_password(new_password)
-        cursor.execute('UPDATE users SET password = ? WHERE username = ?', (new_hashed_password, username))
+        with get_database().transaction() as conn:
+            conn.execute('UPDATE users SET password = ? WHERE username = ?', (new_hashed_password, username))
         
-        conn.commit()
-        conn.close()
         return True, "Password changed successfully"
     
     except Exception as e:
@@ -206,27 +193,22 @@ def delete_user(username, password):
         if not success:
             return False, "Password is incorrect"
         
-        # Delete user and their chat history
-        db_path = os.getenv('DATABASE_URL', 'sqlite:///stunting_assistant.db')
-        if db_path.startswith('sqlite:////'):
-            resolved = '/' + db_path[len('sqlite:////'):] if not db_path[len('sqlite:////'):].startswith('/') else db_path[len('sqlite:////'):]
-        elif db_path.startswith('sqlite:///'):
-            resolved = db_path[len('sqlite:///'):]
-        elif db_path.endswith('.db') and '://' not in db_path:
-            resolved = db_path
-        else:
-            resolved = 'stunting_assistant.db'
-        conn = sqlite3.connect(resolved)
-        cursor = conn.cursor()
-        
-        # Delete chat history first (due to foreign key constraint)
-        cursor.execute('DELETE FROM chat_history WHERE username = ?', (username,))
-        
-        # Delete user
-        cursor.execute('DELETE FROM users WHERE username = ?', (username,))
+        # Delete user and their chat history in one transaction
+        with get_database().transaction() as conn:
+            hashes = []
+            # Delete chat history (hot and archived) first (due to foreign key constraint)
+            for table in ("chat_messages", "chat_messages_archive"):
+                hashes += [row[0] for row in conn.execute(
+                    f'SELECT DISTINCT response_hash FROM {table} WHERE user_id = (SELECT id FROM users WHERE username = ?)',
+                    (username,)).fetchall()]
+                conn.execute(f'DELETE FROM {table} WHERE user_id = (SELECT id FROM users WHERE username = ?)',
+                             (username,))
+            # Response bodies only this user's history referenced
+            collect_orphan_responses(conn, hashes)
+            
+            # Delete user
+            conn.execute('DELETE FROM users WHERE username = ?', (username,))
         
-        conn.commit()
-        conn.close()
         return True, "Account deleted successfully"
     
     except Exception as e:
@@ -235,23 +217,7 @@ def delete_user(username, password):
 def get_all_users():
     """Get all users (admin function)"""
     try:
-        db_path = os.getenv('DATABASE_URL', 'sqlite:///stunting_assistant.db')
-        if db_path.startswith('sqlite:////'):
-            resolved = '/' + db_path[len('sqlite:////'):] if not db_path[len('sqlite:////'):].startswith('/') else db_path[len('sqlite:////'):]
-        elif db_path.startswith('sqlite:///'):
-            resolved = db_path[len('sqlite:///'):]
-        elif db_path.endswith('.db') and '://' not in db_path:
-            resolved = db_path
-        else:
-            resolved = 'stunting_assistant.db'
-        conn = sqlite3.connect(resolved)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT username, email, name, created_at FROM users ORDER BY created_at DESC')
-        users = cursor.fetchall()
-        
-        conn.close()
-        return users
+        return get_database().fetchall('SELECT username, email, name, created_at FROM users ORDER BY created_at DESC')
     
     except Exception as e:
         return []
@@ -259,35 +225,24 @@ def get_all_users():
 def create_demo_user():
     """Create a demo user if no users exist"""
     try:
-        db_path = os.getenv('DATABASE_URL', 'sqlite:///stunting_assistant.db')
-        if db_path.startswith('sqlite:////'):
-            resolved = '/' + db_path[len('sqlite:////'):] if not db_path[len('sqlite:////'):].startswith('/') else db_path[len('sqlite:////'):]
-        elif db_path.startswith('sqlite:///'):
-            resolved = db_path[len('sqlite:///'):]
-        elif db_path.endswith('.db') and '://' not in db_path:
-            resolved = db_path
-        else:
-            resolved = 'stunting_assistant.db'
-        conn = sqlite3.connect(resolved)
-        cursor = conn.cursor()
-        
+        database = get_database()
         # Check if any users exist
-        cursor.execute('SELECT COUNT(*) FROM users')
-        user_count = cursor.fetchone()[0]
+        if database.fetchone('SELECT COUNT(*) FROM users')[0]:
+            return False, "Users already exist"
         
-        if user_count == 0:
-            # Create demo user
-            demo_password = hash_password('demo123')
-            cursor.execute('''
-                INSERT INTO users (username, password, email, name)
-                VALUES (?, ?, ?, ?)
-            ''', ('demo', demo_password, 'demo@example.com', 'Demo User'))
+        # Hashed before the write transaction, like register_user
+        demo_password = hash_password('demo123')
+        with database.transaction() as conn:
+            user_count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
             
-            conn.commit()
-            conn.close()
-            return True, "Demo user created"
+            if user_count == 0:
+                # Create demo user
+                conn.execute('''
+                    INSERT INTO users (username, password, email, name)
+                    VALUES (?, ?, ?, ?)
+                ''', ('demo', demo_password, 'demo@example.com', 'Demo User'))
+                return True, "Demo user created"
         
-        conn.close()
         return False, "Users already exist"
     
     except Exception as e:
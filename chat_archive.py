@@ -0,0 +1,322 @@
+"""
+Chat Archive Module
+Hot/cold tiering for chat history. A background job moves chat_messages
+rows older than CHAT_ARCHIVE_AFTER_DAYS into chat_messages_archive, so the
+hot table (and its index and full-text index) only holds recent rows. Only
+the question is zlib-compressed: the answer stays, uncompressed, in
+chat_responses under its hash, shared with every other row giving it, so
+archiving does not reduce answer storage (deduplication already stores each
+answer once). Rows move in small batches, each one transaction, and are
+decompressed transparently when history pages or exports reach into the
+archive. Archived rows are no longer found by chat history search
+
+Usage:
+    python chat_archive.py [--days 90] [--batch-size 500]
+"""
+
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+import zlib
+
+from chat_responses import store_responses
+from chat_schema import now_ms
+from db import get_database
+
+# Archive config from env (with defaults)
+CHAT_ARCHIVE_AFTER_DAYS = float(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "90"))  # 0 turns the scheduled job off
+CHAT_ARCHIVE_INTERVAL_HOURS = float(os.getenv("CHAT_ARCHIVE_INTERVAL_HOURS", "24"))
+CHAT_ARCHIVE_BATCH_SIZE = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", "500"))  # rows moved per transaction
+CHAT_ARCHIVE_PAUSE = float(os.getenv("CHAT_ARCHIVE_PAUSE", "0.05"))  # seconds between batches, to let chat writes in
+CHAT_ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("CHAT_ARCHIVE_COMPRESSION_LEVEL", "6"))
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Created by the archive migration; BLOB becomes BYTEA on PostgreSQL
+CHAT_ARCHIVE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS chat_messages_archive (
+        id {id_type} PRIMARY KEY,
+        user_id {id_type} NOT NULL REFERENCES users (id),
+        created_at {id_type} NOT NULL,
+        conversation_id {id_type},
+        body {blob_type} NOT NULL
+    )
+'''
+CHAT_ARCHIVE_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_chat_messages_archive_user_time
+    ON chat_messages_archive (user_id, created_at, id)
+'''
+# Response garbage collection probes the archive as well as the hot table
+ARCHIVE_RESPONSE_HASH_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_chat_messages_archive_response_hash
+    ON chat_messages_archive (response_hash)
+'''
+
+# Oldest first in id order; once nothing is older than the cutoff this is one scan of the (small) hot table.
+# {lock} lets PostgreSQL nodes running the job at the same time skip each other's rows
+SELECT_EXPIRED_SQL = f'''
+    SELECT m.id, m.user_id, m.created_at, m.conversation_id, m.message, m.response, m.response_hash
+    FROM chat_messages m WHERE m.created_at < ? ORDER BY m.id LIMIT ? {{lock}}
+'''
+# No ON CONFLICT: the hot rows are deleted right after, so an id already in the archive must
+# fail the batch rather than have its row dropped
+INSERT_ARCHIVE_SQL = '''
+    INSERT INTO chat_messages_archive (id, user_id, created_at, conversation_id, body, response_hash)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+# The answer of an archived row; NULL for rows archived with the answer inside their body
+ARCHIVED_RESPONSE_SQL = "(SELECT body FROM chat_responses WHERE hash = a.response_hash)"
+
+# First byte of a body stored uncompressed; a zlib stream always starts with 0x78
+RAW_BODY_PREFIX = b"\x00"
+
+def create_archive_table(conn):
+    """Archive table for SQLite"""
+    conn.execute(CHAT_ARCHIVE_TABLE_SQL.format(id_type="INTEGER", blob_type="BLOB"))
+    conn.execute(CHAT_ARCHIVE_INDEX_SQL)
+
+def create_postgres_archive_table(conn):
+    """Archive table for PostgreSQL"""
+    conn.execute(CHAT_ARCHIVE_TABLE_SQL.format(id_type="BIGINT", blob_type="BYTEA"))
+    conn.execute(CHAT_ARCHIVE_INDEX_SQL)
+
+def add_archive_response_hash(conn, backend="sqlite"):
+    """response_hash reference on chat_messages_archive, to the same chat_responses bodies hot rows use"""
+    if backend == "postgres":
+        conn.execute("ALTER TABLE chat_messages_archive ADD COLUMN IF NOT EXISTS response_hash "
+                     "BYTEA REFERENCES chat_responses (hash)")
+    elif not any(column[1] == "response_hash" for column in conn.execute("PRAGMA table_info(chat_messages_archive)")):
+        conn.execute("ALTER TABLE chat_messages_archive ADD COLUMN response_hash BLOB REFERENCES chat_responses (hash)")
+    conn.execute(ARCHIVE_RESPONSE_HASH_INDEX_SQL)
+
+def compress_body(message, level=CHAT_ARCHIVE_COMPRESSION_LEVEL):
+    """Question text as a zlib stream
+
+    A short question does not make up for zlib's header and checksum; it is
+    stored as-is behind RAW_BODY_PREFIX instead.
+    """
+    raw = message.encode("utf-8")
+    compressed = zlib.compress(raw, level)
+    return compressed if len(compressed) <= len(raw) else RAW_BODY_PREFIX + raw
+
+def decompress_body(body):
+    """Inverse of compress_body"""
+    body = bytes(body)
+    raw = body[len(RAW_BODY_PREFIX):] if body.startswith(RAW_BODY_PREFIX) else zlib.decompress(body)
+    return raw.decode("utf-8")
+
+def read_archived_body(body, response):
+    """(message, response) of an archived row
+
+    response is the row's chat_responses body; it is None for rows archived
+    before the archive shared chat_responses, whose body holds both texts as
+    a JSON pair.
+    """
+    if response is None:
+        message, response = json.loads(decompress_body(body))
+        return message, response
+    return decompress_body(body), response
+
+def fetch_archived_page(database, username, cursor=None, limit=20, direction="older"):
+    """One keyset page of a user's archived rows as (id, message, response, created_at)
+
+    Same cursor and ordering as the hot-table history query, so the caller
+    can merge both pages.
+    """
+    if direction == "older":
+        comparison, order = "<", "DESC"
+    else:
+        comparison, order = ">", "ASC"
+    sql = f'''
+        SELECT a.id, a.created_at, a.body, {ARCHIVED_RESPONSE_SQL} FROM chat_messages_archive a
+        WHERE a.user_id = (SELECT id FROM users WHERE username = ?)
+        {f"AND (a.created_at, a.id) {comparison} (?, ?)" if cursor else ""}
+        ORDER BY a.created_at {order}, a.id {order} LIMIT ?
+    '''
+    params = (username, *cursor) if cursor else (username,)
+    rows = database.fetchall(sql, params + (limit,))
+    return [(row_id, *read_archived_body(body, response), created_at) for row_id, created_at, body, response in rows]
+
+def fetch_archived_rows(database, after_id, end_id, limit):
+    """Archived rows in id order as (id, username, conversation_id, created_at, message, response), for exports"""
+    rows = database.fetchall(f'''
+        SELECT a.id, u.username, a.conversation_id, a.created_at, a.body, {ARCHIVED_RESPONSE_SQL}
+        FROM chat_messages_archive a JOIN users u ON u.id = a.user_id
+        WHERE a.id > ? AND a.id <= ?
+        ORDER BY a.id LIMIT ?
+    ''', (after_id, end_id, limit))
+    return [row[:4] + read_archived_body(row[4], row[5]) for row in rows]
+
+def backfill_archived_responses(database=None, chunk_size=CHAT_ARCHIVE_BATCH_SIZE, pause=CHAT_ARCHIVE_PAUSE,
+                                level=CHAT_ARCHIVE_COMPRESSION_LEVEL):
+    """Move the answers out of rows archived with them inside the body, one short transaction per chunk
+
+    Returns the number of rows converted; an interrupted run continues with
+    the rows that still have no hash.
+    """
+    database = database or get_database()
+    converted = 0
+    last_id = 0
+    while True:
+        with database.transaction() as conn:
+            rows = conn.execute('''
+                SELECT id, body FROM chat_messages_archive WHERE id > ? AND response_hash IS NULL ORDER BY id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            pairs = [read_archived_body(body, None) for _, body in rows]
+            hashes = store_responses(conn, [response for _, response in pairs])
+            conn.executemany("UPDATE chat_messages_archive SET body = ?, response_hash = ? WHERE id = ?",
+                             [(compress_body(message, level), value, row[0])
+                              for (message, _), value, row in zip(pairs, hashes, rows)])
+        converted += len(rows)
+        last_id = rows[-1][0]
+        time.sleep(pause)
+    if converted:
+        print(f"✅ Stored the responses of {converted} archived chat rows by hash")
+    return converted
+
+def archive_old_chats(database=None, max_age_days=CHAT_ARCHIVE_AFTER_DAYS, batch_size=CHAT_ARCHIVE_BATCH_SIZE,
+                      pause=CHAT_ARCHIVE_PAUSE, level=CHAT_ARCHIVE_COMPRESSION_LEVEL):
+    """Move rows older than max_age_days into the archive; returns a summary
+
+    All byte counts are question text only: raw_bytes is what moved out of
+    the hot table, archived_bytes what it takes compressed, reclaimed_bytes
+    the saving (at worst one byte per row below zero, for questions too
+    short to compress). Answers are not moved or compressed; the archived
+    row keeps the hash of its chat_responses body. An id that is already
+    archived raises instead of losing the hot row. On SQLite the
+    freed pages are reused by new rows; free_bytes reports them (VACUUM
+    returns them to the filesystem).
+    """
+    database = database or get_database()
+    cutoff = now_ms() - int(max_age_days * DAY_MS)
+    # SQLite's write transaction already keeps a concurrent run off these rows
+    select_sql = SELECT_EXPIRED_SQL.format(lock="FOR UPDATE OF m SKIP LOCKED" if database.backend == "postgres" else "")
+    summary = {"rows": 0, "batches": 0, "raw_bytes": 0, "archived_bytes": 0}
+    start = time.monotonic()
+    while True:
+        with database.transaction() as conn:
+            # Selected inside the write transaction, so concurrent runs never move a row twice
+            rows = conn.execute(select_sql, (cutoff, batch_size)).fetchall()
+            # Rows written through the chat_history view still carry their answer inline
+            inline = [row for row in rows if row[6] is None]
+            hashes = dict(zip([row[0] for row in inline], store_responses(conn, [row[5] for row in inline])))
+            archived = [(row_id, user_id, created_at, conversation_id, compress_body(message, level),
+                         hashes.get(row_id, response_hash))
+                        for row_id, user_id, created_at, conversation_id, message, _, response_hash in rows]
+            if archived:
+                conn.executemany(INSERT_ARCHIVE_SQL, archived)
+                conn.executemany("DELETE FROM chat_messages WHERE id = ?", [(row[0],) for row in archived])
+        summary["rows"] += len(rows)
+        summary["raw_bytes"] += sum(len(row[4].encode("utf-8")) for row in rows)
+        summary["archived_bytes"] += sum(len(row[4]) for row in archived)
+        if rows:
+            summary["batches"] += 1
+        if len(rows) < batch_size:
+            break
+        time.sleep(pause)
+
+    summary["reclaimed_bytes"] = summary["raw_bytes"] - summary["archived_bytes"]
+    if database.backend == "sqlite":
+        page_size = database.fetchone("PRAGMA page_size")[0]
+        summary["free_bytes"] = database.fetchone("PRAGMA freelist_count")[0] * page_size
+    summary["seconds"] = round(time.monotonic() - start, 2)
+    if summary["rows"]:
+        print(f"🗃️ Archived {summary['rows']} chat rows older than {max_age_days:g} days: "
+              f"question text {summary['raw_bytes']} bytes -> {summary['archived_bytes']} compressed "
+              f"({summary['reclaimed_bytes']} reclaimed; answers stay uncompressed in chat_responses) "
+              f"in {summary['seconds']}s")
+    return summary
+
+def get_archive_stats(database=None):
+    """Row counts and sizes of both tiers
+
+    archived_bytes is the compressed question text; archived_answer_chars
+    is the uncompressed text of the answers archived rows reference (some
+    of them shared with hot rows).
+    """
+    database = database or get_database()
+    archived, archived_bytes = database.fetchone(
+        "SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM chat_messages_archive")
+    answer_chars = database.fetchone('''
+        SELECT COALESCE(SUM(LENGTH(body)), 0) FROM chat_responses
+        WHERE hash IN (SELECT response_hash FROM chat_messages_archive)
+    ''')[0]
+    return {
+        "hot_rows": database.fetchone("SELECT COUNT(*) FROM chat_messages")[0],
+        "archived_rows": archived,
+        "archived_bytes": archived_bytes,
+        "archived_answer_chars": answer_chars,
+    }
+
+class ArchiveScheduler:
+    """Background thread that runs archive_old_chats every interval (first run at start)"""
+
+    def __init__(self, db_path, interval_hours=CHAT_ARCHIVE_INTERVAL_HOURS, max_age_days=CHAT_ARCHIVE_AFTER_DAYS):
+        self.db_path = db_path
+        self.interval = interval_hours * 3600
+        self.max_age_days = max_age_days
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chat-archive", daemon=True)
+        self.stats = {"runs": 0, "errors": 0, "rows": 0, "reclaimed_bytes": 0, "last_run": None}
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        from migrations import ensure_schema  # migrations imports this module
+        while not self._stop.is_set():
+            try:
+                database = get_database(self.db_path)
+                # The app may still be starting; the archive table must exist first
+                ensure_schema(database)
+                summary = archive_old_chats(database, self.max_age_days)
+                self.stats["runs"] += 1
+                self.stats["rows"] += summary["rows"]
+                self.stats["reclaimed_bytes"] += summary["reclaimed_bytes"]
+                self.stats["last_run"] = summary
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Chat archive warning: {e}")
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["max_age_days"] = self.max_age_days
+        stats["interval_hours"] = self.interval / 3600
+        return stats
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def start_archive_scheduler(db_path):
+    """Start the process-wide archive job for a database; None when CHAT_ARCHIVE_AFTER_DAYS is 0"""
+    if CHAT_ARCHIVE_AFTER_DAYS <= 0:
+        return None
+    with _schedulers_lock:
+        scheduler = _schedulers.get(db_path)
+        if scheduler is None:
+            scheduler = _schedulers[db_path] = ArchiveScheduler(db_path).start()
+            atexit.register(scheduler.stop)
+        return scheduler
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old chat history into the compressed archive")
+    parser.add_argument("--days", type=float, default=CHAT_ARCHIVE_AFTER_DAYS or 90, help="Archive rows older than this")
+    parser.add_argument("--batch-size", type=int, default=CHAT_ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    from migrations import apply_migrations  # migrations imports this module
+    apply_migrations()
+    summary = archive_old_chats(max_age_days=args.days, batch_size=args.batch_size)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Chat Export Module
+Exports chat history to Parquet for analytics, so analysts read files
+instead of querying the production database. Rows are streamed in id order
+in bounded batches (one batch in memory at a time) and written to Hive-style
+partitions, month=YYYY-MM/language=<language>/. Archived rows are read from
+chat_messages_archive, decompressed and merged in id order with the hot
+rows, so archiving never hides rows from an export. A watermark file records the
+last exported id, so each run only appends rows that are new since the last
+one; that relies on ids never being reused (AUTOINCREMENT on SQLite) and, on
+PostgreSQL, on staying a safety window behind the newest rows, whose ids may
+commit out of order. Usernames can be replaced by keyed pseudonyms (HMAC-SHA256)
+
+Usage:
+    python chat_export.py --output exports/chat_history [--pseudonymize] [--batch-size 5000] [--full]
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from chat_archive import fetch_archived_rows
+from chat_responses import response_sql
+from chat_schema import now_ms
+from db import get_database
+from language_detection import detect_languages
+from migrations import apply_migrations
+
+# Export config from env (with defaults)
+CHAT_EXPORT_BATCH_SIZE = int(os.getenv("CHAT_EXPORT_BATCH_SIZE", "5000"))  # rows read per query
+CHAT_EXPORT_DIR = os.getenv("CHAT_EXPORT_DIR", "exports/chat_history")
+# Secret for --pseudonymize; keep it stable so a user's pseudonym is the same across exports
+CHAT_EXPORT_PSEUDONYM_KEY = os.getenv("CHAT_EXPORT_PSEUDONYM_KEY", "")
+# PostgreSQL only: rows newer than this many seconds wait for the next run. Sequence ids are taken
+# at insert but become visible at commit, so a lower id can still appear after a higher one
+CHAT_EXPORT_SAFETY_WINDOW = float(os.getenv("CHAT_EXPORT_SAFETY_WINDOW", "60"))
+
+STATE_FILE = "_export_state.json"
+STAGING_DIR = "_staging"
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("user", pa.string()),
+    ("conversation_id", pa.int64()),
+    ("created_at", pa.timestamp("ms", tz="UTC")),
+    ("message", pa.string()),
+    ("response", pa.string()),
+])
+
+EXPORT_SQL = f'''
+    SELECT m.id, u.username, m.conversation_id, m.created_at, m.message, {response_sql("m")}
+    FROM chat_messages m JOIN users u ON u.id = m.user_id
+    WHERE m.id > ? AND m.id <= ?
+    ORDER BY m.id LIMIT ?
+'''
+
+def pseudonymize(username, key):
+    """Stable keyed pseudonym: the same user maps to the same value, but it cannot be reversed without the key"""
+    return hmac.new(key.encode("utf-8"), username.encode("utf-8"), hashlib.sha256).hexdigest()[:16]
+
+def load_state(output_dir):
+    """Return the stored watermark ({"last_id": 0} before the first export)"""
+    try:
+        with open(os.path.join(output_dir, STATE_FILE), encoding="utf-8") as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return {"last_id": 0}
+
+def save_state(output_dir, state):
+    """Write the watermark atomically so a crash never leaves a half-written file"""
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(path + ".tmp", path)
+
+def export_upper_bound(database, safety_window=CHAT_EXPORT_SAFETY_WINDOW):
+    """Highest id a run may export without a lower id still showing up later"""
+    if database.backend == "postgres":
+        # Ids of rows older than the window have committed (or rolled back) by now
+        cutoff = now_ms() - int(safety_window * 1000)
+        condition, params = "WHERE created_at <= ?", (cutoff,)
+    else:
+        # SQLite commits one writer at a time and AUTOINCREMENT never hands an id out twice
+        condition, params = "", ()
+    return max(database.fetchone(f"SELECT COALESCE(MAX(id), 0) FROM {table} {condition}", params)[0]
+               for table in ("chat_messages", "chat_messages_archive"))
+
+class _PartitionWriters:
+    """One open ParquetWriter per month/language partition touched by this run, staged until commit"""
+
+    def __init__(self, output_dir, run_name):
+        self.output_dir = output_dir
+        self.staging_dir = os.path.join(output_dir, STAGING_DIR)
+        self.run_name = run_name
+        self._writers = {}
+        self.files = []
+
+    def write(self, partition, table):
+        writer = self._writers.get(partition)
+        if writer is None:
+            month, language = partition
+            relative = os.path.join(f"month={month}", f"language={language}", f"part-{self.run_name}.parquet")
+            staged = os.path.join(self.staging_dir, relative)
+            os.makedirs(os.path.dirname(staged), exist_ok=True)
+            writer = self._writers[partition] = pq.ParquetWriter(staged, SCHEMA, compression="zstd")
+            self.files.append(relative)
+        writer.write_table(table)
+
+    def commit(self):
+        """Close every file and move it from staging into its partition"""
+        for writer in self._writers.values():
+            writer.close()
+        for relative in self.files:
+            final = os.path.join(self.output_dir, relative)
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            os.replace(os.path.join(self.staging_dir, relative), final)
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+def _partition_batch(rows, pseudonym_key):
+    """Split one batch of rows into {(month, language): pyarrow.Table}"""
+    languages = detect_languages([row[4] for row in rows])
+    columns = {}
+    for row, language in zip(rows, languages):
+        row_id, username, conversation_id, created_at, message, response = row
+        month = datetime.fromtimestamp(created_at / 1000, timezone.utc).strftime("%Y-%m")
+        user = pseudonymize(username, pseudonym_key) if pseudonym_key else username
+        partition = columns.setdefault((month, language), {name: [] for name in SCHEMA.names})
+        for name, value in zip(SCHEMA.names, (row_id, user, conversation_id, created_at, message, response)):
+            partition[name].append(value)
+    return {partition: pa.Table.from_pydict(data, schema=SCHEMA) for partition, data in columns.items()}
+
+def export_chat_history(output_dir=CHAT_EXPORT_DIR, database=None, batch_size=CHAT_EXPORT_BATCH_SIZE,
+                        pseudonymize_users=False, pseudonym_key=None, full=False):
+    """Append chat rows newer than the watermark to the Parquet dataset; returns a summary
+
+    The run exports up to the highest id present when it starts (see
+    export_upper_bound), and only advances the watermark after every file
+    is in place, so a failed run is simply repeated. full=True ignores the watermark (export into an empty
+    directory to avoid duplicate rows).
+    """
+    database = database or get_database()
+    if pseudonymize_users:
+        pseudonym_key = pseudonym_key or CHAT_EXPORT_PSEUDONYM_KEY
+        if not pseudonym_key:
+            raise ValueError("Pseudonymizing needs CHAT_EXPORT_PSEUDONYM_KEY (or pseudonym_key)")
+    else:
+        pseudonym_key = None
+
+    os.makedirs(output_dir, exist_ok=True)
+    # Files of a run that died before commit
+    shutil.rmtree(os.path.join(output_dir, STAGING_DIR), ignore_errors=True)
+
+    state = {"last_id": 0} if full else load_state(output_dir)
+    if state["last_id"] and state.get("pseudonymized", False) != bool(pseudonym_key):
+        raise ValueError("The dataset was exported with a different --pseudonymize setting; use a new --output")
+    start_id = last_id = state["last_id"]
+    end_id = max(export_upper_bound(database), start_id)
+    start = time.monotonic()
+    writers = _PartitionWriters(output_dir, f"{start_id + 1:012d}-{end_id:012d}")
+    exported = 0
+    while last_id < end_id:
+        # Each batch is its own short read, so exports never hold a long transaction on production
+        rows = database.fetchall(EXPORT_SQL, (last_id, end_id, batch_size))
+        rows += fetch_archived_rows(database, last_id, end_id, batch_size)
+        # A row archived between the two reads comes back from both; keep it once
+        rows = sorted({row[0]: row for row in rows}.values(), key=lambda row: row[0])[:batch_size]
+        if not rows:
+            break
+        for partition, table in _partition_batch(rows, pseudonym_key).items():
+            writers.write(partition, table)
+        exported += len(rows)
+        last_id = rows[-1][0]
+    writers.commit()
+
+    summary = {
+        "rows": exported,
+        "from_id": start_id,
+        "last_id": max(last_id, end_id),
+        "files": writers.files,
+        "pseudonymized": bool(pseudonym_key),
+        "seconds": round(time.monotonic() - start, 2),
+    }
+    save_state(output_dir, {
+        "last_id": summary["last_id"],
+        "exported_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "pseudonymized": summary["pseudonymized"],
+    })
+    print(f"✅ Exported {exported} chat rows into {len(writers.files)} Parquet files in {summary['seconds']}s")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Export chat history to partitioned Parquet files")
+    parser.add_argument("--output", default=CHAT_EXPORT_DIR, help="Dataset directory")
+    parser.add_argument("--batch-size", type=int, default=CHAT_EXPORT_BATCH_SIZE)
+    parser.add_argument("--pseudonymize", action="store_true", help="Replace usernames with keyed pseudonyms")
+    parser.add_argument("--full", action="store_true", help="Ignore the watermark and export every row")
+    args = parser.parse_args()
+    # The watermark needs ids that are never reused (migration 10 on SQLite)
+    apply_migrations()
+    export_chat_history(args.output, batch_size=args.batch_size, pseudonymize_users=args.pseudonymize, full=args.full)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Chat Responses Module
+Content-addressed storage for assistant answers. Cached and knowledge-base
+answers repeat word for word, so each distinct body is stored once in
+chat_responses under its SHA-256 digest and chat_messages keeps only the
+32-byte response_hash (its response column is left empty). Rows written
+before the switch still carry their text in response, so reads resolve
+COALESCE(body, response) and work for both. Archived rows reference the
+same bodies, and bodies no row in either tier references any more are
+garbage-collected when rows are deleted
+"""
+
+import hashlib
+import os
+import time
+
+from db import get_database
+
+# Backfill config from env (with defaults)
+CHAT_RESPONSE_DEDUP_CHUNK_SIZE = int(os.getenv("CHAT_RESPONSE_DEDUP_CHUNK_SIZE", "2000"))  # rows per transaction
+CHAT_RESPONSE_DEDUP_PAUSE = float(os.getenv("CHAT_RESPONSE_DEDUP_PAUSE", "0.05"))  # seconds between chunks
+
+CHAT_RESPONSES_TABLE_SQL = {
+    "sqlite": '''
+        CREATE TABLE IF NOT EXISTS chat_responses (
+            hash BLOB PRIMARY KEY,
+            body TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''',
+    "postgres": '''
+        CREATE TABLE IF NOT EXISTS chat_responses (
+            hash BYTEA PRIMARY KEY,
+            body TEXT NOT NULL
+        )
+    ''',
+}
+# Lets garbage collection check "is this body still referenced" with one index probe
+RESPONSE_HASH_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_chat_messages_response_hash ON chat_messages (response_hash)'
+
+# The body goes in first, so the chat row's reference (and the search triggers reading it) always resolve
+INSERT_RESPONSE_SQL = 'INSERT INTO chat_responses (hash, body) VALUES (?, ?) ON CONFLICT (hash) DO NOTHING'
+
+def response_sql(alias):
+    """SQL expression for the response text of a chat_messages row (alias may also be NEW or OLD in triggers)"""
+    return f"COALESCE((SELECT body FROM chat_responses WHERE hash = {alias}.response_hash), {alias}.response)"
+
+def has_response_store(conn):
+    """True once chat_messages has the response_hash column (SQLite)"""
+    return any(column[1] == "response_hash" for column in conn.execute("PRAGMA table_info(chat_messages)"))
+
+def response_hash(body):
+    """Content address of a response body"""
+    return hashlib.sha256(body.encode("utf-8")).digest()
+
+def store_responses(conn, bodies):
+    """Store each distinct body once, inside the caller's transaction; returns the hash of every body in order"""
+    hashes = [response_hash(body) for body in bodies]
+    # A body already stored (the common case for cached answers) costs an index lookup and no write
+    conn.executemany(INSERT_RESPONSE_SQL, list(dict(zip(hashes, bodies)).items()))
+    return hashes
+
+def collect_orphan_responses(conn, hashes):
+    """Delete the bodies among hashes that no hot or archived row references any more; call after deleting the rows"""
+    candidates = {bytes(value) for value in hashes if value is not None}
+    if not candidates:
+        return 0
+    cursor = conn.executemany('''
+        DELETE FROM chat_responses
+        WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM chat_messages WHERE response_hash = ?)
+          AND NOT EXISTS (SELECT 1 FROM chat_messages_archive WHERE response_hash = ?)
+    ''', [(value, value, value) for value in candidates])
+    return max(cursor.rowcount, 0)
+
+def create_response_store(conn, backend="sqlite"):
+    """chat_responses plus the response_hash reference on chat_messages"""
+    conn.execute(CHAT_RESPONSES_TABLE_SQL[backend])
+    if backend == "postgres":
+        conn.execute("ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS response_hash BYTEA REFERENCES chat_responses (hash)")
+    elif not has_response_store(conn):
+        conn.execute("ALTER TABLE chat_messages ADD COLUMN response_hash BLOB REFERENCES chat_responses (hash)")
+    conn.execute(RESPONSE_HASH_INDEX_SQL)
+
+def backfill_response_hashes(database=None, chunk_size=CHAT_RESPONSE_DEDUP_CHUNK_SIZE, pause=CHAT_RESPONSE_DEDUP_PAUSE):
+    """Move the response text of existing rows into chat_responses, one short transaction per chunk
+
+    Returns the number of rows converted; an interrupted run continues with
+    the rows that still have no hash.
+    """
+    database = database or get_database()
+    converted = 0
+    last_id = 0
+    start = time.monotonic()
+    while True:
+        with database.transaction() as conn:
+            rows = conn.execute('''
+                SELECT id, response FROM chat_messages WHERE id > ? AND response_hash IS NULL ORDER BY id LIMIT ?
+            ''', (last_id, chunk_size)).fetchall()
+            if not rows:
+                break
+            hashes = store_responses(conn, [row[1] for row in rows])
+            conn.executemany("UPDATE chat_messages SET response_hash = ?, response = '' WHERE id = ?",
+                             [(value, row[0]) for value, row in zip(hashes, rows)])
+        converted += len(rows)
+        last_id = rows[-1][0]
+        time.sleep(pause)
+    if converted:
+        print(f"✅ Stored the responses of {converted} chat rows by hash in {time.monotonic() - start:.1f}s")
+    return converted
+
+def get_response_store_stats(database=None):
+    """How many chat rows share how many stored bodies"""
+    database = database or get_database()
+    rows, referenced = database.fetchone(
+        "SELECT COUNT(*), COUNT(response_hash) FROM chat_messages")
+    bodies, body_chars = database.fetchone(
+        "SELECT COUNT(*), COALESCE(SUM(LENGTH(body)), 0) FROM chat_responses")
+    return {
+        "chat_rows": rows,
+        "rows_by_hash": referenced,
+        "distinct_responses": bodies,
+        "response_chars": body_chars,
+        "rows_per_response": round(referenced / bodies, 2) if bodies else 0.0,
+    }
@@ -0,0 +1,169 @@
+"""
+Chat Schema Module
+Compact chat storage: chat_messages keys rows by the integer users.id and
+stores created_at as integer epoch milliseconds, so rows and the per-user
+(user_id, created_at, id) index stay small and range scans touch fewer pages.
+The legacy chat_history table (username TEXT, timestamp TEXT) is backfilled
+in short chunks so the app keeps serving while it runs, then swapped for a
+chat_history view that keeps old SQL working
+"""
+
+import os
+import time
+from datetime import datetime, timezone
+
+from chat_responses import has_response_store, response_sql
+from db import get_database
+
+# Migration config from env (with defaults)
+CHAT_MIGRATION_CHUNK_SIZE = int(os.getenv("CHAT_MIGRATION_CHUNK_SIZE", "2000"))  # rows copied per transaction
+CHAT_MIGRATION_PAUSE = float(os.getenv("CHAT_MIGRATION_PAUSE", "0.05"))  # seconds between chunks, lets writers in
+
+# AUTOINCREMENT: an id is never handed out again once its row is archived or deleted, so the
+# archive (keyed by the same id) and export watermarks can rely on ids only growing
+CHAT_MESSAGES_SQL = '''
+    CREATE TABLE IF NOT EXISTS chat_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL REFERENCES users (id),
+        created_at INTEGER NOT NULL,
+        conversation_id INTEGER,
+        message TEXT NOT NULL,
+        response TEXT NOT NULL
+    )
+'''
+CHAT_MESSAGES_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_chat_messages_user_time ON chat_messages (user_id, created_at, id)'
+
+# Legacy-shaped view over chat_messages, so old queries and old app processes keep working.
+# {response} reads the response text (resolved through chat_responses once it exists)
+CHAT_HISTORY_VIEW_SQL = '''
+    CREATE VIEW IF NOT EXISTS chat_history AS
+    SELECT m.id, u.username, m.message, {response} AS response,
+           strftime('%Y-%m-%d %H:%M:%S', m.created_at / 1000, 'unixepoch') AS timestamp,
+           m.conversation_id
+    FROM chat_messages m JOIN users u ON u.id = m.user_id
+'''
+CHAT_HISTORY_TRIGGERS_SQL = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS chat_history_insert INSTEAD OF INSERT ON chat_history
+    BEGIN
+        INSERT INTO chat_messages (user_id, created_at, conversation_id, message, response)
+        SELECT id,
+               COALESCE(CAST(strftime('%s', NEW.timestamp) AS INTEGER) * 1000,
+                        CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)),
+               NEW.conversation_id, NEW.message, NEW.response
+        FROM users WHERE username = NEW.username;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS chat_history_delete INSTEAD OF DELETE ON chat_history
+    BEGIN
+        DELETE FROM chat_messages WHERE id = OLD.id;
+    END
+    ''',
+]
+
+# Copy one id range of legacy rows; rows of usernames without an account have no user_id and stay behind
+BACKFILL_SQL = '''
+    INSERT OR IGNORE INTO chat_messages (id, user_id, created_at, message, response)
+    SELECT c.id, u.id, COALESCE(CAST(strftime('%s', c.timestamp) AS INTEGER) * 1000, 0), c.message, c.response
+    FROM chat_history c JOIN users u ON u.username = c.username
+    WHERE c.id > ? AND c.id <= ?
+'''
+
+def now_ms():
+    """Current time as integer epoch milliseconds (UTC)"""
+    return int(time.time() * 1000)
+
+def format_timestamp(created_at):
+    """Epoch milliseconds as the 'YYYY-MM-DD HH:MM:SS' UTC text the legacy column held"""
+    return datetime.fromtimestamp(created_at / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def new_conversation_id():
+    """Conversation ids are the conversation's start time in epoch milliseconds"""
+    return now_ms()
+
+def get_chat_schema(conn):
+    """Return "compact", "legacy" (chat_history is still a table) or "missing" """
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'chat_history'").fetchone()
+    if row and row[0] == "table":
+        return "legacy"
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_messages'").fetchone()
+    return "compact" if exists else "missing"
+
+def create_compact_schema(conn):
+    """Create chat_messages, its index, and (unless the legacy table is still there) the compat view"""
+    conn.execute(CHAT_MESSAGES_SQL)
+    conn.execute(CHAT_MESSAGES_INDEX_SQL)
+    if get_chat_schema(conn) != "legacy":
+        response = response_sql("m") if has_response_store(conn) else "m.response"
+        conn.execute(CHAT_HISTORY_VIEW_SQL.format(response=response))
+        for sql in CHAT_HISTORY_TRIGGERS_SQL:
+            conn.execute(sql)
+
+def recreate_chat_history_view(conn):
+    """Redefine the compat view (and its triggers) after chat_messages changed shape"""
+    if get_chat_schema(conn) != "legacy":
+        conn.execute("DROP VIEW IF EXISTS chat_history")
+        create_compact_schema(conn)
+
+def migrate_chat_history(database=None, chunk_size=CHAT_MIGRATION_CHUNK_SIZE, pause=CHAT_MIGRATION_PAUSE):
+    """Backfill legacy chat_history into chat_messages and swap in the compat view
+
+    Each chunk is its own short transaction, so processes still running the
+    old code keep reading and writing chat_history between chunks; an
+    interrupted run resumes from the highest id already copied. Returns the
+    number of rows copied (0 when the database is already compact).
+    """
+    database = database or get_database()
+    with database.transaction() as conn:
+        if get_chat_schema(conn) != "legacy":
+            return 0
+        create_compact_schema(conn)
+        copied_up_to = conn.execute("SELECT COALESCE(MAX(id), 0) FROM chat_messages").fetchone()[0]
+
+    copied = 0
+    start = time.monotonic()
+    while True:
+        with database.transaction() as conn:
+            if get_chat_schema(conn) != "legacy":
+                return copied  # another process finished the migration
+            upper = conn.execute(
+                'SELECT MAX(id) FROM (SELECT id FROM chat_history WHERE id > ? ORDER BY id LIMIT ?)',
+                (copied_up_to, chunk_size)).fetchone()[0]
+            if upper is None:
+                break
+            copied += conn.execute(BACKFILL_SQL, (copied_up_to, upper)).rowcount
+            copied_up_to = upper
+        time.sleep(pause)
+
+    # Swap: one write transaction catches up on rows written meanwhile, then replaces the table
+    with database.transaction() as conn:
+        if get_chat_schema(conn) != "legacy":
+            return copied
+        copied += conn.execute(BACKFILL_SQL, (copied_up_to, 2 ** 63 - 1)).rowcount
+        # Rows deleted from the legacy table after their chunk was copied
+        conn.execute('DELETE FROM chat_messages WHERE id NOT IN (SELECT id FROM chat_history)')
+        conn.execute("ALTER TABLE chat_history RENAME TO chat_history_legacy")
+        # Only the rows that could not be copied (usernames without an account) stay behind
+        conn.execute('DELETE FROM chat_history_legacy WHERE id IN (SELECT id FROM chat_messages)')
+        orphans = conn.execute('SELECT COUNT(*) FROM chat_history_legacy').fetchone()[0]
+        if not orphans:
+            conn.execute("DROP TABLE chat_history_legacy")
+        create_compact_schema(conn)
+
+    print(f"✅ Migrated {copied} chat rows to chat_messages in {time.monotonic() - start:.1f}s")
+    if orphans:
+        print(f"⚠️ Kept {orphans} chat rows of unknown users in chat_history_legacy")
+    return copied
+
+def vacuum(database=None):
+    """Rebuild the database file so the space the legacy table freed is returned to the OS"""
+    database = database or get_database()
+    database.execute("VACUUM")
+
+if __name__ == "__main__":
+    import sys
+    migrate_chat_history()
+    if "--vacuum" in sys.argv:
+        vacuum()
+        print("✅ Database vacuumed")
@@ -0,0 +1,123 @@
+"""
+Chat Search Module
+Full-text search over a user's own chat history. chat_messages_fts is an
+external-content FTS5 index over chat_messages (question and answer), kept
+in sync by triggers on insert, update and delete, so deleting a user's
+history removes it from the index too. Every row also carries an owner
+token (u<user_id>), so a search intersects the user's posting list with the
+query's instead of filtering other users' matches afterwards
+"""
+
+import os
+
+from chat_responses import has_response_store, response_sql
+from chat_schema import format_timestamp
+from db import get_database
+from knowledge_index import bm25_score, bm25_sql, fts_terms, query_tokens
+
+CHAT_SEARCH_PAGE_SIZE = int(os.getenv("CHAT_SEARCH_PAGE_SIZE", "10"))
+CHAT_SEARCH_SNIPPET_WORDS = 16
+
+# bm25() column weights: owner, message, response (a match in the question ranks higher)
+BM25_WEIGHTS = (0.0, 2.0, 1.0)
+
+# Created by migration 5 and recreated by migration 7; the view supplies the owner column, which
+# chat_messages does not store. {response_*} read a row's response text (see chat_fts_sql)
+CHAT_FTS_SQL = [
+    '''
+    CREATE VIEW IF NOT EXISTS chat_messages_fts_content AS
+    SELECT m.id, 'u' || m.user_id AS owner, m.message, {response_m} AS response FROM chat_messages m
+    ''',
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+        owner, message, response,
+        content = 'chat_messages_fts_content', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert AFTER INSERT ON chat_messages
+    BEGIN
+        INSERT INTO chat_messages_fts (rowid, owner, message, response)
+        VALUES (NEW.id, 'u' || NEW.user_id, NEW.message, {response_new});
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete AFTER DELETE ON chat_messages
+    BEGIN
+        INSERT INTO chat_messages_fts (chat_messages_fts, rowid, owner, message, response)
+        VALUES ('delete', OLD.id, 'u' || OLD.user_id, OLD.message, {response_old});
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS chat_messages_fts_update AFTER UPDATE ON chat_messages
+    BEGIN
+        INSERT INTO chat_messages_fts (chat_messages_fts, rowid, owner, message, response)
+        VALUES ('delete', OLD.id, 'u' || OLD.user_id, OLD.message, {response_old});
+        INSERT INTO chat_messages_fts (rowid, owner, message, response)
+        VALUES (NEW.id, 'u' || NEW.user_id, NEW.message, {response_new});
+    END
+    ''',
+]
+
+def chat_fts_sql(conn):
+    """CHAT_FTS_SQL for this database: responses are resolved through chat_responses once it exists"""
+    if has_response_store(conn):
+        names = {"response_m": response_sql("m"), "response_new": response_sql("NEW"), "response_old": response_sql("OLD")}
+    else:
+        names = {"response_m": "m.response", "response_new": "NEW.response", "response_old": "OLD.response"}
+    return [sql.format(**names) for sql in CHAT_FTS_SQL]
+
+def create_chat_search_index(conn):
+    """Create the index and its triggers, then index every existing row"""
+    for sql in chat_fts_sql(conn):
+        conn.execute(sql)
+    conn.execute("INSERT INTO chat_messages_fts (chat_messages_fts) VALUES ('rebuild')")
+
+def recreate_chat_search_triggers(conn):
+    """Redefine the content view and triggers after chat_messages changed shape (the index is kept)"""
+    conn.execute("DROP VIEW IF EXISTS chat_messages_fts_content")
+    for trigger in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS chat_messages_fts_{trigger}")
+    for sql in chat_fts_sql(conn):
+        conn.execute(sql)
+
+def build_history_query(query, user_id):
+    """FTS5 MATCH expression for one user's rows containing any query word (by prefix)
+
+    Returns "" when the query has no usable words.
+    """
+    tokens = query_tokens(query)
+    if not tokens:
+        return ""
+    return f'owner : "u{int(user_id)}" AND {{message response}} : ({fts_terms(tokens, prefix=True)})'
+
+def search_chat_history(username, query, page=0, page_size=CHAT_SEARCH_PAGE_SIZE, database=None):
+    """Search one user's chat history, best match first
+
+    Returns (results, has_more) where each result is
+    (id, timestamp, message_snippet, response_snippet, score) with matches
+    wrapped in ** for markdown. page counts from 0.
+    """
+    database = database or get_database()
+    if database.backend != "sqlite":
+        print("⚠️ Chat history search needs the SQLite FTS5 index")
+        return [], False
+    user = database.fetchone('SELECT id FROM users WHERE username = ?', (username,))
+    match = build_history_query(query, user[0]) if user else ""
+    if not match:
+        return [], False
+    # One extra row tells us whether another page exists
+    rows = database.fetchall(f'''
+        SELECT f.rowid, m.created_at,
+               snippet(chat_messages_fts, 1, '**', '**', '...', {CHAT_SEARCH_SNIPPET_WORDS}),
+               snippet(chat_messages_fts, 2, '**', '**', '...', {CHAT_SEARCH_SNIPPET_WORDS}),
+               {bm25_sql("chat_messages_fts", BM25_WEIGHTS)} AS rank
+        FROM chat_messages_fts f JOIN chat_messages m ON m.id = f.rowid
+        WHERE chat_messages_fts MATCH ?
+        ORDER BY rank, f.rowid DESC
+        LIMIT ? OFFSET ?
+    ''', (match, page_size + 1, page * page_size))
+    results = [(row_id, format_timestamp(created_at), message, response, bm25_score(rank))
+               for row_id, created_at, message, response, rank in rows[:page_size]]
+    return results, len(rows) > page_size
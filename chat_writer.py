@@ -0,0 +1,208 @@
+"""
+Chat Writer Module
+Write-behind queue for chat history. save_chat only enqueues the row; a
+background thread drains the bounded queue and group-commits every pending
+row in one transaction per flush interval, so disk latency stays off the
+Streamlit script thread
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from chat_responses import store_responses
+from chat_schema import now_ms
+from db import DB_SYNCHRONOUS, get_database
+
+# Chat writer config from env (with defaults)
+CHAT_WRITE_MODE = os.getenv("CHAT_WRITE_MODE", "async").lower()  # async (write-behind) or sync
+# normal: a crash may lose the last flush interval; full: every group commit is fsync'd
+CHAT_WRITE_DURABILITY = os.getenv("CHAT_WRITE_DURABILITY", "normal").lower()
+CHAT_WRITE_FLUSH_INTERVAL = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", "0.2"))  # seconds a batch may wait
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "200"))  # rows per transaction at most
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "5000"))
+# When the queue is full, wait this long before writing the row synchronously (rows are never dropped)
+CHAT_WRITE_ENQUEUE_TIMEOUT = float(os.getenv("CHAT_WRITE_ENQUEUE_TIMEOUT", "0.5"))
+
+# Resolves the username to users.id in the insert; a row for an unknown user inserts nothing
+# instead of failing (and endlessly retrying) the whole batch. The response is stored by hash
+INSERT_CHAT_SQL = '''
+    INSERT INTO chat_messages (user_id, created_at, conversation_id, message, response, response_hash)
+    SELECT id, ?, ?, ?, '', ? FROM users WHERE username = ?
+'''
+
+class ChatWriter:
+    """Bounded write-behind queue drained by one background group-commit thread"""
+
+    def __init__(self, db_path, mode=CHAT_WRITE_MODE, durability=CHAT_WRITE_DURABILITY,
+                 flush_interval=CHAT_WRITE_FLUSH_INTERVAL, batch_size=CHAT_WRITE_BATCH_SIZE,
+                 queue_size=CHAT_WRITE_QUEUE_SIZE, enqueue_timeout=CHAT_WRITE_ENQUEUE_TIMEOUT):
+        self.db_path = db_path
+        self.mode = mode
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._retry = []  # rows of a failed flush, written first next time
+        self._progress = threading.Condition()
+        self._accepted = 0  # rows handed to the background thread
+        self._done = 0      # rows committed by the background thread
+        self._thread = None
+        self._closed = False
+        self._flush_latencies = deque(maxlen=200)  # seconds
+        self.stats = {
+            "enqueued": 0,
+            "written": 0,
+            "batches": 0,
+            "sync_writes": 0,
+            "queue_full_fallbacks": 0,
+            "errors": 0,
+            "max_queue_depth": 0,
+        }
+
+    def _write_rows(self, rows):
+        """Insert rows in one transaction"""
+        database = get_database(self.db_path)
+        # PostgreSQL commits are durable already; the switch is SQLite's synchronous pragma
+        full = self.durability == "full" and database.backend == "sqlite"
+        if full:
+            # fsync this commit even though the pool default is synchronous=NORMAL
+            database.execute("PRAGMA synchronous = FULL")
+        try:
+            with database.transaction() as conn:
+                hashes = store_responses(conn, [row[3] for row in rows])
+                conn.executemany(INSERT_CHAT_SQL, [row[:3] + (value,) + row[4:] for row, value in zip(rows, hashes)])
+        finally:
+            if full:
+                database.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+
+    def _write_now(self, row):
+        self._write_rows([row])
+        with self._progress:
+            self.stats["sync_writes"] += 1
+            self.stats["written"] += 1
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+            self._thread.start()
+
+    def save(self, username, message, response, conversation_id=None):
+        """Record one chat exchange; returns once it is queued (async) or committed (sync)"""
+        row = (now_ms(), conversation_id, message, response, username)
+        if self.mode != "async" or self._closed:
+            self._write_now(row)
+            return
+        with self._progress:
+            self._ensure_thread()
+            self.stats["enqueued"] += 1
+            self._accepted += 1
+        try:
+            self._queue.put(row, timeout=self.enqueue_timeout)
+        except queue.Full:
+            # Writer cannot keep up: apply back-pressure by writing on the caller's thread
+            with self._progress:
+                self._accepted -= 1
+                self.stats["queue_full_fallbacks"] += 1
+            self._write_now(row)
+            return
+        depth = self._queue.qsize()
+        with self._progress:
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], depth)
+
+    def _collect_batch(self):
+        """Block for the first row, then gather more until the batch is full or the interval ends"""
+        batch = self._retry
+        self._retry = []
+        if not batch:
+            try:
+                batch.append(self._queue.get(timeout=1.0))
+            except queue.Empty:
+                return batch
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                if self._closed:
+                    return
+                continue
+            start = time.monotonic()
+            try:
+                self._write_rows(batch)
+            except Exception as e:
+                print(f"Chat writer flush warning: {e}")
+                with self._progress:
+                    self.stats["errors"] += 1
+                # Keep the rows and retry after a pause; chat history must not be lost
+                self._retry = batch
+                time.sleep(min(5.0, self.flush_interval * 10))
+                continue
+            latency = time.monotonic() - start
+            with self._progress:
+                self._flush_latencies.append(latency)
+                self.stats["batches"] += 1
+                self.stats["written"] += len(batch)
+                self._done += len(batch)
+                self._progress.notify_all()
+
+    def flush(self, timeout=5.0):
+        """Wait until every row queued so far is committed; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        with self._progress:
+            target = self._accepted
+            while self._done < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._progress.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        """Flush pending rows and stop accepting new ones into the queue"""
+        flushed = self.flush(timeout)
+        self._closed = True
+        if not flushed:
+            print(f"⚠️ Chat writer closed with {self._accepted - self._done} rows unflushed")
+        return flushed
+
+    def get_stats(self):
+        """Return counters, current queue depth and flush latency (ms)"""
+        with self._progress:
+            stats = dict(self.stats)
+            latencies = sorted(self._flush_latencies)
+        stats["mode"] = self.mode
+        stats["durability"] = self.durability
+        stats["queue_depth"] = self._queue.qsize() + len(self._retry)
+        if latencies:
+            stats["flush_ms_p50"] = round(latencies[len(latencies) // 2] * 1000, 2)
+            stats["flush_ms_p95"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 2)
+            batched = stats["written"] - stats["sync_writes"]
+            stats["rows_per_batch"] = round(batched / stats["batches"], 1) if stats["batches"] else 0.0
+        return stats
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_chat_writer(db_path):
+    """Return the process-wide writer for a database, flushed automatically at exit"""
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _writers[db_path] = ChatWriter(db_path)
+            atexit.register(writer.close)
+        return writer
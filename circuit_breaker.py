@@ -0,0 +1,170 @@
+"""
+Circuit Breaker Module
+Tracks the recent error rate and latency of an upstream dependency, retries
+transient failures with jittered backoff, and fails fast once the upstream is
+degraded so callers can answer from a local fallback instead of waiting
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Breaker config from env (with defaults)
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))  # recent calls considered
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))  # calls needed before the breaker may trip
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))  # failure ratio that trips the breaker
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "15"))  # slower successes count as failures
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))  # cool-down before a half-open probe
+BREAKER_MAX_RETRIES = int(os.getenv("BREAKER_MAX_RETRIES", "2"))
+BREAKER_BACKOFF_BASE = float(os.getenv("BREAKER_BACKOFF_BASE", "0.5"))  # seconds
+BREAKER_BACKOFF_CAP = float(os.getenv("BREAKER_BACKOFF_CAP", "4"))  # seconds
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised when the breaker rejects a call without contacting the upstream"""
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a sliding window of recent calls"""
+
+    def __init__(self, name="upstream", window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 error_rate=BREAKER_ERROR_RATE, slow_call_seconds=BREAKER_SLOW_CALL_SECONDS,
+                 open_seconds=BREAKER_OPEN_SECONDS, max_retries=BREAKER_MAX_RETRIES,
+                 backoff_base=BREAKER_BACKOFF_BASE, backoff_cap=BREAKER_BACKOFF_CAP):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)   # True = failure
+        self._latencies = deque(maxlen=window)  # seconds
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats = {
+            "calls": 0,
+            "failures": 0,
+            "retries": 0,
+            "rejected": 0,
+            "trips": 0,
+        }
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow_request(self):
+        """Return True if a call may go upstream now (claims the probe slot when half-open)"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self, latency):
+        """Record a completed call; slow successes count against the upstream"""
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            self.stats["calls"] += 1
+            self._latencies.append(latency)
+            if self._state == HALF_OPEN:
+                if slow:
+                    self._trip()
+                else:
+                    # Probe succeeded: close and start with a clean window
+                    print(f"🟢 Circuit '{self.name}' closed after successful probe")
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                self._probe_in_flight = False
+                return
+            self._outcomes.append(slow)
+            self._maybe_trip()
+
+    def record_failure(self, latency):
+        """Record a failed call"""
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["failures"] += 1
+            self._latencies.append(latency)
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._trip()
+                return
+            self._outcomes.append(True)
+            self._maybe_trip()
+
+    def _maybe_trip(self):
+        if self._state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        failures = sum(1 for failed in self._outcomes if failed)
+        if failures / len(self._outcomes) >= self.error_rate:
+            self._trip()
+
+    def _trip(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self.stats["trips"] += 1
+        print(f"🔴 Circuit '{self.name}' opened for {self.open_seconds:g}s")
+
+    def backoff_delay(self, attempt):
+        """Full-jitter exponential backoff delay for the given retry attempt"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def call(self, fn, is_retryable=None, defer_success=False):
+        """Run fn() through the breaker, retrying transient failures with jittered backoff
+
+        Raises CircuitOpenError without calling fn when the breaker is open.
+        is_retryable(exception) decides whether a failure may be retried.
+        With defer_success, a successful fn() is not recorded: the caller
+        records the call's one outcome when the work fn started is over.
+        """
+        for attempt in range(self.max_retries + 1):
+            if not self.allow_request():
+                raise CircuitOpenError(f"Circuit '{self.name}' is open")
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                self.record_failure(time.monotonic() - start)
+                retryable = is_retryable(e) if is_retryable is not None else True
+                if attempt >= self.max_retries or not retryable:
+                    raise
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(self.backoff_delay(attempt))
+                continue
+            if not defer_success:
+                self.record_success(time.monotonic() - start)
+            return result
+
+    def get_stats(self):
+        """Return the state, counters, recent error rate and latency percentiles"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["state"] = self._current_state(time.monotonic())
+            outcomes = list(self._outcomes)
+            latencies = sorted(self._latencies)
+        stats["recent_error_rate"] = sum(outcomes) / len(outcomes) if outcomes else 0.0
+        if latencies:
+            stats["latency_p50"] = latencies[len(latencies) // 2]
+            stats["latency_p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return stats
@@ -0,0 +1,211 @@
+"""
+Database Module
+Process-wide SQLite connection manager. Each thread reuses one long-lived
+connection per database file (WAL journal, busy timeout, tuned pragmas and a
+statement cache) instead of connecting on every call. Connections run in
+autocommit mode; writes go through transaction(), so readers never hold a
+transaction open and, under WAL, never block the chat writer.
+A postgresql:// DATABASE_URL selects the pooled PostgreSQL backend in
+db_postgres.py instead, which offers the same interface
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: BEGIN IMMEDIATE still serializes migration steps themselves
+    fcntl = None
+
+# SQLite tuning from env (with defaults)
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))  # wait this long for a write lock
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").upper()  # NORMAL is durable enough under WAL
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))  # page cache per connection
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))  # bytes of the file read via mmap
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "128"))  # prepared statements kept per connection
+
+DEFAULT_DATABASE_URL = "sqlite:///stunting_assistant.db"
+DEFAULT_DB_FILE = "stunting_assistant.db"
+POSTGRES_SCHEMES = ("postgresql://", "postgres://")
+
+def is_postgres_url(database_url):
+    return database_url.startswith(POSTGRES_SCHEMES)
+
+def resolve_db_path(database_url=None):
+    """Resolve SQLite database file path from DATABASE_URL env.
+
+    Supported forms:
+    - sqlite:///relative/path.db
+    - sqlite:////absolute/path.db
+    - stunting_assistant.db (fallback when scheme unsupported)
+    """
+    if database_url is None:
+        database_url = os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
+
+    if database_url.startswith("sqlite:////"):
+        path = database_url[len("sqlite:////"):]
+        return "/" + path if not path.startswith("/") else path
+    if database_url.startswith("sqlite:///"):
+        path = database_url[len("sqlite:///"):]
+        return path if path else DEFAULT_DB_FILE
+    # Fallback: if user supplied a plain filename, respect it; otherwise default
+    if database_url.endswith(".db") and "://" not in database_url:
+        return database_url
+    return DEFAULT_DB_FILE
+
+def resolve_database_target(database_url=None):
+    """Return what get_database() should open: the DATABASE_URL itself for
+    PostgreSQL, otherwise the SQLite file path from resolve_db_path()"""
+    if database_url is None:
+        database_url = os.getenv("DATABASE_URL", DEFAULT_DATABASE_URL)
+    if is_postgres_url(database_url):
+        return database_url
+    return resolve_db_path(database_url)
+
+class _FileLock:
+    """Exclusive flock on a file, held across processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+class Database:
+    """Thread-local pool of tuned SQLite connections to one database file"""
+
+    backend = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []  # (owner thread, connection)
+        # Bumped by close_all() so threads holding a closed connection reconnect
+        self._generation = 0
+        self.stats = {"connections_opened": 0, "transactions": 0}
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000.0,
+            isolation_level=None,  # autocommit; transaction() issues BEGIN/COMMIT explicitly
+            check_same_thread=False,  # only so close_all() may close it from another thread
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+        )
+        conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        with self._lock:
+            # Streamlit reruns scripts on fresh threads: close connections of finished threads
+            alive = []
+            for owner, other in self._connections:
+                if owner.is_alive():
+                    alive.append((owner, other))
+                else:
+                    other.close()
+            alive.append((threading.current_thread(), conn))
+            self._connections = alive
+            self.stats["connections_opened"] += 1
+        return conn
+
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        local = self._local
+        if getattr(local, "conn", None) is None or local.generation != self._generation:
+            local.conn = self._open()
+            local.generation = self._generation
+        return local.conn
+
+    def execute(self, sql, params=()):
+        """Run one statement in autocommit mode and return its rowcount (like PostgresDatabase)"""
+        return self.connection().execute(sql, params).rowcount
+
+    def fetchone(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchall()
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        """Run a block in one transaction: commit on success, roll back on error
+
+        BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+        queue on busy_timeout instead of failing with "database is locked" at
+        COMMIT. Nested calls join the outer transaction.
+        """
+        conn = self.connection()
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        with self._lock:
+            self.stats["transactions"] += 1
+
+    def schema_version(self):
+        """Return the PRAGMA user_version (0 before the first migration)"""
+        return self.fetchone("PRAGMA user_version")[0]
+
+    def set_schema_version(self, conn, version):
+        """Record a migration version inside the caller's transaction"""
+        conn.execute(f"PRAGMA user_version = {int(version)}")
+
+    def migration_lock(self):
+        """Lock held while migrations run, so worker processes take turns"""
+        return _FileLock(self.path + ".migrate.lock")
+
+    def close_all(self):
+        """Close every connection opened by any thread (e.g. before deleting the file)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for _, conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                print(f"Database close warning: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["open_connections"] = len(self._connections)
+        return stats
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+def get_database(path=None):
+    """Return the process-wide Database for a SQLite file or PostgreSQL URL (defaults to DATABASE_URL)"""
+    if path is None:
+        path = resolve_database_target()
+    with _databases_lock:
+        database = _databases.get(path)
+        if database is None:
+            if is_postgres_url(path):
+                from db_postgres import PostgresDatabase
+                database = PostgresDatabase(path)
+            else:
+                database = Database(path)
+            _databases[path] = database
+        return database
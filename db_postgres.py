@@ -0,0 +1,189 @@
+"""
+PostgreSQL Database Module
+Backend for multi-node deployments, selected by a postgresql:// DATABASE_URL.
+It offers the same interface as db.Database on top of a bounded psycopg
+connection pool shared by every thread. Callers keep writing SQLite-style ?
+placeholders (translated once per statement), and statements that repeat
+are prepared server-side
+"""
+
+import os
+import re
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:  # optional: only needed when DATABASE_URL is postgresql://
+    ConnectionPool = None
+
+# Pool config from env (with defaults)
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))  # connections per app node
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+# Executions of a statement before psycopg prepares it server-side; "none" turns preparing off (e.g. behind pgbouncer)
+DB_PREPARE_THRESHOLD = os.getenv("DB_PREPARE_THRESHOLD", "1")
+
+# pg_advisory_lock id every app node takes while running migrations
+MIGRATION_LOCK_ID = 7_246_011
+
+_QUOTED_OR_MARKER = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\?|%")
+
+@lru_cache(maxsize=512)
+def translate_placeholders(sql):
+    """Rewrite ? placeholders as psycopg's %s, leaving ? inside quoted text alone
+
+    Literal % signs are doubled everywhere, since psycopg reads any % in a
+    query that has parameters as the start of a placeholder.
+    """
+    def replace(match):
+        token = match.group(0)
+        if token == "?":
+            return "%s"
+        return token.replace("%", "%%")
+    return _QUOTED_OR_MARKER.sub(replace, sql)
+
+class PostgresConnection:
+    """A pooled psycopg connection that accepts the app's ? placeholders"""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def execute(self, sql, params=()):
+        # Always pass a sequence: with params=None psycopg would not unescape %%
+        return self.raw.execute(translate_placeholders(sql), tuple(params))
+
+    def executemany(self, sql, rows):
+        cursor = self.raw.cursor()
+        cursor.executemany(translate_placeholders(sql), rows)
+        return cursor
+
+class PostgresDatabase:
+    """Bounded pool of PostgreSQL connections with the db.Database interface"""
+
+    backend = "postgres"
+
+    def __init__(self, url, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE, timeout=DB_POOL_TIMEOUT):
+        if ConnectionPool is None:
+            raise RuntimeError("The PostgreSQL backend needs psycopg and psycopg-pool (pip install -r requirements.txt)")
+        self.url = url
+        self.path = url  # registry and schema-cache key, like Database.path
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._local = threading.local()  # connection of the transaction this thread is in
+        self._lock = threading.Lock()
+        self._pool = None
+        self.stats = {"transactions": 0}
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                prepare_threshold = None if DB_PREPARE_THRESHOLD.lower() == "none" else int(DB_PREPARE_THRESHOLD)
+                self._pool = ConnectionPool(
+                    self.url,
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    timeout=self.timeout,
+                    kwargs={"autocommit": True, "prepare_threshold": prepare_threshold},
+                    name="stunting-assistant",
+                    open=True,
+                )
+            return self._pool
+
+    @contextmanager
+    def _connection(self):
+        """This thread's transaction connection, or one borrowed from the pool for a single call"""
+        current = getattr(self._local, "conn", None)
+        if current is not None:
+            yield current
+            return
+        with self._get_pool().connection() as conn:
+            yield PostgresConnection(conn)
+
+    def execute(self, sql, params=()):
+        """Run one statement in autocommit mode and return its rowcount
+
+        Not the cursor: its connection goes back to the pool when this
+        returns and may already belong to another thread.
+        """
+        with self._connection() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def fetchone(self, sql, params=()):
+        with self._connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self._connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        """Run a block in one transaction on one pooled connection: commit on success, roll back on error
+
+        immediate has no PostgreSQL equivalent (row locks are taken as rows
+        are written); it is accepted for interface parity. Nested calls join
+        the outer transaction.
+        """
+        current = getattr(self._local, "conn", None)
+        if current is not None:
+            yield current
+            return
+        with self._get_pool().connection() as raw:
+            conn = PostgresConnection(raw)
+            self._local.conn = conn
+            try:
+                with raw.transaction():
+                    yield conn
+            finally:
+                self._local.conn = None
+        with self._lock:
+            self.stats["transactions"] += 1
+
+    def schema_version(self):
+        """Return the recorded migration version (0 before the first migration)"""
+        if self.fetchone("SELECT to_regclass('schema_version')")[0] is None:
+            return 0
+        row = self.fetchone("SELECT version FROM schema_version")
+        return row[0] if row else 0
+
+    def set_schema_version(self, conn, version):
+        """Record a migration version inside the caller's transaction"""
+        conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        conn.execute("DELETE FROM schema_version")
+        conn.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+
+    @contextmanager
+    def migration_lock(self):
+        """Advisory lock held while migrations run, so app nodes take turns"""
+        with self._get_pool().connection() as conn:
+            conn.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            try:
+                yield self
+            finally:
+                conn.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+
+    def close_all(self):
+        """Close the pool; the next call opens a new one"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            try:
+                pool.close()
+            except Exception as e:
+                print(f"Database close warning: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            pool = self._pool
+        if pool is not None:
+            pool_stats = pool.get_stats()
+            stats["open_connections"] = pool_stats.get("pool_size", 0)
+            stats["requests_waiting"] = pool_stats.get("requests_waiting", 0)
+            stats["requests_queued"] = pool_stats.get("requests_queued", 0)
+        else:
+            stats["open_connections"] = 0
+        return stats
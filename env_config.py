@@ -0,0 +1,14 @@
+"""
+Env Config Module
+Parsing helpers shared by the modules that read their settings from the
+environment
+"""
+
+import os
+
+def env_flag(name, default=True):
+    """On/off setting: unset gives default, and anything but 0/false/no (any case) is on"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() not in ("0", "false", "no")
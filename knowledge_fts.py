@@ -0,0 +1,172 @@
+"""
+Knowledge FTS Module
+Mirrors the knowledge packs into an SQLite FTS5 table in the app database so
+every worker process shares one persistent search index. Queries run as
+indexed MATCH lookups ranked with bm25() and highlighted with snippet().
+Entries are reindexed incrementally by content hash; the tables themselves
+are created by a migration
+"""
+
+import hashlib
+import os
+import threading
+
+from db import get_database
+from knowledge_index import (TITLE_WEIGHT, SNIPPET_WORDS, bm25_score, bm25_sql, fts_terms, plain_text, query_tokens,
+                             stem, tokenize)
+from knowledge_pack import get_knowledge_base
+
+# Search backend for search_knowledge: "memory" (BM25 over the pack) or "fts" (SQLite FTS5)
+KNOWLEDGE_SEARCH_BACKEND = os.getenv("KNOWLEDGE_SEARCH_BACKEND", "memory").lower()
+
+# Bump when the indexed columns or their derivation change, to force a full reindex
+FTS_INDEX_FORMAT = 1
+LANGUAGES = ("indonesian", "english")
+
+# bm25() column weights: title, content, terms
+BM25_WEIGHTS = (2.0, 1.0, 1.0)
+
+# Created by a versioned migration (see create_knowledge_fts_tables)
+KNOWLEDGE_FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts USING fts5(
+        title, content, terms,
+        language UNINDEXED, category UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+'''
+KNOWLEDGE_FTS_ENTRIES_SQL = '''
+    CREATE TABLE IF NOT EXISTS knowledge_fts_entries (
+        language TEXT NOT NULL,
+        category TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        fts_rowid INTEGER NOT NULL,
+        PRIMARY KEY (language, category)
+    )
+'''
+
+def create_knowledge_fts_tables(conn):
+    """The FTS5 table plus the content hash of every indexed entry (SQLite)"""
+    conn.execute(KNOWLEDGE_FTS_TABLE_SQL)
+    conn.execute(KNOWLEDGE_FTS_ENTRIES_SQL)
+
+def _index_terms(info):
+    """Stemmed title, content and keywords: the column that makes matching bilingual"""
+    text = " ".join([info["title"]] * TITLE_WEIGHT + [info["content"]] + info["keywords"])
+    return " ".join(stem(token) for token in tokenize(text))
+
+def content_hash(info):
+    """Hash of everything an entry contributes to the index"""
+    raw = "\x1f".join([str(FTS_INDEX_FORMAT), info["title"], info["content"], "\x1e".join(info["keywords"])])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def build_match_query(query):
+    """Turn a free-text question into an FTS5 MATCH expression
+
+    Stems match the stemmed terms column (so "pencegahan" finds "mencegah"),
+    and word prefixes match title/content so snippet() has hits to highlight.
+    Returns "" when the query has no usable words.
+    """
+    tokens = query_tokens(query)
+    if not tokens:
+        return ""
+    stem_terms = fts_terms(stem(token) for token in tokens)
+    return f"terms : ({stem_terms}) OR {{title content}} : ({fts_terms(tokens, prefix=True)})"
+
+class KnowledgeFTS:
+    """FTS5 mirror of the knowledge packs in an SQLite database"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._synced_version = None
+
+    def _database(self):
+        return get_database(self.db_path)
+
+    def sync(self, version=None):
+        """Bring the FTS table in line with the packs, touching only changed entries
+
+        Returns counts of added, updated, removed and unchanged entries.
+        """
+        counts = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        with self._lock:
+            if version is not None and version == self._synced_version:
+                return counts
+            # BEGIN IMMEDIATE serializes concurrent syncs from several worker processes
+            with self._database().transaction() as conn:
+                for language in LANGUAGES:
+                    existing = {
+                        category: (digest, rowid) for category, digest, rowid in conn.execute(
+                            'SELECT category, content_hash, fts_rowid FROM knowledge_fts_entries WHERE language = ?',
+                            (language,))
+                    }
+                    for category, info in get_knowledge_base(language).items():
+                        digest = content_hash(info)
+                        previous = existing.pop(category, None)
+                        if previous and previous[0] == digest:
+                            counts["unchanged"] += 1
+                            continue
+                        if previous:
+                            conn.execute('DELETE FROM knowledge_fts WHERE rowid = ?', (previous[1],))
+                        cursor = conn.execute(
+                            'INSERT INTO knowledge_fts (title, content, terms, language, category) VALUES (?, ?, ?, ?, ?)',
+                            (info["title"], plain_text(info["content"]), _index_terms(info), language, category))
+                        conn.execute(
+                            'INSERT OR REPLACE INTO knowledge_fts_entries (language, category, content_hash, fts_rowid) '
+                            'VALUES (?, ?, ?, ?)', (language, category, digest, cursor.lastrowid))
+                        counts["updated" if previous else "added"] += 1
+                    # Entries that no longer exist in the pack
+                    for category, (_, rowid) in existing.items():
+                        conn.execute('DELETE FROM knowledge_fts WHERE rowid = ?', (rowid,))
+                        conn.execute('DELETE FROM knowledge_fts_entries WHERE language = ? AND category = ?',
+                                     (language, category))
+                        counts["removed"] += 1
+            self._synced_version = version
+        if counts["added"] or counts["updated"] or counts["removed"]:
+            print(f"✅ Knowledge FTS reindexed: {counts}")
+        return counts
+
+    def search(self, query, language, top_k=5):
+        """Return [(category, title, snippet, score), ...] best first (higher score is better)"""
+        match = build_match_query(query)
+        if not match:
+            return []
+        rows = self._database().fetchall(f'''
+            SELECT category, title,
+                   snippet(knowledge_fts, 1, '**', '**', '...', {SNIPPET_WORDS}),
+                   {bm25_sql("knowledge_fts", BM25_WEIGHTS)} AS rank
+            FROM knowledge_fts
+            WHERE knowledge_fts MATCH ? AND language = ?
+            ORDER BY rank
+            LIMIT ?
+        ''', (match, language, top_k))
+        return [(category, title, snippet, bm25_score(rank)) for category, title, snippet, rank in rows]
+
+_shared_index = None
+_shared_lock = threading.Lock()
+
+def get_knowledge_fts():
+    """Return the process-wide FTS index on the app database, synced on first use
+
+    The app database must already be migrated; a search never creates or
+    migrates one. Raises RuntimeError on PostgreSQL or before the migration.
+    """
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            from knowledge_pack import get_knowledge_version
+            database = get_database()
+            if database.backend != "sqlite":
+                raise RuntimeError("the knowledge FTS index needs an SQLite DATABASE_URL")
+            if not database.fetchone("SELECT 1 FROM sqlite_master WHERE name = 'knowledge_fts'"):
+                raise RuntimeError("knowledge_fts does not exist yet; apply the migrations first")
+            index = KnowledgeFTS(database.path)
+            index.sync(get_knowledge_version())
+            _shared_index = index
+        return _shared_index
+
+def clear_knowledge_fts():
+    """Forget the shared index, so the next search re-syncs it (after a pack reload or a database reset)"""
+    global _shared_index
+    with _shared_lock:
+        _shared_index = None
@@ -0,0 +1,295 @@
+"""
+Knowledge Index Module
+Shared tokenizer, light bilingual stemmer, inverted keyword index and BM25
+search index for the stunting knowledge base. Indexes are built once at load
+time, so a lookup costs a pass over the query tokens regardless of how many
+topics the knowledge base holds
+"""
+
+import heapq
+import math
+import re
+
+# Domain words present in nearly every question: weak evidence for any one section
+GENERIC_KEYWORDS = {"stunting", "bagaimana", "how to", "help", "bantu", "intervensi", "intervention"}
+GENERIC_WEIGHT = 0.25
+
+# Question words and function words: they neither support nor weaken a match
+STOPWORDS = {
+    # Indonesian
+    "apa", "apakah", "itu", "ini", "yang", "di", "ke", "dari", "dan", "atau", "untuk", "pada",
+    "dengan", "saya", "aku", "kami", "kita", "anda", "adalah", "ada", "bisa", "dapat", "harus",
+    "cara", "tentang", "dong", "ya", "tolong", "mohon", "jelaskan", "sih", "kah", "nya",
+    # English
+    "what", "is", "are", "the", "a", "an", "of", "to", "in", "on", "for", "and", "or", "my", "i",
+    "me", "we", "you", "your", "can", "could", "should", "do", "does", "about", "please", "tell",
+    "explain", "with", "it", "its", "this", "that",
+}
+
+# Affixes stripped by the stemmer (longest first)
+_ID_PREFIXES = ("meng", "meny", "peng", "peny", "mem", "men", "pem", "pen", "ber", "ter", "me", "pe", "di", "ke")
+_ID_SUFFIXES = ("kan", "nya", "an", "i")
+_EN_SUFFIXES = ("ing", "ment", "ion", "ed", "s")
+MIN_STEM_LENGTH = 3
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+def query_tokens(query):
+    """Tokens of a search query; function words only count when the query has nothing else"""
+    tokens = tokenize(query)
+    return [token for token in tokens if token not in STOPWORDS] or tokens
+
+def _strip_suffix(word, suffixes):
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            if suffix == "s" and word.endswith("ss"):
+                continue
+            return word[:-len(suffix)]
+    return word
+
+def stem(token):
+    """Reduce a token to a crude stem shared by its Indonesian and English inflections
+
+    Not linguistically exact: it only has to map "mencegah"/"pencegahan"/"cegah"
+    and "causes"/"cause"/"causing" onto the same key.
+    """
+    word = token
+    for prefix in _ID_PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= MIN_STEM_LENGTH + 1:
+            word = word[len(prefix):]
+            break
+    word = _strip_suffix(word, _ID_SUFFIXES)
+    word = _strip_suffix(word, _EN_SUFFIXES)
+    if word.endswith("e") and len(word) > MIN_STEM_LENGTH:
+        word = word[:-1]
+    return word
+
+def stem_tokens(text):
+    """Tokenize and stem text"""
+    return [stem(token) for token in tokenize(text)]
+
+def build_keyword_index(knowledge_base):
+    """Build an inverted index: stemmed keyword phrase -> [(category, weight), ...]
+
+    Keywords shared by several categories are weighted down (1 / number of
+    categories), and generic domain words get GENERIC_WEIGHT.
+    """
+    document_frequency = {}
+    for info in knowledge_base.values():
+        for keyword in set(info["keywords"]):
+            document_frequency[keyword] = document_frequency.get(keyword, 0) + 1
+
+    postings = {}
+    max_phrase_length = 1
+    for category, info in knowledge_base.items():
+        for keyword in set(info["keywords"]):
+            phrase = tuple(stem_tokens(keyword))
+            if not phrase:
+                continue
+            weight = GENERIC_WEIGHT if keyword in GENERIC_KEYWORDS else 1.0 / document_frequency[keyword]
+            entries = postings.setdefault(phrase, {})
+            # Two keywords may stem to the same phrase; keep the stronger weight
+            entries[category] = max(entries.get(category, 0.0), weight)
+            max_phrase_length = max(max_phrase_length, len(phrase))
+
+    return {
+        "postings": {phrase: sorted(entries.items()) for phrase, entries in postings.items()},
+        "max_phrase_length": max_phrase_length,
+        "categories": list(knowledge_base.keys()),
+    }
+
+def match_categories(index, message):
+    """Match a message against the index in one pass over its tokens
+
+    Returns (tokens, ranked) where ranked is [(category, score, covered_positions), ...]
+    for every category with at least one hit, best first. Each distinct keyword
+    phrase counts once per message.
+    """
+    tokens = tokenize(message)
+    stems = [stem(token) for token in tokens]
+    postings = index["postings"]
+    scores = {}
+    covered = {}
+    seen_phrases = set()
+
+    for start in range(len(stems)):
+        for length in range(1, index["max_phrase_length"] + 1):
+            if start + length > len(stems):
+                break
+            phrase = tuple(stems[start:start + length])
+            entries = postings.get(phrase)
+            if not entries:
+                continue
+            positions = range(start, start + length)
+            first_hit = phrase not in seen_phrases
+            seen_phrases.add(phrase)
+            for category, weight in entries:
+                if first_hit:
+                    scores[category] = scores.get(category, 0.0) + weight * length
+                covered.setdefault(category, set()).update(positions)
+
+    # Stable tie-break on knowledge base order
+    order = {category: position for position, category in enumerate(index["categories"])}
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], order[item[0]]))
+    return tokens, [(category, score, covered[category]) for category, score in ranked]
+
+def rank_categories(index, message):
+    """Return [(category, score), ...] for the message, best first"""
+    _, ranked = match_categories(index, message)
+    return [(category, score) for category, score, _ in ranked]
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+TITLE_WEIGHT = 2  # title terms count this many times towards term frequency
+SNIPPET_WORDS = 30
+
+def plain_text(content):
+    """Collapse a knowledge entry's markdown into single-spaced plain text for snippets"""
+    text = content.replace("**", "")
+    return " ".join(text.split())
+
+def _describe_document(category, info, length):
+    """Search index entry of one topic: BM25 length plus the plain text and word spans snippets need"""
+    plain = plain_text(info["content"])
+    return {
+        "category": category,
+        "title": info["title"],
+        "length": length,
+        "plain": plain,
+        # (start, end, stem) for every word, used to pick and highlight snippets
+        "spans": [(m.start(), m.end(), stem(m.group().lower())) for m in _TOKEN_PATTERN.finditer(plain)],
+    }
+
+def _inverse_document_frequencies(postings, count):
+    return {
+        term: math.log(1 + (count - len(entries) + 0.5) / (len(entries) + 0.5))
+        for term, entries in postings.items()
+    }
+
+def build_search_index(knowledge_base):
+    """Precompute BM25 term statistics and snippet text for a knowledge base"""
+    documents = []
+    postings = {}
+    total_length = 0
+
+    for category, info in knowledge_base.items():
+        terms = stem_tokens(info["title"]) * TITLE_WEIGHT
+        terms += stem_tokens(info["content"])
+        for keyword in info["keywords"]:
+            terms += stem_tokens(keyword)
+
+        frequencies = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        doc_id = len(documents)
+        for term, frequency in frequencies.items():
+            postings.setdefault(term, []).append((doc_id, frequency))
+
+        documents.append(_describe_document(category, info, len(terms)))
+        total_length += len(terms)
+
+    count = len(documents)
+    return {
+        "documents": documents,
+        "postings": postings,
+        "idf": _inverse_document_frequencies(postings, count),
+        "avg_length": total_length / count if count else 0.0,
+    }
+
+def compact_search_index(index):
+    """The stored form of a search index: postings and document lengths only
+
+    Snippet text, word spans and idf follow from the knowledge base and the
+    postings, so expand_search_index rebuilds them on load.
+    """
+    return {
+        "lengths": [document["length"] for document in index["documents"]],
+        "postings": index["postings"],
+        "avg_length": index["avg_length"],
+    }
+
+def expand_search_index(compact, knowledge_base):
+    """Inverse of compact_search_index, given the knowledge base it was built from"""
+    documents = [_describe_document(category, info, length)
+                 for (category, info), length in zip(knowledge_base.items(), compact["lengths"])]
+    return {
+        "documents": documents,
+        "postings": compact["postings"],
+        "idf": _inverse_document_frequencies(compact["postings"], len(documents)),
+        "avg_length": compact["avg_length"],
+    }
+
+def make_snippet(document, query_terms, size=SNIPPET_WORDS):
+    """Pick the window of words with the most query hits and bold the hits"""
+    spans = document["spans"]
+    plain = document["plain"]
+    if not spans:
+        return plain
+
+    hits = [1 if span[2] in query_terms else 0 for span in spans]
+    window = min(size, len(spans))
+    current = sum(hits[:window])
+    best_start, best_hits = 0, current
+    for start in range(1, len(spans) - window + 1):
+        current += hits[start + window - 1] - hits[start - 1]
+        if current > best_hits:
+            best_start, best_hits = start, current
+
+    chosen = spans[best_start:best_start + window]
+    pieces = []
+    cursor = chosen[0][0]
+    for start, end, term in chosen:
+        pieces.append(plain[cursor:start])
+        word = plain[start:end]
+        pieces.append(f"**{word}**" if term in query_terms else word)
+        cursor = end
+    snippet = "".join(pieces)
+    if best_start > 0:
+        snippet = "..." + snippet
+    if best_start + window < len(spans):
+        snippet += "..."
+    return snippet
+
+def search_index(index, query, top_k=5):
+    """Rank documents for the query with BM25; cost grows with the query terms' postings only
+
+    Returns [(document, score, query_terms), ...] best first.
+    """
+    query_terms = {stem(token) for token in query_tokens(query)}
+    scores = {}
+    avg_length = index["avg_length"] or 1.0
+    documents = index["documents"]
+
+    for term in query_terms:
+        entries = index["postings"].get(term)
+        if not entries:
+            continue
+        idf = index["idf"][term]
+        for doc_id, frequency in entries:
+            length_norm = 1 - BM25_B + BM25_B * documents[doc_id]["length"] / avg_length
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+
+    best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+    return [(documents[doc_id], score, query_terms) for doc_id, score in best]
+
+# SQLite FTS5 ranking, shared by the knowledge and chat history indexes
+def fts_terms(words, prefix=False):
+    """OR of FTS5 terms, optionally as prefix queries
+
+    Tokens are word characters only, so double-quoting them is enough to escape FTS5 syntax.
+    """
+    return " OR ".join(f'"{word}"{"*" if prefix else ""}' for word in sorted(set(words)))
+
+def bm25_sql(table, weights):
+    """bm25() expression with per-column weights; ORDER BY it ascending for best first"""
+    return f"bm25({table}, {', '.join(str(weight) for weight in weights)})"
+
+def bm25_score(rank):
+    """Score for a bm25() rank that sorts like search_index scores (higher is better)"""
+    # bm25() is lower-is-better
+    return -rank
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Knowledge Pack Module
+Compiles the YAML knowledge sources in knowledge/ into one compact JSON pack
+per language (dedented content, keyword index, BM25 postings and
+retrieval passages) and loads each pack lazily on first use. The pack
+version is a hash of the sources, so caches keyed on it invalidate when the
+knowledge changes
+
+Usage:
+    python knowledge_pack.py          # rebuild the packs after editing knowledge/*.yaml
+    python knowledge_pack.py --check  # exit 1 when the packs are stale
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+
+from knowledge_index import build_keyword_index, build_search_index, compact_search_index, expand_search_index
+
+KNOWLEDGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge")
+PACK_FORMAT = 2
+
+# language -> YAML source file in KNOWLEDGE_DIR
+SOURCES = {
+    "indonesian": "stunting_id.yaml",
+    "english": "stunting_en.yaml",
+}
+MANIFEST_FILE = "pack_manifest.json"
+
+def pack_file(language):
+    return f"pack_{language}.json"
+
+def _read_bytes(path):
+    with open(path, "rb") as source:
+        return source.read()
+
+def compute_version(knowledge_dir=KNOWLEDGE_DIR):
+    """Hash every source file; the short digest is the knowledge version"""
+    digest = hashlib.sha256()
+    for language in sorted(SOURCES):
+        digest.update(language.encode("utf-8"))
+        digest.update(_read_bytes(os.path.join(knowledge_dir, SOURCES[language])))
+    return digest.hexdigest()[:16]
+
+def load_source(language, knowledge_dir=KNOWLEDGE_DIR):
+    """Parse one YAML source into {"fallback", "topics"}"""
+    import yaml  # only needed to (re)build packs
+    with open(os.path.join(knowledge_dir, SOURCES[language]), encoding="utf-8") as source:
+        data = yaml.safe_load(source)
+    topics = {}
+    for category, info in data["topics"].items():
+        topics[category] = {
+            "title": info["title"],
+            "content": info["content"].strip(),
+            "keywords": [keyword.lower() for keyword in info["keywords"]],
+        }
+    return {"fallback": data["fallback"].strip(), "topics": topics}
+
+def compile_pack(language, version, knowledge_dir=KNOWLEDGE_DIR):
+    """Compile one language's source into a pack dict"""
+    # Imported here: knowledge_retrieval pulls in numpy, which only the build needs
+    from knowledge_retrieval import split_passages
+
+    source = load_source(language, knowledge_dir)
+    topics = source["topics"]
+    keyword_index = build_keyword_index(topics)
+    return {
+        "format": PACK_FORMAT,
+        "version": version,
+        "language": language,
+        "fallback": source["fallback"],
+        "topics": topics,
+        "keyword_index": {
+            # JSON has no tuple keys: store postings as [phrase, entries] pairs
+            "postings": [[list(phrase), entries] for phrase, entries in keyword_index["postings"].items()],
+            "max_phrase_length": keyword_index["max_phrase_length"],
+            "categories": keyword_index["categories"],
+        },
+        # Only the postings are stored; snippet text and spans are cheap to derive and would triple the pack
+        "search_index": compact_search_index(build_search_index(topics)),
+        "passages": split_passages(topics),
+    }
+
+def build_packs(knowledge_dir=KNOWLEDGE_DIR):
+    """Compile every language and write the packs plus the manifest; returns the version"""
+    version = compute_version(knowledge_dir)
+    manifest = {"format": PACK_FORMAT, "version": version, "packs": {}}
+    for language in SOURCES:
+        pack = compile_pack(language, version, knowledge_dir)
+        path = os.path.join(knowledge_dir, pack_file(language))
+        with open(path, "w", encoding="utf-8") as output:
+            json.dump(pack, output, ensure_ascii=False, separators=(",", ":"))
+        manifest["packs"][language] = pack_file(language)
+        print(f"✅ {language}: {len(pack['topics'])} topics, {len(pack['passages'])} passages, "
+              f"{os.path.getsize(path) // 1024} KB")
+    with open(os.path.join(knowledge_dir, MANIFEST_FILE), "w", encoding="utf-8") as output:
+        json.dump(manifest, output, indent=2)
+        output.write("\n")
+    return version
+
+def _restore_pack(pack):
+    """Turn JSON lists back into the structures the index functions expect, and derive the snippet data"""
+    keyword_index = pack["keyword_index"]
+    keyword_index["postings"] = {
+        tuple(phrase): [tuple(entry) for entry in entries] for phrase, entries in keyword_index["postings"]
+    }
+    pack["search_index"] = expand_search_index(pack["search_index"], pack["topics"])
+    return pack
+
+_manifest = None
+_packs = {}
+_load_lock = threading.Lock()
+
+def _get_manifest():
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(os.path.join(KNOWLEDGE_DIR, MANIFEST_FILE), encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            manifest = {"format": None, "version": None, "packs": {}}
+        try:
+            source_version = compute_version()
+        except OSError:
+            source_version = None  # packs deployed without their sources
+        # A missing, old-format or stale pack is compiled in memory instead
+        manifest["stale"] = manifest["format"] != PACK_FORMAT or (
+            source_version is not None and manifest["version"] != source_version)
+        if manifest["stale"]:
+            print("⚠️ Knowledge pack missing or stale, compiling in memory (run: python knowledge_pack.py)")
+            manifest["version"] = source_version
+        _manifest = manifest
+    return _manifest
+
+def get_pack(language):
+    """Return the compiled pack for 'indonesian' or 'english', loaded on first use"""
+    if language not in SOURCES:
+        language = "english"
+    pack = _packs.get(language)
+    if pack is not None:
+        return pack
+    with _load_lock:
+        pack = _packs.get(language)
+        if pack is None:
+            manifest = _get_manifest()
+            if manifest["stale"]:
+                pack = compile_pack(language, manifest["version"])
+                pack = json.loads(json.dumps(pack))  # same shape as a pack read from disk
+            else:
+                with open(os.path.join(KNOWLEDGE_DIR, manifest["packs"][language]), encoding="utf-8") as pack_file_handle:
+                    pack = json.load(pack_file_handle)
+            pack = _packs[language] = _restore_pack(pack)
+    return pack
+
+def reload_packs():
+    """Forget loaded packs so the next lookup reads (or compiles) them again"""
+    global _manifest
+    with _load_lock:
+        _manifest = None
+        _packs.clear()
+
+def get_knowledge_version():
+    """Return the version hash of the knowledge sources (for cache keys)"""
+    with _load_lock:
+        return _get_manifest()["version"]
+
+def get_knowledge_base(language):
+    """Return {category: {"title", "content", "keywords"}} for a language"""
+    return get_pack(language)["topics"]
+
+def get_keyword_index(language):
+    return get_pack(language)["keyword_index"]
+
+def get_search_index(language):
+    return get_pack(language)["search_index"]
+
+def get_passages(language):
+    return get_pack(language)["passages"]
+
+def get_fallback_text(language):
+    """Return the topic overview shown when no topic matches"""
+    return get_pack(language)["fallback"]
+
+def main():
+    """Build or check the knowledge packs from the command line"""
+    parser = argparse.ArgumentParser(description="Compile knowledge/*.yaml into per-language packs")
+    parser.add_argument("--check", action="store_true", help="Only check that the packs match the sources")
+    args = parser.parse_args()
+
+    if args.check:
+        stale = _get_manifest()["stale"]
+        print("❌ Knowledge packs are stale" if stale else "✅ Knowledge packs are up to date")
+        sys.exit(1 if stale else 0)
+    version = build_packs()
+    print(f"📦 Knowledge version {version}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Knowledge Retrieval Module
+Splits the curated stunting knowledge base into passages and embeds them with
+a local hashing TF-IDF vectorizer into a dense NumPy matrix. A query is one
+matrix-vector product (a batch of queries is one matrix-matrix product), and
+the top passages are injected into the OpenAI prompt to ground its answers
+"""
+
+import os
+import textwrap
+import threading
+import zlib
+
+import numpy as np
+
+from env_config import env_flag
+from knowledge_index import STOPWORDS, stem, tokenize
+from knowledge_pack import get_passages
+
+# Retrieval config from env (with defaults)
+RETRIEVAL_ENABLED = env_flag("RETRIEVAL_ENABLED")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+# Passages scoring below this cosine similarity are not worth the prompt tokens
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.05"))
+# Width of the hashed feature space (collisions are rare at this knowledge base size)
+RETRIEVAL_DIMENSIONS = int(os.getenv("RETRIEVAL_DIMENSIONS", "4096"))
+
+# Blocks shorter than this many words are merged into the following block
+MIN_PASSAGE_WORDS = 12
+
+CONTEXT_HEADERS = {
+    "indonesian": (
+        "Referensi dari basis pengetahuan stunting terkurasi. Utamakan informasi ini, "
+        "dan jangan mengarang angka atau statistik yang tidak ada di referensi:"
+    ),
+    "english": (
+        "Reference passages from the curated stunting knowledge base. Prefer this information, "
+        "and do not invent numbers or statistics that are not in the references:"
+    ),
+}
+
+def split_passages(knowledge_base):
+    """Split every knowledge entry into passages at blank lines
+
+    Returns [{"category", "title", "text"}, ...]. Short blocks (usually a
+    heading) are merged into the block that follows them.
+    """
+    passages = []
+    for category, info in knowledge_base.items():
+        blocks = [block.strip() for block in textwrap.dedent(info["content"]).split("\n\n")]
+        pending = ""
+        for block in blocks:
+            if not block:
+                continue
+            text = f"{pending}\n{block}" if pending else block
+            if len(text.split()) < MIN_PASSAGE_WORDS:
+                pending = text
+                continue
+            passages.append({"category": category, "title": info["title"], "text": text})
+            pending = ""
+        if pending:
+            if passages and passages[-1]["category"] == category:
+                passages[-1]["text"] += "\n" + pending
+            else:
+                passages.append({"category": category, "title": info["title"], "text": pending})
+    return passages
+
+def _features(text):
+    """Stemmed unigrams and adjacent-pair bigrams of the content words"""
+    stems = [stem(token) for token in tokenize(text) if token not in STOPWORDS]
+    return stems + [f"{first} {second}" for first, second in zip(stems, stems[1:])]
+
+def _bucket(feature, dimensions):
+    # crc32 rather than hash(): stable across processes, so vectors can be persisted
+    return zlib.crc32(feature.encode("utf-8")) % dimensions
+
+def _count_matrix(texts, dimensions):
+    """Hashed term counts, one row per text"""
+    matrix = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature in _features(text):
+            matrix[row, _bucket(feature, dimensions)] += 1.0
+    return matrix
+
+def _tfidf(counts, idf):
+    """Sublinear TF-IDF weighting with L2-normalized rows"""
+    weighted = np.log1p(counts) * idf
+    norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return weighted / norms
+
+def index_passages(passages, dimensions=RETRIEVAL_DIMENSIONS):
+    """Embed passages into a dense (passages x dimensions) matrix"""
+    # The title is part of what a passage is about
+    counts = _count_matrix([f"{p['title']}\n{p['text']}" for p in passages], dimensions)
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = (np.log((1 + len(passages)) / (1 + document_frequency)) + 1).astype(np.float32)
+    return {
+        "passages": passages,
+        "matrix": _tfidf(counts, idf),
+        "idf": idf,
+        "dimensions": dimensions,
+    }
+
+def build_passage_index(knowledge_base, dimensions=RETRIEVAL_DIMENSIONS):
+    """Split a knowledge base into passages and embed them"""
+    return index_passages(split_passages(knowledge_base), dimensions)
+
+def embed_queries(index, queries):
+    """Embed a list of queries into the index's vector space"""
+    return _tfidf(_count_matrix(queries, index["dimensions"]), index["idf"])
+
+def _top_passages(index, scores, top_k, min_score):
+    if top_k < len(scores):
+        # Partial selection, then sort only the k winners
+        candidates = np.argpartition(-scores, top_k)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+    return [
+        dict(index["passages"][position], score=float(scores[position]))
+        for position in ranked if scores[position] >= min_score
+    ]
+
+def retrieve(index, query, top_k=RETRIEVAL_TOP_K, min_score=RETRIEVAL_MIN_SCORE):
+    """Return the top passages for a query, best first, each with its cosine score"""
+    scores = index["matrix"] @ embed_queries(index, [query])[0]
+    return _top_passages(index, scores, top_k, min_score)
+
+def retrieve_batch(index, queries, top_k=RETRIEVAL_TOP_K, min_score=RETRIEVAL_MIN_SCORE):
+    """Retrieve for many queries at once (offline jobs); returns one result list per query"""
+    if not queries:
+        return []
+    scores = embed_queries(index, queries) @ index["matrix"].T
+    return [_top_passages(index, row, top_k, min_score) for row in scores]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_passage_index(language):
+    """Return the passage index for 'indonesian' or 'english', built on first use"""
+    with _indexes_lock:
+        index = _indexes.get(language)
+        if index is None:
+            # Passages are precomputed in the knowledge pack
+            index = _indexes[language] = index_passages(get_passages(language))
+        return index
+
+def clear_passage_indexes():
+    """Forget built passage indexes (after the knowledge packs were reloaded)"""
+    with _indexes_lock:
+        _indexes.clear()
+
+def format_context(passages, language):
+    """Render retrieved passages as a reference block for the system prompt"""
+    if not passages:
+        return ""
+    sections = [f"[{number}] {p['title']}\n{p['text']}" for number, p in enumerate(passages, 1)]
+    return CONTEXT_HEADERS.get(language, CONTEXT_HEADERS["english"]) + "\n\n" + "\n\n".join(sections)
+
+def get_context_for_question(question, language, top_k=RETRIEVAL_TOP_K):
+    """Return the reference block to append to the system prompt ("" when nothing relevant)"""
+    return format_context(retrieve(get_passage_index(language), question, top_k), language)
@@ -0,0 +1,71 @@
+"""
+Language Detection Module
+Single shared Indonesian/English detector. The vocabulary is compiled into
+token-set lookups once at import, and each message is tokenized and scanned
+in one pass (whole words only, so "asi" no longer matches "basic")
+"""
+
+from knowledge_index import stem, tokenize
+
+# Common Indonesian words in stunting questions
+INDONESIAN_WORDS = [
+    'apa', 'bagaimana', 'kenapa', 'mengapa', 'kapan', 'dimana', 'siapa',
+    'stunting', 'pendek', 'kerdil', 'nutrisi', 'gizi', 'makanan',
+    'bayi', 'anak', 'ibu', 'hamil', 'kehamilan', 'menyusui', 'asi',
+    'tinggi', 'berat', 'pertumbuhan', 'perkembangan', 'pencegahan',
+    'pengobatan', 'penyebab', 'gejala', 'tanda', 'risiko', 'faktor'
+]
+
+# A message is Indonesian when it contains at least this many distinct vocabulary words
+INDONESIAN_MIN_WORDS = 2
+# Only longer words are matched by stem ("makanannya" -> "makanan"); short ones
+# like "asi" or "ibu" must match exactly to avoid collisions with English stems
+MIN_STEMMED_WORD_LENGTH = 6
+# Shared with English, so inflections ("stunted") must not count as Indonesian
+_NO_STEM_WORDS = {'stunting'}
+
+# Bound on the per-batch memo of already detected messages
+DETECT_MEMO_SIZE = 10000
+
+_EXACT_WORDS = frozenset(INDONESIAN_WORDS)
+_STEMMED_WORDS = {}
+for _word in _EXACT_WORDS:
+    if len(_word) >= MIN_STEMMED_WORD_LENGTH and _word not in _NO_STEM_WORDS:
+        _STEMMED_WORDS.setdefault(stem(_word), _word)
+
+def count_indonesian_words(text):
+    """Count distinct Indonesian vocabulary words in the text"""
+    found = set()
+    for token in tokenize(text):
+        if token in _EXACT_WORDS:
+            found.add(token)
+        elif len(token) >= MIN_STEMMED_WORD_LENGTH:
+            word = _STEMMED_WORDS.get(stem(token))
+            if word:
+                found.add(word)
+    return len(found)
+
+def is_indonesian(text):
+    """Return True if the text looks Indonesian"""
+    return count_indonesian_words(text) >= INDONESIAN_MIN_WORDS
+
+def detect_language(text):
+    """Return 'indonesian' or 'english' for the text"""
+    return 'indonesian' if is_indonesian(text) else 'english'
+
+def detect_languages(messages):
+    """Detect the language of many messages (e.g. an analytics pass over chat_history)
+
+    Repeated messages are detected once (up to DETECT_MEMO_SIZE distinct
+    messages). Returns a list aligned with the input.
+    """
+    seen = {}
+    results = []
+    for message in messages:
+        language = seen.get(message)
+        if language is None:
+            language = detect_language(message or "")
+            if len(seen) < DETECT_MEMO_SIZE:
+                seen[message] = language
+        results.append(language)
+    return results
@@ -0,0 +1,232 @@
+"""
+Migrations Module
+Ordered schema migrations keyed on the database's schema version (PRAGMA
+user_version on SQLite, a schema_version table on PostgreSQL). Pending steps
+run once per database under the backend's migration lock (so concurrent
+worker processes and app nodes do not race), each recording its version as
+it completes. After that, session start only checks a per-process flag and
+skips all schema introspection
+"""
+
+import threading
+
+from chat_archive import (add_archive_response_hash, backfill_archived_responses, create_archive_table,
+                          create_postgres_archive_table)
+from chat_responses import backfill_response_hashes, create_response_store, response_sql
+from chat_schema import (CHAT_MESSAGES_INDEX_SQL, CHAT_MESSAGES_SQL, create_compact_schema, get_chat_schema,
+                         migrate_chat_history, recreate_chat_history_view)
+from chat_search import create_chat_search_index, recreate_chat_search_triggers
+from db import get_database
+from knowledge_fts import create_knowledge_fts_tables
+from response_cache import create_response_cache_table
+
+def create_base_tables(conn):
+    """Users table plus chat_messages (and its chat_history view on new databases)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT,
+            name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    create_compact_schema(conn)
+
+def add_missing_columns(conn):
+    """Columns that databases from older app versions lack"""
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(users)")]
+    # SQLite cannot ADD COLUMN with a CURRENT_TIMESTAMP default, so old rows get a NULL created_at
+    for column, definition in (("name", "TEXT"), ("email", "TEXT"), ("created_at", "TIMESTAMP")):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE users ADD COLUMN {column} {definition}")
+            print(f"Added '{column}' column to users table")
+
+    # A legacy chat_history table needs its timestamp before it is backfilled
+    if get_chat_schema(conn) == "legacy":
+        chat_columns = [column[1] for column in conn.execute("PRAGMA table_info(chat_history)")]
+        if 'timestamp' not in chat_columns:
+            conn.execute("ALTER TABLE chat_history ADD COLUMN timestamp TIMESTAMP")
+            print("Added 'timestamp' column to chat_history table")
+
+def create_postgres_tables(conn):
+    """Users and chat_messages in PostgreSQL types, plus a read-only chat_history view"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGSERIAL PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT,
+            name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL REFERENCES users (id),
+            created_at BIGINT NOT NULL,
+            conversation_id BIGINT,
+            message TEXT NOT NULL,
+            response TEXT NOT NULL
+        )
+    ''')
+    conn.execute(CHAT_MESSAGES_INDEX_SQL)
+    conn.execute('''
+        CREATE OR REPLACE VIEW chat_history AS
+        SELECT m.id, u.username, m.message, m.response,
+               to_char(to_timestamp(m.created_at / 1000.0) AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS timestamp,
+               m.conversation_id
+        FROM chat_messages m JOIN users u ON u.id = m.user_id
+    ''')
+
+def deduplicate_chat_responses(database):
+    """Store response bodies once by hash: add the reference, repoint the views and triggers, then backfill"""
+    with database.transaction() as conn:
+        create_response_store(conn)
+        recreate_chat_search_triggers(conn)
+        recreate_chat_history_view(conn)
+    backfill_response_hashes(database)
+
+def deduplicate_postgres_chat_responses(database):
+    """PostgreSQL version of deduplicate_chat_responses (no search index to repoint)"""
+    with database.transaction() as conn:
+        create_response_store(conn, "postgres")
+        conn.execute(f'''
+            CREATE OR REPLACE VIEW chat_history AS
+            SELECT m.id, u.username, m.message, {response_sql("m")} AS response,
+                   to_char(to_timestamp(m.created_at / 1000.0) AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS') AS timestamp,
+                   m.conversation_id
+            FROM chat_messages m JOIN users u ON u.id = m.user_id
+        ''')
+    backfill_response_hashes(database)
+
+def share_archived_responses(database):
+    """Archived rows reference chat_responses like hot rows: add the reference, then convert the archived bodies"""
+    with database.transaction() as conn:
+        add_archive_response_hash(conn, database.backend)
+    backfill_archived_responses(database)
+
+def make_chat_ids_monotonic(conn):
+    """Rebuild chat_messages with AUTOINCREMENT, so ids of archived or deleted rows are never reused
+
+    Rows keep their ids (the search index and the archive refer to them),
+    and the id sequence starts above every id either tier holds.
+    """
+    table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'chat_messages'").fetchone()[0]
+    if "AUTOINCREMENT" not in table_sql.upper():
+        # Views over the table would block the rename, and its indexes would keep their names
+        conn.execute("DROP VIEW IF EXISTS chat_history")
+        conn.execute("DROP VIEW IF EXISTS chat_messages_fts_content")
+        conn.execute("DROP INDEX IF EXISTS idx_chat_messages_user_time")
+        conn.execute("DROP INDEX IF EXISTS idx_chat_messages_response_hash")
+        conn.execute("ALTER TABLE chat_messages RENAME TO chat_messages_rebuild")
+        conn.execute(CHAT_MESSAGES_SQL)
+        create_response_store(conn)
+        conn.execute('''
+            INSERT INTO chat_messages (id, user_id, created_at, conversation_id, message, response, response_hash)
+            SELECT id, user_id, created_at, conversation_id, message, response, response_hash FROM chat_messages_rebuild
+        ''')
+        conn.execute("DROP TABLE chat_messages_rebuild")
+        conn.execute(CHAT_MESSAGES_INDEX_SQL)
+        recreate_chat_history_view(conn)
+        recreate_chat_search_triggers(conn)
+    top = conn.execute('''
+        SELECT MAX(id) FROM (SELECT MAX(id) AS id FROM chat_messages UNION ALL SELECT MAX(id) FROM chat_messages_archive)
+    ''').fetchone()[0]
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'chat_messages'")
+    if top is not None:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('chat_messages', ?)", (top,))
+
+# bcrypt hash of the public demo password "demo123", computed once ahead of time so the migration
+# transaction does no hashing (a different PASSWORD_HASH_ROUNDS upgrades it at the first login)
+DEMO_PASSWORD_HASH = "$2b$12$Yaidx4jP5mDN32lS/NPdReyoa/UpYxfKVruVmiWE6wQ097fA0iZM6"
+
+def create_demo_user(conn):
+    """Demo account for a database without users"""
+    if conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0:
+        conn.execute('INSERT INTO users (username, password, email, name) VALUES (?, ?, ?, ?)',
+                     ('demo', DEMO_PASSWORD_HASH, 'demo@example.com', 'Demo User'))
+        print("Demo user created successfully")
+
+# backend -> [(version, description, step, transactional)]. Transactional steps take a connection and
+# run in one transaction with their version bump; the others take the Database and manage their own
+# transactions. Append new steps only; never renumber or edit an applied one.
+MIGRATIONS = {
+    "sqlite": [
+        (1, "create users and chat tables", create_base_tables, True),
+        (2, "add missing users and chat_history columns", add_missing_columns, True),
+        (3, "move chat_history into chat_messages", migrate_chat_history, False),
+        (4, "create demo user", create_demo_user, True),
+        (5, "index chat history for full-text search", create_chat_search_index, True),
+        (6, "create compressed chat archive table", create_archive_table, True),
+        (7, "store each distinct chat response once", deduplicate_chat_responses, False),
+        (8, "create response cache table", create_response_cache_table, True),
+        (9, "create knowledge full-text search tables", create_knowledge_fts_tables, True),
+        (10, "never reuse chat message ids", make_chat_ids_monotonic, True),
+        (11, "share stored responses with the chat archive", share_archived_responses, False),
+    ],
+    # PostgreSQL databases start at the current schema; there is no legacy layout to upgrade
+    "postgres": [
+        (1, "create users and chat tables", create_postgres_tables, True),
+        (2, "create demo user", create_demo_user, True),
+        (3, "create compressed chat archive table", create_postgres_archive_table, True),
+        (4, "store each distinct chat response once", deduplicate_postgres_chat_responses, False),
+        (5, "create response cache table", create_response_cache_table, True),
+        (6, "share stored responses with the chat archive", share_archived_responses, False),
+    ],
+}
+LATEST_VERSION = MIGRATIONS["sqlite"][-1][0]
+
+def get_schema_version(database):
+    """Return the schema version of a database (0 before the first migration)"""
+    return database.schema_version()
+
+def apply_migrations(database=None):
+    """Run every pending migration in order; returns the versions applied"""
+    database = database or get_database()
+    migrations = MIGRATIONS[database.backend]
+    if get_schema_version(database) >= migrations[-1][0]:
+        return []
+    applied = []
+    with database.migration_lock():
+        # Another process may have migrated while we waited for the lock
+        current = get_schema_version(database)
+        for version, description, step, transactional in migrations:
+            if version <= current:
+                continue
+            try:
+                if transactional:
+                    with database.transaction() as conn:
+                        step(conn)
+                        database.set_schema_version(conn, version)
+                else:
+                    step(database)
+                    with database.transaction() as conn:
+                        database.set_schema_version(conn, version)
+            except Exception as e:
+                print(f"❌ Migration {version} ({description}) failed: {e}")
+                raise
+            print(f"✅ Applied migration {version}: {description}")
+            applied.append(version)
+    return applied
+
+_ready = set()
+_ready_lock = threading.Lock()
+
+def ensure_schema(database=None):
+    """Migrate a database once per process; later calls are a set lookup"""
+    database = database or get_database()
+    if database.path in _ready:
+        return
+    with _ready_lock:
+        if database.path not in _ready:
+            apply_migrations(database)
+            _ready.add(database.path)
+
+def forget_schema(database=None):
+    """Drop the cached check (e.g. after the database file was deleted)"""
+    database = database or get_database()
+    with _ready_lock:
+        _ready.discard(database.path)
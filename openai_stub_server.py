@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+OpenAI-Compatible Stub Server
+Local stand-in for the /v1/chat/completions endpoint so the app can be
+benchmarked and load tested without network access or API spend
+
+Usage:
+    python openai_stub_server.py --port 8808 --latency-ms 400 --tokens-per-second 40
+    OPENAI_BASE_URL=http://localhost:8808/v1 OPENAI_API_KEY=stub-key streamlit run app.py
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ANSWERS = {
+    "indonesian": (
+        "**Stunting** adalah kondisi gagal tumbuh pada anak akibat kekurangan gizi kronis, "
+        "terutama dalam 1000 hari pertama kehidupan. Di Indonesia, pencegahan dimulai sejak "
+        "kehamilan: periksa kehamilan rutin di Puskesmas, konsumsi tablet tambah darah, "
+        "berikan ASI eksklusif selama 6 bulan, lalu MPASI bergizi seimbang yang kaya protein "
+        "hewani. Pantau tinggi dan berat badan anak setiap bulan di Posyandu agar gangguan "
+        "pertumbuhan terdeteksi sejak dini. 🌱"
+    ),
+    "english": (
+        "**Stunting** is impaired growth caused by chronic undernutrition, mostly during the "
+        "first 1000 days of life. In Indonesia, prevention starts in pregnancy: regular "
+        "antenatal checks at the Puskesmas, iron supplements, exclusive breastfeeding for six "
+        "months, then balanced complementary feeding rich in animal protein. Measure your "
+        "child's height and weight every month at the Posyandu so growth problems are caught "
+        "early. 🌱"
+    ),
+}
+
+DEFAULT_CONFIG = {
+    "latency_dist": "lognormal",   # fixed, uniform, normal or lognormal
+    "latency_ms": 400.0,           # mean time to first token
+    "latency_jitter_ms": 150.0,    # spread of the latency distribution
+    "tokens_per_second": 40.0,     # streaming rate (0 = as fast as possible)
+    "error_429_rate": 0.0,         # fraction of requests answered with 429
+    "error_500_rate": 0.0,         # fraction of requests answered with 500
+    "seed": None,
+}
+
+def sample_latency(config, rng):
+    """Sample a time-to-first-token delay in seconds from the configured distribution"""
+    mean = config["latency_ms"]
+    jitter = config["latency_jitter_ms"]
+    dist = config["latency_dist"]
+
+    if dist == "fixed" or jitter <= 0:
+        value = mean
+    elif dist == "uniform":
+        value = rng.uniform(mean - jitter, mean + jitter)
+    elif dist == "normal":
+        value = rng.gauss(mean, jitter)
+    elif dist == "lognormal":
+        # Parameterize so the distribution has the requested mean and standard deviation
+        sigma2 = math.log(1 + (jitter / mean) ** 2) if mean > 0 else 0.0
+        mu = math.log(mean) - sigma2 / 2 if mean > 0 else 0.0
+        value = rng.lognormvariate(mu, math.sqrt(sigma2))
+    else:
+        raise ValueError(f"Unknown latency distribution: {dist}")
+    return max(value, 0.0) / 1000.0
+
+def detect_answer_language(messages):
+    """Pick the canned answer language from the last user message"""
+    user_text = ""
+    for message in messages:
+        if message.get("role") == "user":
+            user_text = str(message.get("content", ""))
+    try:
+        from stunting_knowledge_id import detect_indonesian
+        return "indonesian" if detect_indonesian(user_text) else "english"
+    except ImportError:
+        return "english"
+
+def split_tokens(text):
+    """Split an answer into word-sized tokens that keep their leading whitespace"""
+    tokens = []
+    current = ""
+    for char in text:
+        if char == " " and current:
+            tokens.append(current)
+            current = ""
+        current += char
+    if current:
+        tokens.append(current)
+    return tokens
+
+def make_stub_handler(config):
+    """Build a request handler class bound to the given config"""
+    rng = random.Random(config.get("seed"))
+    rng_lock = threading.Lock()
+    stats = {"requests": 0, "streamed": 0, "errors_429": 0, "errors_500": 0}
+
+    class StubHandler(BaseHTTPRequestHandler):
+        server_version = "OpenAIStub/1.0"
+
+        def log_message(self, format, *args):
+            # Keep benchmark output clean
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/") in ("/v1/models", "/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "stub-model", "object": "model"}]})
+            elif self.path.rstrip("/") == "/stats":
+                self._send_json(200, stats)
+            else:
+                self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+        def do_POST(self):
+            if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+                self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+                return
+
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+                return
+
+            with rng_lock:
+                stats["requests"] += 1
+                roll = rng.random()
+                latency = sample_latency(config, rng)
+
+            # Error injection
+            if roll < config["error_429_rate"]:
+                stats["errors_429"] += 1
+                self._send_json(429, {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_error"}},
+                                headers={"Retry-After": "1"})
+                return
+            if roll < config["error_429_rate"] + config["error_500_rate"]:
+                stats["errors_500"] += 1
+                self._send_json(500, {"error": {"message": "Internal server error (stub)", "type": "server_error"}})
+                return
+
+            model = request.get("model", "stub-model")
+            language = detect_answer_language(request.get("messages", []))
+            tokens = split_tokens(CANNED_ANSWERS[language])
+            max_tokens = request.get("max_tokens")
+            if max_tokens:
+                tokens = tokens[:max_tokens]
+
+            time.sleep(latency)
+            if request.get("stream"):
+                stats["streamed"] += 1
+                self._stream(model, tokens)
+            else:
+                rate = config["tokens_per_second"]
+                if rate > 0:
+                    time.sleep(len(tokens) / rate)
+                self._send_json(200, {
+                    "id": f"chatcmpl-stub-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+                })
+
+        def _stream(self, model, tokens):
+            completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:12]}"
+            created = int(time.time())
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            def send_chunk(delta, finish_reason=None):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            rate = config["tokens_per_second"]
+            try:
+                send_chunk({"role": "assistant", "content": ""})
+                for token in tokens:
+                    send_chunk({"content": token})
+                    if rate > 0:
+                        time.sleep(1.0 / rate)
+                send_chunk({}, finish_reason="stop")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Client went away mid-stream
+                pass
+
+    StubHandler.stats = stats
+    return StubHandler
+
+def start_stub_server(host="127.0.0.1", port=0, **overrides):
+    """Start the stub server in a background thread and return it
+
+    Pass port=0 to pick a free port; the bound address is server.server_address.
+    """
+    config = dict(DEFAULT_CONFIG)
+    config.update(overrides)
+    server = ThreadingHTTPServer((host, port), make_stub_handler(config))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def main():
+    """Run the stub server from the command line"""
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible /v1/chat/completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "normal", "lognormal"],
+                        default=DEFAULT_CONFIG["latency_dist"])
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_CONFIG["latency_ms"],
+                        help="Mean time to first token in milliseconds")
+    parser.add_argument("--latency-jitter-ms", type=float, default=DEFAULT_CONFIG["latency_jitter_ms"],
+                        help="Spread of the latency distribution in milliseconds")
+    parser.add_argument("--tokens-per-second", type=float, default=DEFAULT_CONFIG["tokens_per_second"],
+                        help="Token rate (0 = send everything at once)")
+    parser.add_argument("--error-429-rate", type=float, default=DEFAULT_CONFIG["error_429_rate"],
+                        help="Fraction of requests answered with 429")
+    parser.add_argument("--error-500-rate", type=float, default=DEFAULT_CONFIG["error_500_rate"],
+                        help="Fraction of requests answered with 500")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = dict(DEFAULT_CONFIG)
+    config.update({
+        "latency_dist": args.latency_dist,
+        "latency_ms": args.latency_ms,
+        "latency_jitter_ms": args.latency_jitter_ms,
+        "tokens_per_second": args.tokens_per_second,
+        "error_429_rate": args.error_429_rate,
+        "error_500_rate": args.error_500_rate,
+        "seed": args.seed,
+    })
+
+    server = ThreadingHTTPServer((args.host, args.port), make_stub_handler(config))
+    server.daemon_threads = True
+    print(f"🧪 OpenAI stub listening on http://{args.host}:{args.port}/v1")
+    print(f"   latency: {args.latency_dist} {args.latency_ms:.0f}±{args.latency_jitter_ms:.0f} ms, "
+          f"{args.tokens_per_second:g} tokens/s, 429: {args.error_429_rate:.0%}, 500: {args.error_500_rate:.0%}")
+    print(f"   export OPENAI_BASE_URL=http://{args.host}:{args.port}/v1 OPENAI_API_KEY=stub-key")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stub server stopped")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
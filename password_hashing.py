@@ -0,0 +1,168 @@
+"""
+Password Hashing Module
+bcrypt password hashes, computed in a bounded pool of worker processes.
+bcrypt is slow on purpose (about 100-300 ms per hash at the default cost),
+so hashing on the Streamlit script threads would make a burst of logins
+queue behind each other. Hashes from before bcrypt (unsalted SHA-256 hex)
+still verify, and needs_rehash tells the caller to upgrade them, or a hash
+with an outdated cost, after the next successful login
+
+Usage:
+    python password_hashing.py [--logins 200] [--workers 4] [--rounds 12]   # login throughput benchmark
+"""
+
+import argparse
+import atexit
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+
+import bcrypt
+
+# Hashing config from env (with defaults)
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "12"))  # bcrypt cost; each +1 doubles the work
+# Hashing processes; 0 hashes on the calling thread
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+def hash_password(password, rounds=PASSWORD_HASH_ROUNDS):
+    """Salted bcrypt hash of a password, as text"""
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("ascii")
+
+def is_legacy_hash(stored):
+    """True for the unsalted SHA-256 hex digests stored before bcrypt"""
+    return not stored.startswith("$2")
+
+def verify_password(password, stored):
+    """Check a password against a bcrypt or legacy SHA-256 hash"""
+    if is_legacy_hash(stored):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    return bcrypt.checkpw(password.encode("utf-8"), stored.encode("ascii"))
+
+def needs_rehash(stored, rounds=PASSWORD_HASH_ROUNDS):
+    """True when a stored hash is legacy SHA-256 or uses a different bcrypt cost"""
+    if is_legacy_hash(stored):
+        return True
+    # $2b$<cost>$<salt and hash>
+    return int(stored.split("$")[2]) != rounds
+
+def _completed(fn, *args):
+    """Run fn now and wrap the outcome in a finished Future"""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+class PasswordHasher:
+    """Bounded process pool for bcrypt; every call returns a concurrent.futures.Future"""
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, rounds=PASSWORD_HASH_ROUNDS):
+        self.workers = workers
+        self.rounds = rounds
+        self._pool = None
+        self._dummy_hash = None  # a Future once the pool has started
+        self._lock = threading.Lock()
+        self.stats = {"hashes": 0, "verifications": 0, "legacy_verifications": 0}
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn, not fork: forking a process that runs Streamlit's threads can copy locks held mid-operation
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+                # Ready before the first login of an unknown username needs it
+                self._dummy_hash = self._pool.submit(hash_password, secrets.token_hex(16), self.rounds)
+            return self._pool
+
+    def _submit(self, fn, *args):
+        if self.workers <= 0:
+            return _completed(fn, *args)
+        return self._get_pool().submit(fn, *args)
+
+    def hash(self, password):
+        """Future of the bcrypt hash of password"""
+        with self._lock:
+            self.stats["hashes"] += 1
+        return self._submit(hash_password, password, self.rounds)
+
+    def verify(self, password, stored):
+        """Future of whether password matches stored"""
+        if is_legacy_hash(stored):
+            # A SHA-256 digest costs microseconds; a round trip to a worker would cost more
+            with self._lock:
+                self.stats["legacy_verifications"] += 1
+            return _completed(verify_password, password, stored)
+        with self._lock:
+            self.stats["verifications"] += 1
+        return self._submit(verify_password, password, stored)
+
+    def dummy_hash(self):
+        """A bcrypt hash no password matches, for checking logins of unknown usernames"""
+        if self.workers <= 0:
+            if self._dummy_hash is None:
+                self._dummy_hash = _completed(hash_password, secrets.token_hex(16), self.rounds)
+        else:
+            self._get_pool()
+        return self._dummy_hash.result()
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats["workers"] = self.workers
+        stats["rounds"] = self.rounds
+        return stats
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+def get_password_hasher():
+    """Return the process-wide hasher; its workers start on first use and stop at exit"""
+    global _hasher
+    with _hasher_lock:
+        if _hasher is None:
+            _hasher = PasswordHasher()
+            atexit.register(_hasher.close)
+        return _hasher
+
+def benchmark_logins(logins=200, workers=PASSWORD_HASH_WORKERS, rounds=PASSWORD_HASH_ROUNDS):
+    """Logins per second verified inline (one after another) and through the pool (all at once)"""
+    stored = hash_password("rahasia", rounds)
+    start = time.perf_counter()
+    for _ in range(logins):
+        verify_password("rahasia", stored)
+    inline = logins / (time.perf_counter() - start)
+
+    hasher = PasswordHasher(workers=workers, rounds=rounds)
+    # Start the workers first so process start-up is not counted
+    wait([hasher.verify("rahasia", stored) for _ in range(max(workers, 1))])
+    start = time.perf_counter()
+    wait([hasher.verify("rahasia", stored) for _ in range(logins)])
+    pooled = logins / (time.perf_counter() - start)
+    hasher.close()
+    return {"logins": logins, "rounds": rounds, "workers": workers,
+            "inline_per_second": round(inline, 1), "pool_per_second": round(pooled, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bcrypt login throughput")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS)
+    parser.add_argument("--rounds", type=int, default=PASSWORD_HASH_ROUNDS)
+    args = parser.parse_args()
+    result = benchmark_logins(args.logins, args.workers, args.rounds)
+    print(f"🔐 {result['logins']} logins at cost {result['rounds']}: {result['inline_per_second']}/s inline, "
+          f"{result['pool_per_second']}/s with {result['workers']} worker processes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Query Router Module
+Scores a question against the curated stunting knowledge base and serves the
+matching section directly when confidence is high, so only ambiguous or
+open-ended questions go to OpenAI
+"""
+
+import json
+import os
+import textwrap
+import threading
+import time
+
+from env_config import env_flag
+from knowledge_index import GENERIC_KEYWORDS, STOPWORDS, match_categories
+from knowledge_pack import get_keyword_index, get_knowledge_base
+from stunting_knowledge import detect_language
+
+# Router config from env (with defaults)
+ROUTER_ENABLED = env_flag("ROUTER_ENABLED")
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.6"))
+# Optional JSONL file receiving every routing decision (for threshold tuning)
+ROUTER_LOG_PATH = os.getenv("ROUTER_LOG_PATH", "")
+
+_stats_lock = threading.Lock()
+router_stats = {"knowledge": 0, "llm": 0}
+
+def score_question(user_message, language=None):
+    """Score the knowledge sections for the message using the inverted keyword index
+
+    Returns (language, tokens, [(category, score, covered_positions), ...]) best first.
+    """
+    if language is None:
+        language = detect_language(user_message)
+    tokens, ranked = match_categories(get_keyword_index(language), user_message)
+    return language, tokens, ranked
+
+def route_question(user_message, language=None, threshold=None):
+    """Decide whether the knowledge base can answer the message directly
+
+    Confidence combines match strength, the margin over the runner-up section
+    and how much of the question the matched keywords explain.
+    """
+    if threshold is None:
+        threshold = ROUTER_CONFIDENCE_THRESHOLD
+    language, tokens, scored = score_question(user_message, language)
+    top_category, top_score, covered = scored[0] if scored else (None, 0.0, set())
+    runner_up_score = scored[1][1] if len(scored) > 1 else 0.0
+
+    confidence = 0.0
+    if top_score > 0 and tokens:
+        strength = min(1.0, top_score)
+        margin = 1.0 - runner_up_score / top_score
+        explained = sum(
+            1 for position, token in enumerate(tokens)
+            if position in covered or token in STOPWORDS or token in GENERIC_KEYWORDS
+        )
+        coverage = explained / len(tokens)
+        confidence = strength * margin * coverage
+
+    decision = {
+        "route": "knowledge" if confidence >= threshold else "llm",
+        "category": top_category,
+        "confidence": round(confidence, 3),
+        "language": language,
+        "scores": {category: round(score, 3) for category, score, _ in scored},
+    }
+    log_decision(user_message, decision)
+    return decision
+
+def log_decision(user_message, decision):
+    """Log a routing decision (stdout, plus ROUTER_LOG_PATH when set)"""
+    with _stats_lock:
+        router_stats[decision["route"]] += 1
+    print(f"🧭 Router: route={decision['route']} category={decision['category']} "
+          f"confidence={decision['confidence']:.3f} scores={decision['scores']}")
+    if ROUTER_LOG_PATH:
+        try:
+            entry = dict(decision, question=user_message, threshold=ROUTER_CONFIDENCE_THRESHOLD, ts=time.time())
+            with open(ROUTER_LOG_PATH, "a", encoding="utf-8") as log_file:
+                log_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"Router log warning: {e}")
+
+def format_knowledge_answer(category, language):
+    """Render a knowledge section as a chat answer"""
+    info = get_knowledge_base(language)[category]
+    return f"### {info['title']}\n\n{textwrap.dedent(info['content']).strip()}"
+
+def get_router_stats():
+    """Return how many questions went to the knowledge base vs OpenAI"""
+    with _stats_lock:
+        stats = dict(router_stats)
+    total = stats["knowledge"] + stats["llm"]
+    stats["knowledge_share"] = stats["knowledge"] / total if total else 0.0
+    return stats
@@ -0,0 +1,204 @@
+"""
+Response Cache Module
+Two-tier cache for assistant answers: an in-process LRU in front of a shared
+database table (SQLite or PostgreSQL), so repeated questions skip the OpenAI
+call entirely
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from db import get_database
+from env_config import env_flag
+
+# Cache config from env (with defaults)
+RESPONSE_CACHE_ENABLED = env_flag("RESPONSE_CACHE_ENABLED")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))  # seconds
+RESPONSE_CACHE_MEMORY_SIZE = int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", "256"))  # entries per process
+RESPONSE_CACHE_DB_SIZE = int(os.getenv("RESPONSE_CACHE_DB_SIZE", "5000"))  # entries in SQLite
+
+# Run the SQLite size check once every N stores instead of on every write
+EVICTION_CHECK_INTERVAL = 50
+
+# Created by a versioned migration, so a reset database gets it back along with the rest of the schema
+RESPONSE_CACHE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS response_cache (
+        cache_key TEXT PRIMARY KEY,
+        question TEXT,
+        language TEXT,
+        model TEXT,
+        response TEXT NOT NULL,
+        created_at DOUBLE PRECISION NOT NULL,
+        expires_at DOUBLE PRECISION NOT NULL,
+        last_hit_at DOUBLE PRECISION NOT NULL,
+        hits INTEGER DEFAULT 0
+    )
+'''
+RESPONSE_CACHE_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_response_cache_last_hit ON response_cache (last_hit_at)'
+
+def normalize_question(question):
+    """Normalize a question so trivial variations share one cache entry"""
+    text = question.lower().strip()
+    text = re.sub(r"\s+", " ", text)
+    # Trailing punctuation ("Apa itu stunting?" vs "apa itu stunting") does not change the answer
+    return text.rstrip("?!.,;: ")
+
+def create_response_cache_table(conn):
+    """Shared cache tier; the same DDL runs on SQLite and PostgreSQL"""
+    conn.execute(RESPONSE_CACHE_TABLE_SQL)
+    conn.execute(RESPONSE_CACHE_INDEX_SQL)
+
+def make_cache_key(question, language, model, system_prompt, knowledge_version=""):
+    """Build the cache key from the normalized question, language, model, system prompt hash and knowledge version
+
+    Keying on the knowledge pack version invalidates cached answers when the knowledge base is edited.
+    """
+    prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+    raw = "\x1f".join([normalize_question(question), language, model, prompt_hash, knowledge_version or ""])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """In-process LRU tier backed by a shared SQLite table tier"""
+
+    def __init__(self, db_path, ttl=RESPONSE_CACHE_TTL, memory_size=RESPONSE_CACHE_MEMORY_SIZE,
+                 db_size=RESPONSE_CACHE_DB_SIZE):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.db_size = db_size
+        self._memory = OrderedDict()  # key -> (response, expires_at)
+        self._lock = threading.Lock()
+        self._stores_since_check = 0
+        self.stats = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+    def _database(self):
+        """Return the shared Database for db_path (the table comes from migrations)"""
+        return get_database(self.db_path)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _remember(self, key, response, expires_at):
+        """Put an entry into the LRU tier, evicting the least recently used one when full"""
+        with self._lock:
+            self._memory[key] = (response, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss"""
+        now = time.time()
+
+        # Tier 1: in-process LRU
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+        # Tier 2: shared SQLite table
+        try:
+            database = self._database()
+            row = database.fetchone('SELECT response, expires_at FROM response_cache WHERE cache_key = ?', (key,))
+            if row and row[1] > now:
+                database.execute(
+                    'UPDATE response_cache SET hits = hits + 1, last_hit_at = ? WHERE cache_key = ?',
+                    (now, key)
+                )
+                self._remember(key, row[0], row[1])
+                self._count("db_hits")
+                return row[0]
+            if row:
+                database.execute('DELETE FROM response_cache WHERE cache_key = ?', (key,))
+                self._count("expired")
+        except Exception as e:
+            print(f"Response cache read warning: {e}")
+
+        self._count("misses")
+        return None
+
+    def set(self, key, response, question=None, language=None, model=None):
+        """Store a response in both tiers"""
+        if not response:
+            return
+        now = time.time()
+        expires_at = now + self.ttl
+        self._remember(key, response, expires_at)
+        self._count("stores")
+
+        try:
+            database = self._database()
+            # Upsert rather than INSERT OR REPLACE so the statement also runs on PostgreSQL
+            database.execute('''
+                INSERT INTO response_cache
+                    (cache_key, question, language, model, response, created_at, expires_at, last_hit_at, hits)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    question = excluded.question, language = excluded.language, model = excluded.model,
+                    response = excluded.response, created_at = excluded.created_at,
+                    expires_at = excluded.expires_at, last_hit_at = excluded.last_hit_at, hits = 0
+            ''', (key, question, language, model, response, now, expires_at, now))
+
+            with self._lock:
+                self._stores_since_check += 1
+                check_size = self._stores_since_check >= EVICTION_CHECK_INTERVAL
+                if check_size:
+                    self._stores_since_check = 0
+            if check_size:
+                self._evict_db(database, now)
+        except Exception as e:
+            print(f"Response cache write warning: {e}")
+
+    def _evict_db(self, database, now):
+        """Drop expired rows, then the least recently hit rows above the size bound"""
+        with database.transaction() as conn:
+            cursor = conn.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,))
+            removed = cursor.rowcount
+            total = conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+            if total > self.db_size:
+                cursor = conn.execute('''
+                    DELETE FROM response_cache WHERE cache_key IN (
+                        SELECT cache_key FROM response_cache ORDER BY last_hit_at ASC LIMIT ?
+                    )
+                ''', (total - self.db_size,))
+                removed += cursor.rowcount
+        if removed:
+            self._count("evictions", removed)
+
+    def clear(self):
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+        try:
+            self._database().execute('DELETE FROM response_cache')
+        except Exception as e:
+            print(f"Response cache clear warning: {e}")
+
+    def get_stats(self):
+        """Return hit/miss counters plus the current LRU size and hit rate"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["db_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
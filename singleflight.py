@@ -0,0 +1,142 @@
+"""
+Singleflight Module
+Coalesces identical in-flight requests so concurrent callers with the same key
+share one upstream call (and its streamed progress) instead of each making their own
+"""
+
+import os
+import threading
+import time
+
+# Seconds a finished result is kept so double-submit reruns reuse it
+SINGLEFLIGHT_LINGER = float(os.getenv("SINGLEFLIGHT_LINGER", "5"))
+# Seconds between progress checks while a follower waits on the leader
+PROGRESS_POLL_INTERVAL = 0.05
+
+# Returned to followers when the leader was interrupted rather than failing
+_ABANDONED = object()
+
+class _Call:
+    """State of one in-flight upstream call shared by its leader and followers"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = False
+        self.partial = ""
+        self.version = 0
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+class SingleFlight:
+    """Run a function at most once at a time per key"""
+
+    def __init__(self, linger=SINGLEFLIGHT_LINGER):
+        self.linger = linger
+        self._lock = threading.Lock()
+        self._calls = {}   # key -> _Call currently in flight
+        self._recent = {}  # key -> (result, finished_at)
+        self.stats = {
+            "leaders": 0,
+            "followers": 0,
+            "recent_hits": 0,
+        }
+
+    def _purge_recent(self, now):
+        expired = [key for key, (_, finished_at) in self._recent.items() if now - finished_at > self.linger]
+        for key in expired:
+            del self._recent[key]
+
+    def do(self, key, fn, on_progress=None):
+        """Run fn(publish) once for all concurrent callers with the same key
+
+        The leader's fn may call publish(partial_text) to share streamed output;
+        followers receive it through on_progress. Returns (result, shared) where
+        shared is True when the result came from another caller's call.
+        Followers share the leader's Exception; when the leader is interrupted
+        instead (a BaseException), they retry and one of them leads.
+        """
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                self._purge_recent(now)
+                if key in self._recent:
+                    self.stats["recent_hits"] += 1
+                    return self._recent[key][0], True
+                call = self._calls.get(key)
+                if call is None:
+                    call = _Call()
+                    self._calls[key] = call
+                    self.stats["leaders"] += 1
+                    leader = True
+                else:
+                    self.stats["followers"] += 1
+                    leader = False
+
+            if leader:
+                return self._lead(key, call, fn), False
+            result = self._follow(call, on_progress)
+            if result is not _ABANDONED:
+                return result, True
+            # The leader's own session stopped it (rerun, navigation, shutdown); one follower takes over
+
+    def _lead(self, key, call, fn):
+        def publish(partial_text):
+            with call.cond:
+                call.partial = partial_text
+                call.version += 1
+                call.cond.notify_all()
+
+        try:
+            result = fn(publish)
+        except Exception as e:
+            self._finish_failed(key, call, error=e)
+            raise
+        except BaseException:
+            # Control flow of the leader's thread (Streamlit's RerunException/StopException,
+            # KeyboardInterrupt, SystemExit) is not the followers' business: they retry instead
+            self._finish_failed(key, call, abandoned=True)
+            raise
+
+        with self._lock:
+            self._calls.pop(key, None)
+            if self.linger > 0:
+                self._recent[key] = (result, time.monotonic())
+        with call.cond:
+            call.result = result
+            call.done = True
+            call.cond.notify_all()
+        return result
+
+    def _finish_failed(self, key, call, error=None, abandoned=False):
+        with self._lock:
+            self._calls.pop(key, None)
+        with call.cond:
+            call.error = error
+            call.abandoned = abandoned
+            call.done = True
+            call.cond.notify_all()
+
+    def _follow(self, call, on_progress):
+        seen_version = 0
+        while True:
+            with call.cond:
+                if not call.done and call.version == seen_version:
+                    call.cond.wait(PROGRESS_POLL_INTERVAL)
+                if call.done:
+                    if call.abandoned:
+                        return _ABANDONED
+                    if call.error is not None:
+                        raise call.error
+                    return call.result
+                partial, version = call.partial, call.version
+            if on_progress is not None and version != seen_version:
+                on_progress(partial)
+            seen_version = version
+
+    def get_stats(self):
+        """Return leader/follower counters and the number of calls in flight"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
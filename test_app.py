@@ -7,8 +7,23 @@ Tests basic functionality without running the full Streamlit app
 import os
 import sys
 import sqlite3
+import tempfile
 from pathlib import Path
 
+def import_app():
+    """Import app.py with DATABASE_URL pointed at a scratch file, so tests never touch the tracked database"""
+    if "app" not in sys.modules:
+        original_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='app-test-'), 'app.db')}"
+        try:
+            import app
+        finally:
+            if original_url is None:
+                os.environ.pop("DATABASE_URL", None)
+            else:
+                os.environ["DATABASE_URL"] = original_url
+    return sys.modules["app"]
+
 def test_imports():
     """Test if all modules can be imported"""
     print("🧪 Testing module imports...")
@@ -40,6 +55,14 @@ def test_database():
     """Test database creation and basic operations"""
     print("\n🗄️  Testing database functionality...")
     
+    # A scratch copy of the tracked database, so the test leaves the real file as it was
+    import shutil
+    scratch_dir = tempfile.mkdtemp(prefix="db-test-")
+    db_path = os.path.join(scratch_dir, "stunting_assistant.db")
+    if os.path.exists('stunting_assistant.db'):
+        shutil.copy('stunting_assistant.db', db_path)
+    original_url = os.environ.get("DATABASE_URL")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
     try:
         # Test database initialization
         from auth_utils import init_auth_db, create_demo_user
@@ -56,11 +79,11 @@ def test_database():
             print(f"ℹ️  Demo user status: {message}")
         
         # Test database connection
-        conn = sqlite3.connect('stunting_assistant.db')
+        conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         
-        # Check tables exist
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        # Check tables exist (chat_history becomes a view over chat_messages once migrated)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")
         tables = cursor.fetchall()
         table_names = [table[0] for table in tables]
         
@@ -87,6 +110,14 @@ def test_database():
     except Exception as e:
         print(f"❌ Database test failed: {e}")
         return False
+    finally:
+        from db import get_database
+        get_database(db_path).close_all()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        if original_url is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = original_url
 
 def test_knowledge_base():
     """Test the stunting knowledge base"""
@@ -125,6 +156,1564 @@ def test_knowledge_base():
         print(f"❌ Knowledge base test failed: {e}")
         return False
 
+def test_response_cache():
+    """Test the two-tier response cache"""
+    print("\n⚡ Testing response cache...")
+    
+    try:
+        import tempfile
+        from db import get_database
+        from migrations import apply_migrations, forget_schema
+        from response_cache import ResponseCache, make_cache_key
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, 'cache_test.db')
+            apply_migrations(get_database(db_path))
+            cache = ResponseCache(db_path, ttl=60, memory_size=2, db_size=10)
+            
+            key = make_cache_key("Apa itu stunting?", "indonesian", "gpt-4o", "prompt")
+            if key != make_cache_key("  apa itu   STUNTING ", "indonesian", "gpt-4o", "prompt"):
+                print("❌ Normalized questions produced different keys")
+                return False
+            if key == make_cache_key("Apa itu stunting?", "indonesian", "gpt-4o", "other prompt"):
+                print("❌ System prompt change did not change the key")
+                return False
+            
+            if cache.get(key) is not None:
+                print("❌ Empty cache returned a hit")
+                return False
+            cache.set(key, "Stunting adalah ...")
+            if cache.get(key) != "Stunting adalah ...":
+                print("❌ In-process tier miss after set")
+                return False
+            
+            # A second process only sees the shared SQLite tier
+            other = ResponseCache(db_path, ttl=60)
+            if other.get(key) != "Stunting adalah ..." or other.get_stats()["db_hits"] != 1:
+                print("❌ SQLite tier miss from a fresh cache")
+                return False
+            
+            expired = ResponseCache(db_path, ttl=-1)
+            expired.set("old", "stale answer")
+            if expired.get("old") is not None:
+                print("❌ Expired entry was served")
+                return False
+            
+            stats = cache.get_stats()
+            if stats["memory_hits"] != 1 or stats["misses"] != 1:
+                print(f"❌ Unexpected cache counters: {stats}")
+                return False
+            
+            # A reset database gets the table back from the migrations, with no per-instance flag to go stale
+            get_database(db_path).close_all()
+            os.remove(db_path)
+            forget_schema(get_database(db_path))
+            apply_migrations(get_database(db_path))
+            other.set(key, "Stunting adalah ...")
+            if ResponseCache(db_path).get(key) != "Stunting adalah ...":
+                print("❌ Cache table missing after a reset")
+                return False
+            get_database(db_path).close_all()
+        
+        print("✅ Response cache tiers, TTL and counters work")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Response cache test failed: {e}")
+        return False
+
+def test_singleflight():
+    """Test coalescing of identical in-flight calls"""
+    print("\n🛫 Testing singleflight coalescing...")
+    
+    try:
+        import threading
+        import time
+        from singleflight import SingleFlight
+        
+        flight = SingleFlight(linger=1)
+        upstream_calls = []
+        progress_seen = []
+        
+        def slow_call(publish):
+            upstream_calls.append(1)
+            publish("Stunting")
+            time.sleep(0.2)
+            return "Stunting adalah ..."
+        
+        results = []
+        def ask():
+            results.append(flight.do("apa itu stunting", slow_call, on_progress=progress_seen.append))
+        
+        threads = [threading.Thread(target=ask) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if len(upstream_calls) != 1:
+            print(f"❌ Expected 1 upstream call, got {len(upstream_calls)}")
+            return False
+        if any(result != "Stunting adalah ..." for result, _ in results):
+            print("❌ Followers did not receive the leader's result")
+            return False
+        if sum(1 for _, shared in results if shared) != 4:
+            print("❌ Expected 4 shared results")
+            return False
+        
+        # A double-submit right after completion reuses the lingering result
+        result, shared = flight.do("apa itu stunting", slow_call)
+        if not shared or len(upstream_calls) != 1:
+            print("❌ Double-submit was not collapsed")
+            return False
+        
+        # A leader stopped by its own session (Streamlit raises a BaseException) hands over to a follower
+        class StopSession(BaseException):
+            pass
+        follower_joined = threading.Event()
+        def interrupted_call(publish):
+            follower_joined.wait(5)
+            time.sleep(0.1)
+            raise StopSession()
+        outcomes = []
+        def lead():
+            try:
+                flight.do("gizi balita", interrupted_call)
+            except StopSession:
+                outcomes.append("stopped")
+        def follow():
+            follower_joined.set()
+            outcomes.append(flight.do("gizi balita", lambda publish: "Gizi seimbang ..."))
+        leader_thread = threading.Thread(target=lead)
+        leader_thread.start()
+        time.sleep(0.05)
+        follower_thread = threading.Thread(target=follow)
+        follower_thread.start()
+        leader_thread.join()
+        follower_thread.join()
+        if sorted(map(str, outcomes)) != sorted(["stopped", str(("Gizi seimbang ...", False))]):
+            print(f"❌ Interrupted leader leaked into its follower: {outcomes}")
+            return False
+        
+        print(f"✅ 5 concurrent callers shared 1 upstream call ({len(progress_seen)} progress updates)")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Singleflight test failed: {e}")
+        return False
+
+def test_openai_stub():
+    """Test the local OpenAI-compatible stub server"""
+    print("\n🧪 Testing OpenAI stub server...")
+    
+    try:
+        import httpx
+        from openai import OpenAI, RateLimitError
+        from openai_stub_server import start_stub_server
+        
+        server = start_stub_server(latency_ms=5, latency_jitter_ms=0, tokens_per_second=0)
+        failing = start_stub_server(latency_ms=0, latency_jitter_ms=0, error_429_rate=1.0)
+        try:
+            host, port = server.server_address
+            client = OpenAI(api_key="stub-key", base_url=f"http://{host}:{port}/v1",
+                            http_client=httpx.Client(), max_retries=0)
+            messages = [{"role": "user", "content": "Bagaimana mencegah stunting pada anak?"}]
+            
+            response = client.chat.completions.create(model="stub-model", messages=messages)
+            answer = response.choices[0].message.content
+            if "Posyandu" not in answer or "adalah" not in answer:
+                print("❌ Non-streaming call did not return the Indonesian canned answer")
+                return False
+            
+            stream = client.chat.completions.create(model="stub-model", messages=messages, stream=True)
+            streamed = "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+            if streamed != answer:
+                print("❌ Streamed answer differs from the non-streaming answer")
+                return False
+            
+            host, port = failing.server_address
+            client = OpenAI(api_key="stub-key", base_url=f"http://{host}:{port}/v1",
+                            http_client=httpx.Client(), max_retries=0)
+            try:
+                client.chat.completions.create(model="stub-model", messages=messages)
+                print("❌ Error injection did not return 429")
+                return False
+            except RateLimitError:
+                pass
+        finally:
+            server.shutdown()
+            failing.shutdown()
+        
+        print("✅ Stub server streams, answers and injects errors")
+        return True
+        
+    except Exception as e:
+        print(f"❌ OpenAI stub test failed: {e}")
+        return False
+
+def test_circuit_breaker():
+    """Test circuit breaker tripping, fast rejection and half-open recovery"""
+    print("\n🔌 Testing circuit breaker...")
+    
+    try:
+        import time
+        from circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN, CLOSED
+        
+        breaker = CircuitBreaker("test", window=4, min_calls=4, error_rate=0.5, open_seconds=0.2,
+                                 max_retries=1, backoff_base=0.001, backoff_cap=0.001)
+        attempts = []
+        
+        def failing_call():
+            attempts.append(1)
+            raise TimeoutError("upstream hung")
+        
+        for _ in range(2):
+            try:
+                breaker.call(failing_call)
+            except TimeoutError:
+                pass
+        if len(attempts) != 4 or breaker.state != OPEN:
+            print(f"❌ Expected 4 attempts and an open breaker, got {len(attempts)} / {breaker.state}")
+            return False
+        
+        # While open, calls are rejected without touching the upstream
+        start = time.monotonic()
+        try:
+            breaker.call(failing_call)
+            print("❌ Open breaker let a call through")
+            return False
+        except CircuitOpenError:
+            pass
+        if len(attempts) != 4 or time.monotonic() - start > 0.01:
+            print("❌ Open breaker did not fail fast")
+            return False
+        
+        # After the cool-down a successful half-open probe closes the breaker
+        time.sleep(0.25)
+        if breaker.call(lambda: "ok") != "ok" or breaker.state != CLOSED:
+            print("❌ Half-open probe did not close the breaker")
+            return False
+        
+        # A stream that fails after its first token is one call and one failure, not a success as well
+        app = import_app()
+        from types import SimpleNamespace
+        
+        def chunk(text):
+            return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+        
+        def broken_stream():
+            yield chunk(" dan")
+            raise ConnectionError("stream reset")
+        
+        original_breaker, original_open = app.openai_breaker, app.open_chat_stream
+        app.openai_breaker = CircuitBreaker("stream", min_calls=100)
+        try:
+            placeholder = SimpleNamespace(markdown=lambda text: None)
+            app.open_chat_stream = lambda messages: ("Gizi", iter([chunk(" seimbang")]))
+            if app.stream_chat_completion([], placeholder) != "Gizi seimbang":
+                print("❌ Streamed answer incomplete")
+                return False
+            app.open_chat_stream = lambda messages: ("Gizi", broken_stream())
+            try:
+                app.stream_chat_completion([], placeholder)
+            except ConnectionError:
+                pass
+            stats = app.openai_breaker.get_stats()
+        finally:
+            app.openai_breaker, app.open_chat_stream = original_breaker, original_open
+        if stats["calls"] != 2 or stats["failures"] != 1:
+            print(f"❌ Streamed calls recorded twice: {stats}")
+            return False
+        
+        print("✅ Breaker trips, fails fast and recovers")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Circuit breaker test failed: {e}")
+        return False
+
+def test_query_router():
+    """Test confidence-based routing between the knowledge base and OpenAI"""
+    print("\n🧭 Testing query router...")
+    
+    try:
+        from query_router import route_question, format_knowledge_answer
+        
+        expected = [
+            ("Apa penyebab stunting?", "knowledge", "penyebab"),
+            ("Bagaimana mencegah stunting?", "knowledge", "pencegahan"),
+            ("What are the early warning signs?", "knowledge", "early_warning_signs"),
+            ("Bagaimana situasi stunting di Jawa Barat saat ini?", "llm", None),
+            ("What's the economic impact of stunting in Indonesia?", "llm", None),
+        ]
+        for question, route, category in expected:
+            decision = route_question(question, threshold=0.6)
+            if decision["route"] != route or (category and decision["category"] != category):
+                print(f"❌ '{question}' routed to {decision['route']}/{decision['category']}")
+                return False
+        
+        answer = format_knowledge_answer("penyebab", "indonesian")
+        if not answer.startswith("### Penyebab Stunting") or "\n        " in answer:
+            print("❌ Knowledge answer is not formatted as dedented markdown")
+            return False
+        
+        print("✅ Router serves topic questions locally and sends open questions to OpenAI")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Query router test failed: {e}")
+        return False
+
+def test_keyword_index():
+    """Test the inverted keyword index ranking"""
+    print("\n🗂️  Testing inverted keyword index...")
+    
+    try:
+        from knowledge_index import stem, rank_categories
+        from stunting_knowledge import KEYWORD_INDEX
+        
+        if stem("pencegahan") != stem("mencegah") or stem("causes") != stem("cause"):
+            print("❌ Inflected forms do not share a stem")
+            return False
+        
+        # "factor" also appears in causes, which comes first in dict order
+        ranked = rank_categories(KEYWORD_INDEX['english'], "What are the risk factors?")
+        if not ranked or ranked[0][0] != "risk_factors":
+            print(f"❌ Expected risk_factors first, got {ranked}")
+            return False
+        
+        ranked = rank_categories(KEYWORD_INDEX['indonesian'], "Bagaimana cara mengobati anak?")
+        if not ranked or ranked[0][0] != "pengobatan":
+            print(f"❌ Expected pengobatan first, got {ranked}")
+            return False
+        
+        if rank_categories(KEYWORD_INDEX['english'], "basic tribune") != []:
+            print("❌ Unrelated message matched a category")
+            return False
+        
+        print("✅ Keyword index ranks the best category first")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Keyword index test failed: {e}")
+        return False
+
+def test_language_detection():
+    """Test the shared whole-word language detector"""
+    print("\n🌏 Testing language detection...")
+    
+    try:
+        from language_detection import detect_language, detect_languages
+        from stunting_knowledge_id import detect_indonesian
+        
+        cases = [
+            ("Apa itu stunting?", "indonesian"),
+            ("Bagaimana mencegah stunting?", "indonesian"),
+            ("Apa makanannya untuk bayi?", "indonesian"),
+            ("How to prevent stunting?", "english"),
+            # Substrings of English words ("asi" in "basic", "ibu" in "tribune") must not count
+            ("basic tribune about stunting", "english"),
+        ]
+        for message, expected in cases:
+            if detect_language(message) != expected:
+                print(f"❌ '{message}' detected as {detect_language(message)}")
+                return False
+        
+        if detect_indonesian("What is stunting?") or not detect_indonesian("Anak saya pendek"):
+            print("❌ detect_indonesian disagrees with the shared detector")
+            return False
+        
+        batch = detect_languages(["Apa itu stunting?", "What is stunting?", "Apa itu stunting?"])
+        if batch != ["indonesian", "english", "indonesian"]:
+            print(f"❌ Unexpected batch result: {batch}")
+            return False
+        
+        print("✅ Language detection works on whole words, single and batch")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Language detection test failed: {e}")
+        return False
+
+def test_knowledge_search():
+    """Test BM25-ranked knowledge search"""
+    print("\n🔎 Testing knowledge search...")
+    
+    try:
+        from stunting_knowledge import search_knowledge
+        
+        results = search_knowledge("growth chart percentile")
+        if not results or results[0]["category"] != "growth_monitoring":
+            print(f"❌ Unexpected ranking: {[r['category'] for r in results]}")
+            return False
+        scores = [r["score"] for r in results]
+        if scores != sorted(scores, reverse=True):
+            print(f"❌ Results not sorted by score: {scores}")
+            return False
+        if "**" not in results[0]["content"]:
+            print("❌ Snippet does not highlight query terms")
+            return False
+        
+        if search_knowledge("zat besi untuk ibu hamil", top_k=2)[0]["language"] != "indonesian":
+            print("❌ Indonesian query not searched in the Indonesian knowledge base")
+            return False
+        
+        if search_knowledge("xylophone quasar") != []:
+            print("❌ Unrelated query returned results")
+            return False
+        
+        print("✅ Knowledge search ranks with BM25 and highlights snippets")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Knowledge search test failed: {e}")
+        return False
+
+def test_knowledge_retrieval():
+    """Test vector retrieval of knowledge passages"""
+    print("\n🧲 Testing knowledge retrieval...")
+    
+    try:
+        from knowledge_retrieval import get_passage_index, retrieve, retrieve_batch, get_context_for_question
+        
+        index = get_passage_index("english")
+        if index["matrix"].shape[0] != len(index["passages"]):
+            print("❌ Passage matrix does not match the passages")
+            return False
+        
+        results = retrieve(index, "iron supplements during pregnancy", top_k=3)
+        if not results or len(results) > 3 or results[0]["category"] not in ("prevention", "causes", "nutrition_guidelines"):
+            print(f"❌ Unexpected retrieval: {[r['category'] for r in results]}")
+            return False
+        
+        queries = ["iron supplements during pregnancy", "signs of stunting in toddlers"]
+        batch = retrieve_batch(index, queries, top_k=3)
+        single = [retrieve(index, query, top_k=3) for query in queries]
+        if [[r["text"] for r in rows] for rows in batch] != [[r["text"] for r in rows] for rows in single]:
+            print("❌ Batch retrieval disagrees with single queries")
+            return False
+        
+        if retrieve(index, "xylophone quasar") != []:
+            print("❌ Unrelated query retrieved passages")
+            return False
+        
+        context = get_context_for_question("zat besi untuk ibu hamil", "indonesian")
+        if not context.startswith("Referensi") or "[1]" not in context:
+            print("❌ Indonesian context block not rendered")
+            return False
+        
+        print("✅ Knowledge retrieval ranks passages, single and batch")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Knowledge retrieval test failed: {e}")
+        return False
+
+def test_knowledge_pack():
+    """Test the compiled knowledge packs"""
+    print("\n📦 Testing knowledge packs...")
+    
+    try:
+        import textwrap
+        import knowledge_pack
+        
+        manifest = knowledge_pack._get_manifest()
+        if manifest["stale"]:
+            print("❌ Knowledge packs are stale, run: python knowledge_pack.py")
+            return False
+        if knowledge_pack.get_knowledge_version() != knowledge_pack.compute_version():
+            print("❌ Knowledge version does not match the sources")
+            return False
+        
+        english = knowledge_pack.get_pack("english")
+        compiled = knowledge_pack.compile_pack("english", manifest["version"])
+        compiled_phrases = {tuple(phrase) for phrase, _ in compiled["keyword_index"]["postings"]}
+        if english["topics"] != compiled["topics"] or set(english["keyword_index"]["postings"]) != compiled_phrases:
+            print("❌ Loaded pack differs from a fresh compile")
+            return False
+        # Snippet spans are derived on load rather than stored, and must match a full build
+        from knowledge_index import build_search_index
+        built = build_search_index(english["topics"])
+        if "documents" in compiled["search_index"] or english["search_index"]["idf"] != built["idf"] or \
+                [document["spans"] for document in english["search_index"]["documents"]] != [document["spans"] for document in built["documents"]]:
+            print("❌ Loaded search index differs from a full build")
+            return False
+        if any(textwrap.dedent(info["content"]) != info["content"] for info in english["topics"].values()):
+            print("❌ Pack content is not dedented")
+            return False
+        
+        print("✅ Knowledge packs are current and load per language")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Knowledge pack test failed: {e}")
+        return False
+
+def test_knowledge_fts():
+    """Test the SQLite FTS5 knowledge index"""
+    print("\n🗂️  Testing knowledge FTS index...")
+    
+    try:
+        import tempfile
+        import knowledge_fts
+        from db import get_database
+        from knowledge_fts import KnowledgeFTS
+        from knowledge_pack import get_knowledge_base
+        from migrations import apply_migrations, forget_schema
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            apply_migrations(get_database(os.path.join(tmp_dir, "fts.db")))
+            index = KnowledgeFTS(os.path.join(tmp_dir, "fts.db"))
+            first = index.sync()
+            if first["added"] != sum(len(get_knowledge_base(language)) for language in ("indonesian", "english")):
+                print(f"❌ Unexpected initial sync: {first}")
+                return False
+            if index.sync()["unchanged"] != first["added"]:
+                print("❌ Second sync reindexed unchanged entries")
+                return False
+            
+            results = index.search("growth chart percentile", "english", top_k=3)
+            if not results or results[0][0] != "growth_monitoring" or "**" not in results[0][2]:
+                print(f"❌ Unexpected FTS results: {results}")
+                return False
+            # Stemmed terms column: "pencegahan" finds the section about "mencegah"
+            if index.search("pencegahan stunting", "indonesian", top_k=1)[0][0] != "pencegahan":
+                print("❌ Indonesian stem matching failed")
+                return False
+            if index.search("xylophone", "english") != [] or index.search("???", "english") != []:
+                print("❌ Unrelated query returned results")
+                return False
+            get_database(os.path.join(tmp_dir, "fts.db")).close_all()
+            
+            # The shared index re-syncs into a reset database once it is cleared
+            original_url = os.environ.get("DATABASE_URL")
+            os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'shared.db')}"
+            knowledge_fts.clear_knowledge_fts()
+            try:
+                shared = get_database(os.path.join(tmp_dir, "shared.db"))
+                # A search never migrates the database itself
+                try:
+                    knowledge_fts.get_knowledge_fts()
+                    print("❌ Shared FTS index used an unmigrated database")
+                    return False
+                except RuntimeError:
+                    pass
+                if shared.fetchone("SELECT COUNT(*) FROM sqlite_master")[0]:
+                    print("❌ Knowledge search created tables")
+                    return False
+                apply_migrations(shared)
+                knowledge_fts.get_knowledge_fts()
+                shared.close_all()
+                os.remove(shared.path)
+                forget_schema(shared)
+                apply_migrations(shared)
+                knowledge_fts.clear_knowledge_fts()
+                found = knowledge_fts.get_knowledge_fts().search("growth chart percentile", "english", top_k=1)
+                shared.close_all()
+            finally:
+                knowledge_fts.clear_knowledge_fts()
+                if original_url is None:
+                    os.environ.pop("DATABASE_URL", None)
+                else:
+                    os.environ["DATABASE_URL"] = original_url
+            if not found:
+                print("❌ Shared FTS index empty after a database reset")
+                return False
+        
+        print("✅ Knowledge FTS index syncs incrementally and ranks with bm25()")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Knowledge FTS test failed: {e}")
+        return False
+
+def test_db_manager():
+    """Test the pooled SQLite connection manager"""
+    print("\n🔌 Testing database connection manager...")
+    
+    try:
+        import tempfile
+        import threading
+        from db import Database, resolve_db_path
+        
+        if resolve_db_path("sqlite:////tmp/x.db") != "/tmp/x.db" or resolve_db_path("sqlite:///a.db") != "a.db":
+            print("❌ DATABASE_URL resolution failed")
+            return False
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database = Database(os.path.join(tmp_dir, "pool.db"))
+            if database.connection() is not database.connection():
+                print("❌ Connection not reused within a thread")
+                return False
+            if database.fetchone("PRAGMA journal_mode")[0] != "wal":
+                print("❌ WAL mode not enabled")
+                return False
+            
+            with database.transaction() as conn:
+                conn.execute("CREATE TABLE items (value TEXT)")
+            try:
+                with database.transaction() as conn:
+                    conn.execute("INSERT INTO items VALUES ('lost')")
+                    raise RuntimeError("abort")
+            except RuntimeError:
+                pass
+            if database.fetchone("SELECT COUNT(*) FROM items")[0] != 0:
+                print("❌ Failed transaction was not rolled back")
+                return False
+            
+            # A reader on another thread is not blocked by an open write transaction
+            read_result = []
+            with database.transaction() as conn:
+                conn.execute("INSERT INTO items VALUES ('pending')")
+                reader = threading.Thread(target=lambda: read_result.append(database.fetchone("SELECT COUNT(*) FROM items")[0]))
+                reader.start()
+                reader.join(timeout=2)
+            if read_result != [0]:
+                print(f"❌ Reader blocked or saw uncommitted data: {read_result}")
+                return False
+            database.close_all()
+            if database.fetchone("SELECT COUNT(*) FROM items")[0] != 1:
+                print("❌ Reconnect after close_all failed")
+                return False
+            database.close_all()
+        
+        print("✅ Connection manager reuses WAL connections with transactional writes")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Database connection manager test failed: {e}")
+        return False
+
+def test_chat_writer():
+    """Test the write-behind chat writer"""
+    print("\n✍️  Testing chat writer...")
+    
+    try:
+        import tempfile
+        from chat_responses import create_response_store
+        from chat_schema import create_compact_schema
+        from chat_writer import ChatWriter
+        from db import get_database
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "chat.db")
+            database = get_database(db_path)
+            with database.transaction() as conn:
+                conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)")
+                conn.execute("INSERT INTO users (username, password) VALUES ('demo', 'x')")
+                create_compact_schema(conn)
+                create_response_store(conn)
+            
+            writer = ChatWriter(db_path, mode="async", flush_interval=0.05)
+            for i in range(50):
+                writer.save("demo", f"question {i}", f"answer {i}")
+            if not writer.flush(timeout=5):
+                print("❌ Flush timed out")
+                return False
+            stats = writer.get_stats()
+            if database.fetchone("SELECT COUNT(*) FROM chat_messages")[0] != 50 or stats["written"] != 50:
+                print(f"❌ Not every queued row was written: {stats}")
+                return False
+            if stats["batches"] >= 50 or stats["queue_depth"] != 0:
+                print(f"❌ Rows were not group-committed: {stats}")
+                return False
+            
+            sync_writer = ChatWriter(db_path, mode="sync", durability="full")
+            sync_writer.save("demo", "sync question", "sync answer")
+            if database.fetchone("SELECT COUNT(*) FROM chat_messages")[0] != 51:
+                print("❌ Sync mode did not write immediately")
+                return False
+            
+            writer.save("demo", "last question", "last answer")
+            if not writer.close() or database.fetchone("SELECT COUNT(*) FROM chat_messages")[0] != 52:
+                print("❌ Close did not flush pending rows")
+                return False
+            database.close_all()
+        
+        print("✅ Chat writer group-commits queued rows and flushes on close")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat writer test failed: {e}")
+        return False
+
+def test_chat_history_pagination():
+    """Test keyset pagination of chat history"""
+    print("\n📜 Testing chat history pagination...")
+    
+    try:
+        import tempfile
+        from chat_archive import add_archive_response_hash, create_archive_table
+        from chat_responses import create_response_store
+        from chat_schema import create_compact_schema
+        from db import Database
+        
+        app = import_app()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database = Database(os.path.join(tmp_dir, "history.db"))
+            original = app.database
+            app.database = database
+            try:
+                with database.transaction() as conn:
+                    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)")
+                    conn.executemany("INSERT INTO users (username, password) VALUES (?, 'x')", [("demo",), ("other",)])
+                    create_compact_schema(conn)
+                    create_archive_table(conn)
+                    create_response_store(conn)
+                    add_archive_response_hash(conn)
+                    # Several rows share a timestamp: the id breaks the tie
+                    rows = [(1, 1735689600000 + (i // 3) * 1000, f"q{i}", f"a{i}") for i in range(25)]
+                    rows.append((2, 1735689605000, "x", "y"))
+                    conn.executemany("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (?, ?, ?, ?)", rows)
+                
+                plan = database.fetchall('''EXPLAIN QUERY PLAN SELECT id FROM chat_messages
+                    WHERE user_id = (SELECT id FROM users WHERE username = ?)
+                    AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT 10''', ("demo", 1, 1))
+                if not any("idx_chat_messages_user_time" in str(step) for step in plan) or any("TEMP B-TREE" in str(step) for step in plan):
+                    print(f"❌ Pagination does not use the index: {plan}")
+                    return False
+                
+                seen = []
+                cursor = app.get_history_anchor("demo")
+                while cursor:
+                    page, cursor = app.get_chat_history_page("demo", cursor, page_size=10)
+                    seen.extend(message for message, _, _ in page)
+                if seen != [f"q{i}" for i in reversed(range(25))]:
+                    print(f"❌ Older pages skipped or repeated rows: {seen}")
+                    return False
+                
+                page, cursor = app.get_chat_history_page("demo", page_size=10, direction="newer")
+                newer, _ = app.get_chat_history_page("demo", cursor, page_size=10, direction="newer")
+                if [m for m, _, _ in page + newer] != [f"q{i}" for i in range(20)] or page[0][2] != "2025-01-01 00:00:00":
+                    print("❌ Newer pages out of order")
+                    return False
+            finally:
+                app.database = original
+                database.close_all()
+        
+        print("✅ Chat history pages through a (created_at, id) keyset on the index")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat history pagination test failed: {e}")
+        return False
+
+def test_chat_schema_migration():
+    """Test the chunked migration of legacy chat_history to chat_messages"""
+    print("\n🗜️  Testing chat schema migration...")
+    
+    try:
+        import tempfile
+        from chat_schema import get_chat_schema, migrate_chat_history
+        from db import Database
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database = Database(os.path.join(tmp_dir, "legacy.db"))
+            with database.transaction() as conn:
+                conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)")
+                conn.executemany("INSERT INTO users (username, password) VALUES (?, 'x')", [("demo",), ("budi",)])
+                conn.execute('''
+                    CREATE TABLE chat_history (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, message TEXT NOT NULL,
+                        response TEXT NOT NULL, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+                rows = [("demo" if i % 2 else "budi", f"q{i}", f"a{i}", f"2025-01-01 00:{i // 60:02d}:{i % 60:02d}") for i in range(95)]
+                conn.executemany("INSERT INTO chat_history (username, message, response, timestamp) VALUES (?, ?, ?, ?)", rows)
+            
+            copied = migrate_chat_history(database, chunk_size=20, pause=0)
+            conn = database.connection()
+            if copied != 95 or get_chat_schema(conn) != "compact":
+                print(f"❌ Migration copied {copied} rows")
+                return False
+            if conn.execute("SELECT name FROM sqlite_master WHERE name = 'chat_history_legacy'").fetchone():
+                print("❌ Legacy table kept although every row was migrated")
+                return False
+            types = conn.execute("SELECT DISTINCT typeof(user_id), typeof(created_at) FROM chat_messages").fetchall()
+            if types != [("integer", "integer")]:
+                print(f"❌ Columns are not integers: {types}")
+                return False
+            
+            # The compat view answers the legacy query shape and accepts legacy inserts
+            legacy = conn.execute("SELECT username, message, timestamp FROM chat_history WHERE id = 62").fetchone()
+            if legacy != ("demo", "q61", "2025-01-01 00:01:01"):
+                print(f"❌ Compat view returned {legacy}")
+                return False
+            conn.execute("INSERT INTO chat_history (username, message, response) VALUES ('demo', 'new', 'row')")
+            conn.execute("DELETE FROM chat_history WHERE username = 'budi'")
+            if conn.execute("SELECT COUNT(*) FROM chat_messages").fetchone()[0] != 96 - 48:
+                print("❌ Compat view triggers did not write through")
+                return False
+            
+            if migrate_chat_history(database) != 0:
+                print("❌ Migration is not idempotent")
+                return False
+            database.close_all()
+            
+            # Rows of usernames without an account are the only ones left in the legacy table
+            orphaned = Database(os.path.join(tmp_dir, "orphans.db"))
+            with orphaned.transaction() as conn:
+                conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)")
+                conn.execute("INSERT INTO users (username, password) VALUES ('demo', 'x')")
+                conn.execute("CREATE TABLE chat_history (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, message TEXT NOT NULL, response TEXT NOT NULL, timestamp TIMESTAMP)")
+                conn.executemany("INSERT INTO chat_history (username, message, response) VALUES (?, 'q', 'a')",
+                                 [("demo",), ("ghost",), ("demo",)])
+            migrate_chat_history(orphaned, pause=0)
+            kept = orphaned.fetchall("SELECT id, username FROM chat_history_legacy")
+            orphaned.close_all()
+            if kept != [(2, "ghost")]:
+                print(f"❌ Legacy table kept migrated rows: {kept}")
+                return False
+        
+        print("✅ Chat history migrated in chunks to integer keys and epoch-ms timestamps")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat schema migration test failed: {e}")
+        return False
+
+def test_migrations():
+    """Test user_version schema migrations"""
+    print("\n🧱 Testing schema migrations...")
+    
+    try:
+        import tempfile
+        import threading
+        from db import Database
+        from migrations import LATEST_VERSION, apply_migrations, ensure_schema, get_schema_version
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "fresh.db")
+            # Two processes' worth of connections racing on a new database
+            databases = [Database(db_path), Database(db_path)]
+            results = [None, None]
+            def run(i):
+                results[i] = apply_migrations(databases[i])
+            threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            applied = sorted(results, key=len)
+            if applied != [[], list(range(1, LATEST_VERSION + 1))]:
+                print(f"❌ Migrations did not run exactly once: {results}")
+                return False
+            database = databases[0]
+            if get_schema_version(database) != LATEST_VERSION or database.fetchone("SELECT COUNT(*) FROM users")[0] != 1:
+                print("❌ Fresh database not at the latest version with a demo user")
+                return False
+            
+            # After the first check a process never looks at the schema again
+            ensure_schema(database)
+            database.execute("PRAGMA user_version = 0")
+            ensure_schema(database)
+            if get_schema_version(database) != 0:
+                print("❌ ensure_schema re-ran migrations")
+                return False
+            
+            # A database from an older app version: legacy chat table, no user_version
+            legacy = Database(os.path.join(tmp_dir, "legacy.db"))
+            with legacy.transaction() as conn:
+                conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL, email TEXT)")
+                conn.execute("INSERT INTO users (username, password) VALUES ('budi', 'x')")
+                conn.execute("CREATE TABLE chat_history (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, message TEXT NOT NULL, response TEXT NOT NULL)")
+                conn.execute("INSERT INTO chat_history (username, message, response) VALUES ('budi', 'q', 'a')")
+            apply_migrations(legacy)
+            columns = [column[1] for column in legacy.fetchall("PRAGMA table_info(users)")]
+            if "name" not in columns or legacy.fetchone("SELECT COUNT(*) FROM chat_messages")[0] != 1:
+                print("❌ Legacy database was not upgraded")
+                return False
+            if legacy.fetchone("SELECT COUNT(*) FROM users")[0] != 1:
+                print("❌ Demo user added to a database that has users")
+                return False
+            
+            # A chat_messages table from before AUTOINCREMENT: ids must keep growing past the archived ones
+            from chat_archive import create_archive_table
+            from chat_responses import create_response_store
+            from chat_schema import CHAT_MESSAGES_SQL, create_compact_schema
+            from chat_search import create_chat_search_index, search_chat_history
+            from migrations import make_chat_ids_monotonic
+            old = Database(os.path.join(tmp_dir, "reused_ids.db"))
+            with old.transaction() as conn:
+                conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)")
+                conn.execute("INSERT INTO users (username, password) VALUES ('budi', 'x')")
+                conn.execute(CHAT_MESSAGES_SQL.replace(" AUTOINCREMENT", ""))
+                create_compact_schema(conn)
+                create_archive_table(conn)
+                create_response_store(conn)
+                create_chat_search_index(conn)
+                conn.executemany("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (1, 1, ?, 'a')",
+                                 [("gizi anak",), ("imunisasi",)])
+                conn.execute("INSERT INTO chat_messages_archive (id, user_id, created_at, body) VALUES (7, 1, 1, x'00')")
+                make_chat_ids_monotonic(conn)
+                conn.execute("INSERT INTO chat_history (username, message, response) VALUES ('budi', 'baru', 'b')")
+            table_sql = old.fetchone("SELECT sql FROM sqlite_master WHERE name = 'chat_messages'")[0]
+            ids = [row[0] for row in old.fetchall("SELECT id FROM chat_messages ORDER BY id")]
+            results, _ = search_chat_history("budi", "gizi", database=old)
+            if "AUTOINCREMENT" not in table_sql or ids != [1, 2, 8] or [row[0] for row in results] != [1]:
+                print(f"❌ chat_messages rebuild lost rows or reused ids: {ids}, {results}")
+                return False
+            old.execute("DELETE FROM chat_messages WHERE id = 8")
+            old.execute("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (1, 1, 'q', 'a')")
+            if old.fetchone("SELECT MAX(id) FROM chat_messages")[0] != 9:
+                print("❌ Id of a deleted row handed out again")
+                return False
+            for db in databases + [legacy, old]:
+                db.close_all()
+        
+        print("✅ Migrations apply once, in order, and sessions skip schema checks")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Migrations test failed: {e}")
+        return False
+
+def test_cached_resources():
+    """Test that app singletons survive script reruns and can be invalidated"""
+    print("\n🧰 Testing cached resources...")
+    
+    try:
+        import tempfile
+        import response_cache
+        from streamlit.testing.v1 import AppTest
+        
+        created = []
+        original_init = response_cache.ResponseCache.__init__
+        def counting_init(self, *args, **kwargs):
+            created.append(self)
+            original_init(self, *args, **kwargs)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            original_url = os.environ.get("DATABASE_URL")
+            os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'app.db')}"
+            response_cache.ResponseCache.__init__ = counting_init
+            try:
+                # Every interaction re-executes app.py; resources must be built once
+                app_test = AppTest.from_file("app.py", default_timeout=60)
+                app_test.run()
+                app_test.run()
+            finally:
+                response_cache.ResponseCache.__init__ = original_init
+                if original_url is None:
+                    os.environ.pop("DATABASE_URL", None)
+                else:
+                    os.environ["DATABASE_URL"] = original_url
+            if app_test.exception:
+                print(f"❌ App raised: {app_test.exception[0].message}")
+                return False
+            if len(created) > 1:
+                print(f"❌ Reruns rebuilt the response cache {len(created)} times")
+                return False
+        
+        # Importing the module neither migrates its database nor starts the archive job
+        import chat_archive
+        app = import_app()
+        if app.DB_PATH in chat_archive._schedulers or \
+                (os.path.exists(app.DB_PATH) and sqlite3.connect(app.DB_PATH).execute("PRAGMA user_version").fetchone()[0]):
+            print("❌ Importing app migrated or archived its database")
+            return False
+        prompt = app.build_system_prompt("Bagaimana cara mencegah stunting?", "indonesian")
+        if not prompt.startswith(app.SYSTEM_PROMPT_ID):
+            print("❌ System prompt has the wrong language")
+            return False
+        app.clear_cached_resource("knowledge")
+        summary = app.get_cached_resource_summary()
+        if summary["knowledge"]["indonesian"]["topics"] == 0 or set(app.CACHED_RESOURCES) - set(summary):
+            print(f"❌ Resource summary incomplete: {list(summary)}")
+            return False
+        
+        print("✅ Resources are cached across reruns and cleared through their hooks")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Cached resources test failed: {e}")
+        return False
+
+def test_postgres_backend():
+    """Test the PostgreSQL backend (the live part needs TEST_POSTGRES_URL)"""
+    print("\n🐘 Testing PostgreSQL backend...")
+    
+    try:
+        from db import resolve_database_target
+        
+        url = "postgresql://app:secret@db:5432/stunting"
+        if resolve_database_target(url) != url or resolve_database_target("sqlite:///local.db") != "local.db":
+            print("❌ DATABASE_URL not routed to the right backend")
+            return False
+        
+        try:
+            from db_postgres import translate_placeholders
+        except ImportError as e:
+            print(f"⚠️  PostgreSQL backend not importable, skipping: {e}")
+            return True
+        translated = translate_placeholders("SELECT '?', 'a%b' FROM t WHERE x = ? AND y LIKE 'z%' AND w = ?")
+        if translated != "SELECT '?', 'a%%b' FROM t WHERE x = %s AND y LIKE 'z%%' AND w = %s":
+            print(f"❌ Placeholder translation wrong: {translated}")
+            return False
+        
+        test_url = os.getenv("TEST_POSTGRES_URL")
+        if not test_url:
+            print("✅ Placeholders translated (set TEST_POSTGRES_URL to run against a live PostgreSQL)")
+            return True
+        
+        import tempfile
+        from db import Database, get_database
+        from migrate_to_postgres import migrate
+        from migrations import apply_migrations
+        
+        target = get_database(test_url)
+        with target.transaction() as conn:
+            conn.execute("DROP TABLE IF EXISTS chat_messages, users, response_cache, schema_version CASCADE")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = Database(os.path.join(tmp_dir, "source.db"))
+            apply_migrations(source)  # creates the demo user
+            with source.transaction() as conn:
+                conn.executemany("INSERT INTO users (username, password) VALUES (?, 'x')", [(f"user{i}",) for i in range(5)])
+                conn.executemany(
+                    "INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (?, ?, ?, ?)",
+                    [(2 + i % 5, 1735689600000 + i, f"q{i}", f"a{i}") for i in range(250)])
+            source.close_all()
+            
+            counts = migrate(os.path.join(tmp_dir, "source.db"), test_url, batch_size=40)
+            again = migrate(os.path.join(tmp_dir, "source.db"), test_url, batch_size=40)
+        if counts["copied"] != 250 or again["copied"] != 0 or again["existing"] != 250:
+            print(f"❌ Migration copied {counts} then {again}")
+            return False
+        if target.fetchone("SELECT COUNT(*) FROM users")[0] != 6:
+            print("❌ Users duplicated or missing")
+            return False
+        
+        # The same keyset page query the app runs
+        rows = target.fetchall('''
+            SELECT id, message FROM chat_messages WHERE user_id = (SELECT id FROM users WHERE username = ?)
+            AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?
+        ''', ("user0", 2 ** 62, 2 ** 62, 10))
+        if len(rows) != 10 or rows[0][1] != "q245":
+            print(f"❌ Keyset page wrong: {rows[:2]}")
+            return False
+        # The id sequence was moved past the copied ids
+        with target.transaction() as conn:
+            conn.execute('''INSERT INTO chat_messages (user_id, created_at, message, response)
+                SELECT id, 1, 'new', 'row' FROM users WHERE username = ?''', ("demo",))
+        target.close_all()
+        
+        print("✅ PostgreSQL backend migrates SQLite data and serves app queries")
+        return True
+        
+    except Exception as e:
+        print(f"❌ PostgreSQL backend test failed: {e}")
+        return False
+
+def test_chat_export():
+    """Test the incremental Parquet export of chat history"""
+    print("\n📦 Testing chat export...")
+    
+    try:
+        import tempfile
+        import time
+        import pyarrow.dataset as ds
+        from chat_export import export_chat_history, pseudonymize
+        from db import Database
+        from migrations import apply_migrations
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database = Database(os.path.join(tmp_dir, "chat.db"))
+            apply_migrations(database)
+            jan, feb = 1735689600000, 1738368000000  # 2025-01-01, 2025-02-01 UTC
+            with database.transaction() as conn:
+                rows = [(1, jan + i, "Bagaimana cara mencegah stunting pada anak?", "a") for i in range(30)]
+                rows += [(1, feb + i, "What causes stunting?", "b") for i in range(20)]
+                conn.executemany("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (?, ?, ?, ?)", rows)
+            
+            output = os.path.join(tmp_dir, "export")
+            first = export_chat_history(output, database, batch_size=7, pseudonymize_users=True, pseudonym_key="k")
+            partitions = sorted(os.path.relpath(os.path.dirname(f), ".") for f in first["files"])
+            if first["rows"] != 50 or partitions != ["month=2025-01/language=indonesian", "month=2025-02/language=english"]:
+                print(f"❌ Unexpected partitions: {first}")
+                return False
+            
+            with database.transaction() as conn:
+                conn.execute("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (1, ?, 'What is stunting?', 'c')", (feb + 99,))
+            second = export_chat_history(output, database, batch_size=7, pseudonymize_users=True, pseudonym_key="k")
+            if second["rows"] != 1 or second["from_id"] != 50:
+                print(f"❌ Incremental export did not resume from the watermark: {second}")
+                return False
+            
+            # Deleting the newest rows must not hand their ids to the next ones, or the watermark skips them
+            with database.transaction() as conn:
+                conn.execute("DELETE FROM chat_messages WHERE id >= 50")
+                conn.executemany("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (1, ?, 'What is stunting?', 'd')",
+                                 [(feb + 100,), (feb + 101,)])
+            third = export_chat_history(output, database, batch_size=7, pseudonymize_users=True, pseudonym_key="k")
+            if third["rows"] != 2 or third["last_id"] != 53:
+                print(f"❌ Rows inserted after deleting the newest ones were skipped: {third}")
+                return False
+            
+            # A row the archive job moves between the hot and the archive read is exported once
+            import chat_export
+            original_fetch = chat_export.fetch_archived_rows
+            chat_export.fetch_archived_rows = lambda db, after_id, end_id, limit: \
+                db.fetchall(chat_export.EXPORT_SQL, (after_id, end_id, limit))[:1]
+            try:
+                moved = export_chat_history(os.path.join(tmp_dir, "moved"), database, batch_size=7, full=True)
+            finally:
+                chat_export.fetch_archived_rows = original_fetch
+            if moved["rows"] != 51:
+                print(f"❌ Row moved mid-batch exported twice: {moved}")
+                return False
+            
+            # On PostgreSQL the newest rows wait out the safety window
+            from chat_export import export_upper_bound
+            with database.transaction() as conn:
+                conn.execute("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (1, ?, 'baru', 'e')",
+                             (int(time.time() * 1000),))
+            database.backend = "postgres"
+            try:
+                held_back = export_upper_bound(database, safety_window=60)
+            finally:
+                del database.backend
+            if held_back != 53 or export_upper_bound(database) != 54:
+                print(f"❌ Safety window not applied: {held_back}")
+                return False
+            
+            table = ds.dataset(output, format="parquet", partitioning="hive").to_table()
+            users = set(table.column("user").to_pylist())
+            if table.num_rows != 53 or users != {pseudonymize("demo", "k")}:
+                print(f"❌ Dataset has {table.num_rows} rows, users {users}")
+                return False
+            if os.path.exists(os.path.join(output, "_staging")):
+                print("❌ Staging files left behind")
+                return False
+            database.close_all()
+        
+        print("✅ Chat history exported incrementally to month/language Parquet partitions")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat export test failed: {e}")
+        return False
+
+def test_chat_search():
+    """Test full-text search over a user's chat history"""
+    print("\n🔎 Testing chat history search...")
+    
+    try:
+        import tempfile
+        from chat_search import search_chat_history
+        from db import Database
+        from migrations import apply_migrations
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database = Database(os.path.join(tmp_dir, "chat.db"))
+            apply_migrations(database)
+            with database.transaction() as conn:
+                conn.execute("INSERT INTO users (username, password) VALUES ('budi', 'x')")
+                rows = [(1, 1735689600000 + i, f"pertanyaan {i} tentang imunisasi", "jawaban umum") for i in range(2000)]
+                rows += [(1, 1735689700000 + i, f"Kapan mulai MPASI? ({i})", "MPASI dimulai pada usia 6 bulan") for i in range(25)]
+                rows.append((2, 1735689800000, "Menu MPASI untuk bayi?", "Bubur saring"))
+                conn.executemany("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (?, ?, ?, ?)", rows)
+            
+            results, has_more = search_chat_history("demo", "mpasi", database=database)
+            if len(results) != 10 or not has_more or "**MPASI**" not in results[0][2]:
+                print(f"❌ Search returned {results[:1]}")
+                return False
+            pages = [row_id for row_id, *_ in results]
+            page = 1
+            while has_more:
+                results, has_more = search_chat_history("demo", "mpasi", page=page, database=database)
+                pages.extend(row_id for row_id, *_ in results)
+                page += 1
+            if len(pages) != 25 or len(set(pages)) != 25:
+                print(f"❌ Pagination returned {len(pages)} rows")
+                return False
+            
+            plan = " ".join(str(step) for step in database.fetchall(
+                "EXPLAIN QUERY PLAN SELECT rowid FROM chat_messages_fts WHERE chat_messages_fts MATCH 'x'"))
+            if "VIRTUAL TABLE INDEX" not in plan:
+                print(f"❌ Search does not use the FTS index: {plan}")
+                return False
+            
+            # Deleting a user's history (as delete_user does) removes it from the index
+            database.execute("DELETE FROM chat_messages WHERE user_id = (SELECT id FROM users WHERE username = 'budi')")
+            budi, _ = search_chat_history("budi", "mpasi", database=database)
+            demo, _ = search_chat_history("demo", "bubur saring", database=database)
+            if budi or demo:
+                print("❌ Deleted or other users' rows found")
+                return False
+            if database.fetchone("INSERT INTO chat_messages_fts (chat_messages_fts) VALUES ('integrity-check')") is not None:
+                print("❌ FTS index inconsistent")
+                return False
+            database.close_all()
+        
+        print("✅ Chat history search is ranked, paginated and kept in sync by triggers")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat history search test failed: {e}")
+        return False
+
+def test_chat_archive():
+    """Test moving old chat history into the compressed archive"""
+    print("\n🗃️ Testing chat history archive...")
+    
+    try:
+        import tempfile
+        import json
+        from chat_archive import (RAW_BODY_PREFIX, archive_old_chats, backfill_archived_responses, compress_body,
+                                  decompress_body, fetch_archived_page, get_archive_stats)
+        from chat_export import export_chat_history
+        from chat_schema import now_ms
+        from db import Database
+        from migrations import apply_migrations
+        import pyarrow.parquet as pq
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database = Database(os.path.join(tmp_dir, "chat.db"))
+            apply_migrations(database)
+            day = 24 * 60 * 60 * 1000
+            old = now_ms() - 200 * day
+            answer = "Stunting dapat dicegah dengan gizi seimbang, ASI eksklusif dan MPASI yang tepat. " * 5
+            with database.transaction() as conn:
+                rows = [(1, old + i, f"Pertanyaan lama {i}", answer) for i in range(250)]
+                rows += [(1, now_ms() - day + i, f"Pertanyaan baru {i}", answer) for i in range(30)]
+                conn.executemany("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (?, ?, ?, ?)", rows)
+            
+            summary = archive_old_chats(database, max_age_days=90, batch_size=100, pause=0)
+            stats = get_archive_stats(database)
+            if summary["rows"] != 250 or summary["batches"] != 3 or stats != {
+                    "hot_rows": 30, "archived_rows": 250, "archived_bytes": summary["archived_bytes"],
+                    "archived_answer_chars": len(answer)}:
+                print(f"❌ Archive moved {summary} -> {stats}")
+                return False
+            # The 250 copies of the answer share one stored body instead of one each
+            if database.fetchone("SELECT COUNT(*) FROM chat_responses")[0] != 1 or \
+                    database.fetchone("SELECT COUNT(*) FROM chat_messages_archive WHERE response_hash IS NULL")[0]:
+                print("❌ Archived answers not shared through chat_responses")
+                return False
+            if summary["archived_bytes"] > summary["raw_bytes"] + summary["rows"]:
+                print(f"❌ Archive grew the rows: {summary}")
+                return False
+            if archive_old_chats(database, max_age_days=90, pause=0)["rows"] != 0:
+                print("❌ Second run archived rows again")
+                return False
+            
+            # Short rows that zlib would grow are stored as they are
+            if compress_body("q")[:1] != RAW_BODY_PREFIX or decompress_body(compress_body("q")) != "q":
+                print("❌ Short row not stored raw")
+                return False
+            
+            # An id already in the archive stops the batch instead of dropping the hot row
+            with database.transaction() as conn:
+                conn.execute("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (1, ?, 'bentrok', 'x')", (old,))
+                clash = conn.execute("SELECT MAX(id) FROM chat_messages").fetchone()[0]
+                conn.execute("INSERT INTO chat_messages_archive (id, user_id, created_at, body) VALUES (?, 1, ?, ?)",
+                             (clash, old, compress_body("lama")))
+            try:
+                archive_old_chats(database, max_age_days=90, pause=0)
+                print("❌ Archiving over an existing archive id succeeded")
+                return False
+            except Exception:
+                pass
+            if database.fetchone("SELECT COUNT(*) FROM chat_messages WHERE id = ?", (clash,))[0] != 1:
+                print("❌ Hot row lost on an archive id conflict")
+                return False
+            with database.transaction() as conn:
+                conn.execute("DELETE FROM chat_messages_archive WHERE id = ?", (clash,))
+                conn.execute("DELETE FROM chat_messages WHERE id = ?", (clash,))
+            
+            # Archived rows read back decompressed, in the history keyset order
+            page = fetch_archived_page(database, "demo", cursor=(old + 200, 201), limit=3)
+            if [row[0] for row in page] != [200, 199, 198] or page[0][1:] != ("Pertanyaan lama 199", answer, old + 199):
+                print(f"❌ Archived page wrong: {page[:1]}")
+                return False
+            
+            # Rows archived with the answer inside the body are converted to the shared store
+            pair = ("Pertanyaan arsip", "Jawaban arsip")
+            with database.transaction() as conn:
+                conn.execute("INSERT INTO chat_messages_archive (id, user_id, created_at, body) VALUES (1000, 1, ?, ?)",
+                             (old, compress_body(json.dumps(list(pair)))))
+            if fetch_archived_page(database, "demo", cursor=(old + 1, 0), limit=1)[0][1:3] != pair:
+                print("❌ Archived pair body not read")
+                return False
+            if backfill_archived_responses(database, pause=0) != 1 or \
+                    database.fetchone("SELECT COUNT(*) FROM chat_responses")[0] != 2 or \
+                    fetch_archived_page(database, "demo", cursor=(old + 1, 0), limit=1)[0][1:3] != pair:
+                print("❌ Archived pair body not converted")
+                return False
+            with database.transaction() as conn:
+                conn.execute("DELETE FROM chat_messages_archive WHERE id = 1000")
+            
+            # Exports still see every row, hot and archived
+            export_dir = os.path.join(tmp_dir, "export")
+            exported = export_chat_history(export_dir, database=database, batch_size=64)
+            ids = sorted(pq.read_table(export_dir).column("id").to_pylist())
+            if exported["rows"] != 280 or ids != list(range(1, 281)):
+                print(f"❌ Export saw {exported['rows']} rows")
+                return False
+            database.close_all()
+        
+        print("✅ Old chat history is archived compressed and still read by history and exports")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Chat archive test failed: {e}")
+        return False
+
+def test_response_dedup():
+    """Test content-addressed storage of chat responses"""
+    print("\n🧬 Testing response deduplication...")
+    
+    try:
+        import tempfile
+        from chat_archive import archive_old_chats
+        from chat_responses import (backfill_response_hashes, collect_orphan_responses, get_response_store_stats,
+                                    response_hash)
+        from chat_search import search_chat_history
+        from chat_writer import ChatWriter
+        from db import Database
+        from migrations import apply_migrations
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "chat.db")
+            database = Database(db_path)
+            apply_migrations(database)
+            answer = "Stunting dicegah dengan ASI eksklusif dan MPASI bergizi."
+            with database.transaction() as conn:
+                conn.execute("INSERT INTO users (username, password) VALUES ('budi', 'x')")
+                # Rows written before the switch carry their text in the response column
+                conn.executemany("INSERT INTO chat_messages (user_id, created_at, message, response) VALUES (?, ?, ?, ?)",
+                                 [(1, 1000 + i, f"Pertanyaan {i}", answer) for i in range(40)])
+            if backfill_response_hashes(database, chunk_size=15, pause=0) != 40:
+                print("❌ Backfill did not convert every row")
+                return False
+            
+            writer = ChatWriter(db_path, mode="sync")
+            for i in range(20):
+                writer.save("budi" if i % 2 else "demo", f"Tanya {i}", answer)
+            writer.save("budi", "Tanya unik", "Jawaban khusus untuk budi")
+            stats = get_response_store_stats(database)
+            if stats["chat_rows"] != 61 or stats["rows_by_hash"] != 61 or stats["distinct_responses"] != 2:
+                print(f"❌ Responses not deduplicated: {stats}")
+                return False
+            if database.fetchone("SELECT COUNT(*) FROM chat_messages WHERE response <> ''")[0]:
+                print("❌ Response text still stored per row")
+                return False
+            
+            # Every read path resolves the body
+            history = database.fetchall("SELECT DISTINCT response FROM chat_history")
+            results, _ = search_chat_history("budi", "khusus", database=database)
+            if sorted(history) != sorted([(answer,), ("Jawaban khusus untuk budi",)]) or len(results) != 1:
+                print(f"❌ Resolved responses wrong: {history}, {results}")
+                return False
+            
+            # Deleting budi's rows (as delete_user does) frees only the body nobody else uses
+            with database.transaction() as conn:
+                hashes = [row[0] for row in conn.execute("SELECT DISTINCT response_hash FROM chat_messages WHERE user_id = 2")]
+                conn.execute("DELETE FROM chat_messages WHERE user_id = 2")
+                collected = collect_orphan_responses(conn, hashes)
+            if collected != 1 or get_response_store_stats(database)["distinct_responses"] != 1:
+                print(f"❌ Garbage collection removed {collected} bodies")
+                return False
+            
+            # Archived rows keep referencing the body, so it survives until they are deleted too
+            archive_old_chats(database, max_age_days=0, pause=0)
+            with database.transaction() as conn:
+                collected = collect_orphan_responses(conn, hashes + [response_hash(answer)])
+            if collected or get_response_store_stats(database)["distinct_responses"] != 1:
+                print(f"❌ Garbage collection removed {collected} archived bodies")
+                return False
+            with database.transaction() as conn:
+                conn.execute("DELETE FROM chat_messages_archive")
+                collected = collect_orphan_responses(conn, [response_hash(answer)])
+            if collected != 1 or get_response_store_stats(database)["distinct_responses"] != 0:
+                print(f"❌ Garbage collection removed {collected} bodies after the archive was emptied")
+                return False
+            if database.fetchone("INSERT INTO chat_messages_fts (chat_messages_fts) VALUES ('integrity-check')") is not None:
+                print("❌ FTS index inconsistent")
+                return False
+            database.close_all()
+        
+        print("✅ Chat responses are stored once, resolved on read and garbage-collected")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Response deduplication test failed: {e}")
+        return False
+
+def test_user_import():
+    """Test bulk user import from CSV and JSONL"""
+    print("\n👥 Testing bulk user import...")
+    
+    try:
+        import csv
+        import tempfile
+        from auth_utils import verify_password
+        from db import Database
+        from migrations import apply_migrations
+        from user_import import import_users
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database = Database(os.path.join(tmp_dir, "users.db"))
+            apply_migrations(database)
+            csv_path = os.path.join(tmp_dir, "kader.csv")
+            with open(csv_path, "w", newline="", encoding="utf-8") as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(["username", "password", "email", "name"])
+                writer.writerows([f"kader{i}", f"rahasia{i}", f"kader{i}@desa.id", f"Kader {i}"] for i in range(500))
+                writer.writerow(["ibu budi", "x", "", ""])             # line 502: space in username
+                writer.writerow(["ibu_sari", "", "", ""])              # line 503: no password
+                writer.writerow(["ibu_ani", "x", "bukan-email", ""])   # line 504: bad email
+                writer.writerow(["kader7", "lagi", "", ""])            # line 505: repeated username
+            
+            summary = import_users(csv_path, database=database, batch_size=64, workers=2, rounds=4)
+            if (summary["inserted"], summary["updated"], summary["errors"]) != (500, 0, 4):
+                print(f"❌ CSV import summary wrong: {summary}")
+                return False
+            with open(summary["report"], encoding="utf-8") as report_file:
+                lines = [row["line"] for row in csv.DictReader(report_file)]
+            if lines != ["502", "503", "504", "505"]:
+                print(f"❌ Error report lines wrong: {lines}")
+                return False
+            stored = database.fetchone("SELECT password, email FROM users WHERE username = 'kader42'")
+            if not verify_password("rahasia42", stored[0]) or stored[1] != "kader42@desa.id":
+                print("❌ Imported account cannot log in")
+                return False
+            
+            # Upsert: existing accounts get the new password, keep their email; --skip-existing leaves them alone
+            jsonl_path = os.path.join(tmp_dir, "ibu.jsonl")
+            with open(jsonl_path, "w", encoding="utf-8") as jsonl_file:
+                jsonl_file.write('{"username": "kader42", "password": "baru"}\n')
+                jsonl_file.write('{"username": "ibu_rina", "password": "x", "name": "Ibu Rina"}\n')
+                jsonl_file.write('{"username": \n')
+            summary = import_users(jsonl_path, database=database, workers=0, rounds=4)
+            stored = database.fetchone("SELECT password, email FROM users WHERE username = 'kader42'")
+            if (summary["inserted"], summary["updated"], summary["errors"]) != (1, 1, 1) \
+                    or not verify_password("baru", stored[0]) or stored[1] != "kader42@desa.id":
+                print(f"❌ JSONL upsert wrong: {summary}")
+                return False
+            summary = import_users(jsonl_path, database=database, workers=0, rounds=4, skip_existing=True)
+            if (summary["inserted"], summary["skipped"]) != (0, 2):
+                print(f"❌ skip_existing changed accounts: {summary}")
+                return False
+            
+            # Existing usernames are looked up in chunks that fit SQLite's variable limit
+            import user_import
+            original_limit = user_import.MAX_SQL_VARIABLES
+            user_import.MAX_SQL_VARIABLES = 7
+            try:
+                summary = import_users(csv_path, database=database, batch_size=64, workers=0, rounds=4, skip_existing=True)
+            finally:
+                user_import.MAX_SQL_VARIABLES = original_limit
+            if summary["inserted"] or summary["skipped"] + summary["errors"] != summary["rows"]:
+                print(f"❌ Chunked lookup of existing accounts wrong: {summary}")
+                return False
+            database.close_all()
+        
+        print("✅ Bulk import validates rows, upserts in batches and reports errors per line")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Bulk user import test failed: {e}")
+        return False
+
+def test_password_hashing():
+    """Test bcrypt hashing in the worker pool and rehash-on-login"""
+    print("\n🔐 Testing password hashing...")
+    
+    try:
+        import hashlib
+        import sqlite3
+        import tempfile
+        import auth_utils
+        import password_hashing
+        from db import get_database
+        from migrations import apply_migrations
+        
+        hasher = password_hashing.PasswordHasher(workers=1, rounds=4)
+        stored = hasher.hash("rahasia").result(timeout=60)
+        if not stored.startswith("$2b$04$") or not hasher.verify("rahasia", stored).result(timeout=60) \
+                or hasher.verify("salah", stored).result(timeout=60):
+            print("❌ bcrypt hash or verification through the pool failed")
+            return False
+        legacy = hashlib.sha256(b"rahasia").hexdigest()
+        if not password_hashing.verify_password("rahasia", legacy) or not password_hashing.needs_rehash(legacy, 4) \
+                or password_hashing.needs_rehash(stored, 4) or not password_hashing.needs_rehash(stored, 12):
+            print("❌ Legacy hashes or rehash checks wrong")
+            return False
+        # The dummy hash for unknown usernames is computed as soon as the pool starts
+        if not hasher._dummy_hash.result(timeout=60).startswith("$2b$04$") \
+                or hasher.verify("", hasher.dummy_hash()).result(timeout=60):
+            print("❌ Dummy hash not precomputed at pool start")
+            return False
+        hasher.close()
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            original_url = os.environ.get("DATABASE_URL")
+            os.environ["DATABASE_URL"] = f"sqlite:///{tmp_dir}/auth.db"
+            original_hasher = password_hashing._hasher
+            password_hashing._hasher = password_hashing.PasswordHasher(workers=1, rounds=4)
+            try:
+                database = get_database()
+                apply_migrations(database)
+                database.execute("INSERT INTO users (username, password, name) VALUES ('bidan', ?, 'Bidan Desa')", (legacy,))
+                
+                future = auth_utils.submit_authentication("bidan", "rahasia")
+                if future.result(timeout=60) != (True, "Bidan Desa"):
+                    print(f"❌ Legacy login failed: {future.result()}")
+                    return False
+                # The upgrade is written by the rehash thread, not on the pool's callback thread
+                auth_utils._rehash_queue.join()
+                upgraded = database.fetchone("SELECT password FROM users WHERE username = 'bidan'")[0]
+                if not upgraded.startswith("$2b$04$") or auth_utils.authenticate_user("bidan", "rahasia") != (True, "Bidan Desa"):
+                    print(f"❌ Legacy hash not upgraded: {upgraded}")
+                    return False
+                # The migration's demo account uses a hash computed ahead of time
+                if auth_utils.authenticate_user("demo", "demo123") != (True, "Demo User"):
+                    print("❌ Migrated demo account cannot log in")
+                    return False
+                if auth_utils.authenticate_user("bidan", "salah")[0] or auth_utils.authenticate_user("tidak_ada", "x")[0]:
+                    print("❌ Wrong password or unknown user accepted")
+                    return False
+                # Registration hashes before it takes the write lock: another connection can still write meanwhile
+                probe = sqlite3.connect(os.path.join(tmp_dir, "auth.db"), timeout=0)
+                writable_while_hashing = []
+                original_hash = auth_utils.hash_password
+                def probing_hash(password):
+                    try:
+                        probe.execute("BEGIN IMMEDIATE")
+                        probe.execute("ROLLBACK")
+                        writable_while_hashing.append(True)
+                    except sqlite3.OperationalError:
+                        writable_while_hashing.append(False)
+                    return original_hash(password)
+                auth_utils.hash_password = probing_hash
+                try:
+                    success, _ = auth_utils.register_user("kader", "aman123", "kader@desa.id", "Kader")
+                finally:
+                    auth_utils.hash_password = original_hash
+                    probe.close()
+                if writable_while_hashing != [True]:
+                    print("❌ Registration hashed inside its write transaction")
+                    return False
+                if not success or auth_utils.authenticate_user("kader", "aman123") != (True, "Kader"):
+                    print("❌ Registered user cannot log in")
+                    return False
+                database.close_all()
+            finally:
+                password_hashing._hasher.close()
+                password_hashing._hasher = original_hasher
+                if original_url is None:
+                    os.environ.pop("DATABASE_URL", None)
+                else:
+                    os.environ["DATABASE_URL"] = original_url
+        
+        print("✅ Passwords are bcrypt-hashed in the pool and legacy hashes upgrade on login")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Password hashing test failed: {e}")
+        return False
+
 def test_config():
     """Test configuration loading"""
     print("\n⚙️  Testing configuration...")
@@ -190,6 +1779,30 @@ def main():
         ("Module Imports", test_imports),
         ("Database Operations", test_database),
         ("Knowledge Base", test_knowledge_base),
+        ("Response Cache", test_response_cache),
+        ("Singleflight", test_singleflight),
+        ("OpenAI Stub Server", test_openai_stub),
+        ("Circuit Breaker", test_circuit_breaker),
+        ("Query Router", test_query_router),
+        ("Keyword Index", test_keyword_index),
+        ("Language Detection", test_language_detection),
+        ("Knowledge Search", test_knowledge_search),
+        ("Knowledge Retrieval", test_knowledge_retrieval),
+        ("Knowledge Pack", test_knowledge_pack),
+        ("Knowledge FTS", test_knowledge_fts),
+        ("DB Connection Manager", test_db_manager),
+        ("Chat Writer", test_chat_writer),
+        ("Chat History Pagination", test_chat_history_pagination),
+        ("Chat Schema Migration", test_chat_schema_migration),
+        ("Migrations", test_migrations),
+        ("Cached Resources", test_cached_resources),
+        ("PostgreSQL Backend", test_postgres_backend),
+        ("Chat Export", test_chat_export),
+        ("Chat Search", test_chat_search),
+        ("Chat Archive", test_chat_archive),
+        ("Response Deduplication", test_response_dedup),
+        ("User Import", test_user_import),
+        ("Password Hashing", test_password_hashing),
         ("Configuration", test_config)
     ]
     
@@ -0,0 +1,223 @@
+"""
+User Import Module
+Bulk account provisioning, for health offices onboarding a whole district of
+cadres and parents at once. The input (CSV with a header row, or JSONL) is
+read as a stream and validated row by row. Passwords are hashed in a pool
+of worker processes, and accounts are upserted by username with executemany,
+one transaction per batch. Rejected rows go to a CSV error report with their
+line number, so a file can be fixed and imported again
+
+Usage:
+    python user_import.py accounts.csv [--format csv|jsonl] [--skip-existing] [--batch-size 1000] [--workers 4]
+                          [--rounds 12] [--report errors.csv]
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from db import get_database
+from migrations import apply_migrations
+from password_hashing import PASSWORD_HASH_ROUNDS, hash_password
+
+# Import config from env (with defaults)
+USER_IMPORT_BATCH_SIZE = int(os.getenv("USER_IMPORT_BATCH_SIZE", "1000"))  # accounts per transaction
+# Hashing processes; 0 hashes on the importing process
+USER_IMPORT_WORKERS = int(os.getenv("USER_IMPORT_WORKERS", str(os.cpu_count() or 1)))
+# bcrypt cost for imported passwords; at the full cost 100k accounts take about 7 CPU-hours, so a
+# district onboarding may use a lower one and let each account upgrade at its first login
+USER_IMPORT_HASH_ROUNDS = int(os.getenv("USER_IMPORT_HASH_ROUNDS", str(PASSWORD_HASH_ROUNDS)))
+
+# SQLITE_MAX_VARIABLE_NUMBER before SQLite 3.32; larger IN lists fail with "too many SQL variables"
+MAX_SQL_VARIABLES = 999
+
+FIELDS = ("username", "password", "email", "name")
+USERNAME_PATTERN = re.compile(r"^\S{1,64}$")
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# Existing accounts keep their email and name when the file leaves them empty
+UPSERT_SQL = '''
+    INSERT INTO users (username, password, email, name) VALUES (?, ?, ?, ?)
+    ON CONFLICT (username) DO UPDATE SET
+        password = excluded.password,
+        email = COALESCE(excluded.email, users.email),
+        name = COALESCE(excluded.name, users.name)
+'''
+INSERT_NEW_SQL = '''
+    INSERT INTO users (username, password, email, name) VALUES (?, ?, ?, ?)
+    ON CONFLICT (username) DO NOTHING
+'''
+
+def detect_format(path):
+    """csv or jsonl, from the file extension"""
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+def iter_records(path, file_format=None):
+    """Yield (line number, record dict or None, parse error or None) without loading the whole file"""
+    file_format = file_format or detect_format(path)
+    with open(path, newline="", encoding="utf-8-sig") as source:
+        if file_format == "jsonl":
+            for line_number, line in enumerate(source, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f"invalid JSON: {e}"
+                    continue
+                if isinstance(record, dict):
+                    yield line_number, record, None
+                else:
+                    yield line_number, None, "expected a JSON object"
+        else:
+            reader = csv.DictReader(source)
+            for record in reader:
+                # Line of the record's last physical line (the header is line 1)
+                yield reader.line_num, record, None
+
+def validate_record(record):
+    """Return ((username, password, email, name), None) or (None, error message)"""
+    values = {field: str(record.get(field) or "").strip() for field in FIELDS}
+    # Passwords are taken as given; only a password that is all whitespace counts as missing
+    values["password"] = str(record.get("password") or "")
+    if not values["username"]:
+        return None, "username is required"
+    if not USERNAME_PATTERN.match(values["username"]):
+        return None, "username must be at most 64 characters without spaces"
+    if not values["password"].strip():
+        return None, "password is required"
+    if values["email"] and not EMAIL_PATTERN.match(values["email"]):
+        return None, "email is not valid"
+    return (values["username"], values["password"], values["email"] or None, values["name"] or None), None
+
+class _ErrorReport:
+    """CSV of rejected rows, opened on the first error"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def add(self, line_number, username, error):
+        if self._file is None:
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["line", "username", "error"])
+        self._writer.writerow([line_number, username or "", error])
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+def _write_batch(database, batch, hashes, skip_existing, report):
+    """Upsert one batch in one transaction; returns (inserted, updated)"""
+    rows = [(username, hashed, email, name) for (_, (username, _, email, name)), hashed in zip(batch, hashes)]
+    usernames = [row[0] for row in rows]
+    try:
+        with database.transaction() as conn:
+            existing = set()
+            for offset in range(0, len(usernames), MAX_SQL_VARIABLES):
+                chunk = usernames[offset:offset + MAX_SQL_VARIABLES]
+                existing.update(row[0] for row in conn.execute(
+                    f"SELECT username FROM users WHERE username IN ({', '.join('?' * len(chunk))})",
+                    chunk).fetchall())
+            conn.executemany(INSERT_NEW_SQL if skip_existing else UPSERT_SQL, rows)
+        return len(rows) - len(existing), 0 if skip_existing else len(existing)
+    except Exception as e:
+        if len(rows) == 1:
+            report.add(batch[0][0], usernames[0], f"database error: {e}")
+            return 0, 0
+    # Something in the batch was rejected: retry row by row so only the bad rows are reported
+    inserted = updated = 0
+    for item, hashed in zip(batch, hashes):
+        row_inserted, row_updated = _write_batch(database, [item], [hashed], skip_existing, report)
+        inserted += row_inserted
+        updated += row_updated
+    return inserted, updated
+
+def import_users(path, database=None, file_format=None, skip_existing=False, batch_size=USER_IMPORT_BATCH_SIZE,
+                 workers=USER_IMPORT_WORKERS, report_path=None, rounds=USER_IMPORT_HASH_ROUNDS):
+    """Create or update the accounts in a CSV/JSONL file; returns a summary
+
+    Existing usernames get the file's password (and email and name when
+    given) unless skip_existing is set, in which case they are left alone.
+    A username repeated in the file is imported once and the later rows are
+    reported. Passwords are hashed with bcrypt at the given cost; a cost
+    below PASSWORD_HASH_ROUNDS is upgraded when each user first logs in.
+    """
+    database = database or get_database()
+    report = _ErrorReport(report_path or f"{os.path.splitext(path)[0]}.errors.csv")
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    summary = {"rows": 0, "inserted": 0, "updated": 0, "skipped": 0}
+    seen = set()
+    start = time.monotonic()
+
+    def flush(batch):
+        passwords = [row[1] for _, row in batch]
+        hash_with_cost = partial(hash_password, rounds=rounds)
+        # Hashing is the expensive part of an import; spread it over the worker processes
+        if pool:
+            hashes = list(pool.map(hash_with_cost, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+        else:
+            hashes = [hash_with_cost(password) for password in passwords]
+        errors = report.count
+        inserted, updated = _write_batch(database, batch, hashes, skip_existing, report)
+        summary["inserted"] += inserted
+        summary["updated"] += updated
+        # Existing accounts left alone under skip_existing
+        summary["skipped"] += len(batch) - inserted - updated - (report.count - errors)
+
+    try:
+        batch = []
+        for line_number, record, error in iter_records(path, file_format):
+            summary["rows"] += 1
+            row = None
+            if error is None:
+                row, error = validate_record(record)
+            if error is None and row[0] in seen:
+                error = "username appears earlier in the file"
+            if error is not None:
+                report.add(line_number, (record or {}).get("username"), error)
+                continue
+            seen.add(row[0])
+            batch.append((line_number, row))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        report.close()
+        if pool:
+            pool.shutdown()
+
+    summary["errors"] = report.count
+    summary["report"] = report.path if report.count else None
+    summary["seconds"] = round(time.monotonic() - start, 2)
+    print(f"✅ Imported {summary['inserted']} new and {summary['updated']} updated accounts from {summary['rows']} rows "
+          f"in {summary['seconds']}s ({summary['errors']} errors)")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or update user accounts from a CSV or JSONL file")
+    parser.add_argument("path", help="CSV with a header row (username,password,email,name) or JSONL")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Default: from the file extension")
+    parser.add_argument("--skip-existing", action="store_true", help="Leave accounts that already exist unchanged")
+    parser.add_argument("--batch-size", type=int, default=USER_IMPORT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=USER_IMPORT_WORKERS, help="Password hashing processes")
+    parser.add_argument("--rounds", type=int, default=USER_IMPORT_HASH_ROUNDS, help="bcrypt cost of the imported passwords")
+    parser.add_argument("--report", help="Error report path (default: <input>.errors.csv)")
+    args = parser.parse_args()
+    apply_migrations()
+    import_users(args.path, file_format=args.format, skip_existing=args.skip_existing, batch_size=args.batch_size,
+                 workers=args.workers, report_path=args.report, rounds=args.rounds)
+
+if __name__ == "__main__":
+    main()